@@ -0,0 +1,167 @@
+"""
+time and peak memory of the Kapi methods, fully offline
+
+the http layer of krakenex (krakenex.API._query) is replaced by a function
+decoding a payload generated by payloads.py, everything else runs as in a
+real call: parameters, nonce and signature, rate counters, json decoding and
+parsing
+
+    python benchmarks/bench_endpoints.py
+    python benchmarks/bench_endpoints.py --scales 0.25 1 4 --save baseline.json
+    python benchmarks/bench_endpoints.py --baseline baseline.json
+    python benchmarks/bench_endpoints.py --output numpy records
+
+the scales multiply the sizes of payloads.SIZES (720 candles, 1000 trades,
+500 levels, pages of 50 orders and trades)
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import krakenex  # noqa: E402
+
+import payloads  # noqa: E402
+from kraken_api import Kapi  # noqa: E402
+
+# the calls benchmarked, payloads.PAYLOADS has the payload of each one
+CALLS = {
+    "ohlc": lambda kapi: kapi.ohlc(payloads.PAIR),
+    "trades": lambda kapi: kapi.trades(payloads.PAIR),
+    "depth": lambda kapi: kapi.depth(payloads.PAIR, count=500),
+    "closed_orders": lambda kapi: kapi.closed_orders(),
+    "trades_history": lambda kapi: kapi.trades_history(),
+}
+
+# a result slower than the baseline by more than this ratio is reported
+REGRESSION = 1.2
+
+
+def make_kapi(output="pandas"):
+    kapi = Kapi(
+        key="key",
+        secret="c2VjcmV0",
+        normalize_pairs=False,
+        output=output)
+    # the benchmark measures the client, not the waits of the rate limits
+    kapi._limiter.max_api_counter = float("inf")
+    kapi._limiter.max_rate_count = float("inf")
+    return kapi
+
+
+def measure(name, size, repeat, output="pandas"):
+    """
+    :return: a dict with the median and the best time per call in
+             milliseconds and the peak memory of one call in KiB
+    """
+    encoded = json.dumps(
+        {"error": [], "result": payloads.PAYLOADS[name](size)})
+
+    def query(self, urlpath, data, headers=None, timeout=None):
+        return json.loads(encoded)
+
+    kapi = make_kapi(output)
+    call = CALLS[name]
+
+    with mock.patch.object(krakenex.API, "_query", query):
+        # the first call pays the imports and the caches
+        call(kapi)
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call(kapi)
+            times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        call(kapi)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    kapi.close()
+
+    return {
+        "size": size,
+        "median_ms": 1000 * statistics.median(times),
+        "best_ms": 1000 * min(times),
+        "peak_kib": peak / 1024,
+    }
+
+
+def run(names, scales, repeat, outputs=("pandas",)):
+    results = {}
+    for output in outputs:
+        # the keys of the default output stay the ones of the saved baselines
+        suffix = "" if output == "pandas" else f" {output}"
+        for name in names:
+            for scale in scales:
+                size = max(1, int(payloads.SIZES[name] * scale))
+                results[f"{name}[{size}]{suffix}"] = measure(
+                    name, size, repeat, output)
+    return results
+
+
+def report(results, baseline=None):
+    header = f"{'call':<32}{'median ms':>12}{'best ms':>12}{'peak KiB':>12}"
+    if baseline is not None:
+        header += f"{'vs baseline':>14}"
+    print(header)
+
+    regressions = []
+    for key, result in results.items():
+        line = (f"{key:<32}{result['median_ms']:>12.3f}"
+                f"{result['best_ms']:>12.3f}{result['peak_kib']:>12.1f}")
+
+        if baseline is not None and key in baseline:
+            ratio = result["median_ms"] / baseline[key]["median_ms"]
+            line += f"{ratio:>13.2f}x"
+            if ratio > REGRESSION:
+                regressions.append(key)
+                line += "  slower"
+        print(line)
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--calls", nargs="+", default=list(CALLS), choices=list(CALLS))
+    parser.add_argument(
+        "--scales", nargs="+", type=float, default=[0.1, 1, 4],
+        help="multipliers of the realistic payload sizes")
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="calls timed per measure")
+    parser.add_argument(
+        "--output", nargs="+", default=["pandas"],
+        choices=["pandas", "numpy", "records", "raw"],
+        help="the forms of the results to measure, see Kapi(output=...)")
+    parser.add_argument(
+        "--baseline", help="a json file saved by --save to compare with")
+    parser.add_argument("--save", help="save the results to this json file")
+    args = parser.parse_args(argv)
+
+    results = run(args.calls, args.scales, args.repeat, args.output)
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = report(results, baseline)
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
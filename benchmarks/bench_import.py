@@ -0,0 +1,105 @@
+"""
+time to import the package in a fresh interpreter, and the heavy modules
+each import loads
+
+every statement runs in a new python process so nothing is already in
+sys.modules, the time is measured inside the process around the statement
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --repeat 20
+
+the exit code is 1 if a statement loads a module it must not load (pandas for
+a client only sending orders) or is slower than its budget
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# the heavy modules watched in sys.modules after each statement
+HEAVY = ["pandas", "numpy", "aiohttp", "websockets", "pyarrow", "requests"]
+
+# statement -> (modules it must not load, budget in milliseconds), the
+# budgets are loose, they catch a heavy import coming back, not the noise
+STATEMENTS = {
+    "import kraken_api": (HEAVY, 50),
+    "from kraken_api import Kapi": (["pandas", "numpy", "aiohttp"], 400),
+    "from kraken_api import Kapi; Kapi()": (
+        ["pandas", "numpy", "aiohttp"], 400),
+    "from kraken_api import AsyncKapi": (["pandas", "numpy"], 1000),
+}
+
+_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "ms": 1000 * elapsed,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure(statement, repeat):
+    """
+    :return: a dict with the median and the best time of the statement in
+             milliseconds and the heavy modules it loaded
+    """
+    script = _SCRIPT.format(statement=statement, heavy=HEAVY)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [ROOT] + [path for path in [env.get("PYTHONPATH")] if path])
+
+    times = []
+    loaded = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True).stdout
+        result = json.loads(output)
+        times.append(result["ms"])
+        loaded = result["loaded"]
+
+    return {
+        "median_ms": statistics.median(times),
+        "best_ms": min(times),
+        "loaded": loaded,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="processes per statement")
+    args = parser.parse_args(argv)
+
+    print(f"{'statement':<44}{'median ms':>12}{'best ms':>12}  loaded")
+
+    failures = []
+    for statement, (forbidden, budget) in STATEMENTS.items():
+        result = measure(statement, args.repeat)
+        line = (f"{statement:<44}{result['median_ms']:>12.1f}"
+                f"{result['best_ms']:>12.1f}  {', '.join(result['loaded'])}")
+
+        unexpected = [name for name in result["loaded"] if name in forbidden]
+        if unexpected:
+            failures.append(statement)
+            line += f"  loads {', '.join(unexpected)}"
+        if result["median_ms"] > budget:
+            failures.append(statement)
+            line += f"  over {budget} ms"
+        print(line)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
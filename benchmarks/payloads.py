@@ -0,0 +1,151 @@
+import random
+
+# payloads with the shape and the value formats of real kraken answers
+# (strings for the prices and volumes, float timestamps, txids of the form
+# OQCLML-BW3P3-BUCMWZ), generated from a seed so every run parses the same
+# data
+
+PAIR = "XXBTZEUR"
+
+# the sizes kraken returns by default
+SIZES = {
+    "ohlc": 720,
+    "trades": 1000,
+    "depth": 500,
+    "closed_orders": 50,
+    "trades_history": 50,
+}
+
+_START = 1650000000
+
+
+def _txid(rng):
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+    parts = [6, 5, 6]
+    return "-".join(
+        "".join(rng.choice(letters) for _ in range(size)) for size in parts)
+
+
+def _price(rng, center=30000.):
+    return f"{center * (1 + rng.uniform(-0.01, 0.01)):.1f}"
+
+
+def _volume(rng):
+    return f"{rng.uniform(0.0001, 2):.8f}"
+
+
+def ohlc(size, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for index in range(size):
+        open_, close = _price(rng), _price(rng)
+        rows.append([
+            _START + 60 * index,
+            open_,
+            max(open_, close),
+            min(open_, close),
+            close,
+            _price(rng),
+            _volume(rng),
+            rng.randint(1, 200),
+        ])
+    return {PAIR: rows, "last": _START + 60 * (size - 1)}
+
+
+def trades(size, seed=0):
+    rng = random.Random(seed)
+    rows = [
+        [
+            _price(rng),
+            _volume(rng),
+            _START + index * 0.731,
+            rng.choice("bs"),
+            rng.choice("ml"),
+            "",
+            index,
+        ]
+        for index in range(size)]
+    return {PAIR: rows, "last": str(int((_START + size) * 1e9))}
+
+
+def depth(size, seed=0):
+    rng = random.Random(seed)
+    asks = [[f"{30000 + 0.1 * (index + 1):.1f}", _volume(rng),
+             _START + rng.randint(0, 600)] for index in range(size)]
+    bids = [[f"{30000 - 0.1 * index:.1f}", _volume(rng),
+             _START + rng.randint(0, 600)] for index in range(size)]
+    # kraken sorts the levels by price, the parser must not rely on it
+    rng.shuffle(asks)
+    rng.shuffle(bids)
+    return {PAIR: {"asks": asks, "bids": bids}}
+
+
+def closed_orders(size, seed=0):
+    rng = random.Random(seed)
+    closed = {}
+    for index in range(size):
+        type_ = rng.choice(["buy", "sell"])
+        price = _price(rng)
+        volume = _volume(rng)
+        closed[_txid(rng)] = {
+            "refid": None,
+            "userref": rng.randint(0, 1000),
+            "status": rng.choice(["closed", "canceled"]),
+            "reason": rng.choice([None, "User requested"]),
+            "opentm": _START + index * 17.5,
+            "closetm": _START + index * 17.5 + 3.2,
+            "starttm": 0,
+            "expiretm": 0,
+            "descr": {
+                "pair": "XBTEUR",
+                "type": type_,
+                "ordertype": "limit",
+                "price": price,
+                "price2": "0",
+                "leverage": "none",
+                "order": f"{type_} {volume} XBTEUR @ limit {price}",
+                "close": "",
+            },
+            "vol": volume,
+            "vol_exec": volume,
+            "cost": f"{float(price) * float(volume):.5f}",
+            "fee": "0.00000",
+            "price": price,
+            "stopprice": "0.00000",
+            "limitprice": "0.00000",
+            "misc": "",
+            "oflags": "fciq",
+        }
+    return {"closed": closed, "count": 10 * size}
+
+
+def trades_history(size, seed=0):
+    rng = random.Random(seed)
+    history = {}
+    for index in range(size):
+        price = _price(rng)
+        volume = _volume(rng)
+        history[_txid(rng)] = {
+            "ordertxid": _txid(rng),
+            "postxid": _txid(rng),
+            "pair": PAIR,
+            "time": _START + index * 41.3,
+            "type": rng.choice(["buy", "sell"]),
+            "ordertype": rng.choice(["limit", "market"]),
+            "price": price,
+            "cost": f"{float(price) * float(volume):.5f}",
+            "fee": f"{float(price) * float(volume) * 0.0026:.5f}",
+            "vol": volume,
+            "margin": "0.00000",
+            "misc": "",
+        }
+    return {"trades": history, "count": 10 * size}
+
+
+PAYLOADS = {
+    "ohlc": ohlc,
+    "trades": trades,
+    "depth": depth,
+    "closed_orders": closed_orders,
+    "trades_history": trades_history,
+}
@@ -1,3 +1,37 @@
-from .api import Kapi
+# the names of the package are imported at their first use, "import
+# kraken_api" loads nothing heavy and "from kraken_api import Kapi" does not
+# load pandas, numpy or aiohttp until a frame is built
+_EXPORTS = {
+    "Kapi": ".api",
+    "AsyncKapi": ".async_api",
+    "FileNonce": ".transport",
+    "HttpConfig": ".transport",
+    "MarketStore": ".store",
+    "MarketStream": ".stream",
+    "MarketSync": ".sync",
+    "Metrics": ".metrics",
+    "OrderBook": ".orderbook",
+    "PairRegistry": ".registry",
+    "RateLimitExceeded": ".limiter",
+    "RecordingTransport": ".replay",
+    "ReplayTransport": ".replay",
+    "collect": ".frames",
+}
 
-__all__ = ["Kapi"]
\ No newline at end of file
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    import importlib
+
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    # cached in the module, the next lookups do not come here
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
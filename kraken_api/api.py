@@ -1,6 +1,16 @@
-import krakenex
-import pandas as pd
+import contextlib
+import contextvars
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from . import endpoints
+from .flight import SingleFlight, call_key
+from .frames import OUTPUTS, build_frame, collect
+from .limiter import PRIORITIES, RateLimiter
+from .metrics import count_rows, error_codes
+from .registry import PairRegistry
+from .transport import ThreadLocalAPI
 
 # documentation for:
 # - krakenex: https://python3-krakenex.readthedocs.io/en/stable/
@@ -14,7 +24,18 @@ class Kapi:
             test_session=True,
             account_type="starter",
             key="",
-            secret=""):
+            secret="",
+            exact_decimals=False,
+            blocking=True,
+            http_config=None,
+            normalize_pairs=True,
+            coalesce=False,
+            nonce=None,
+            local_checks=None,
+            transport=None,
+            metrics=None,
+            reserves=None,
+            output="pandas"):
         """
         in fact all functions work in the same way, if the Kapi
         object is not live, each function will make a call to
@@ -24,6 +45,45 @@ class Kapi:
         :param test_session:
         :param key: the key used for kraken authentication
         :param secret: the secret used for kraken authentication
+        :param exact_decimals: if True prices and volumes in the returned
+                               frames are Decimal objects instead of float64
+        :param blocking: if True the queries wait until they fit in the rate
+                         limits of the account, else they raise
+                         RateLimitExceeded
+        :param http_config: a HttpConfig with the pool size, the timeouts
+                            and the session of the http connections
+        :param normalize_pairs: if True the pairs given to the methods are
+                                replaced by their canonical key ("XBTEUR" by
+                                "XXBTZEUR") using the cached pair registry
+        :param coalesce: if True the identical public queries made at the
+                         same moment by several threads are sent and charged
+                         once, every caller gets the same result object so
+                         the returned frames must not be modified in place
+        :param nonce: the source of the nonces of the private queries, an
+                      object with a next() method, by default a counter of
+                      this instance, a FileNonce lets several processes use
+                      the same API key
+        :param local_checks: None to send the orders as they are, "check" to
+                             refuse locally the orders breaking the rules of
+                             their pair (minimum volume, tick, lot decimals,
+                             leverage), "round" to round their prices and
+                             volumes to the pair before checking them
+        :param transport: the object sending the queries, by default a
+                          ThreadLocalAPI built from key, secret, nonce and
+                          http_config, a RecordingTransport saves the session
+                          and a ReplayTransport serves it again offline
+        :param metrics: a Metrics collecting the latency (rate limit wait,
+                        network, parsing), the sizes and the errors of each
+                        query, see Kapi.metrics
+        :param reserves: a dict priority -> part of the api counter the
+                         queries of this class leave free for the more
+                         urgent ones, to change the defaults of
+                         limiter.RESERVES, see Kapi.priority
+        :param output: the form of the results, "pandas" for dataframes,
+                       "numpy" for structured arrays, "records" for lists of
+                       namedtuples, all typed by the same schemas, or "raw"
+                       for the results of kraken as decoded from the json,
+                       see Kapi.output
         """
 
         if account_type not in ["starter", "intermediate", "pro"]:
@@ -34,130 +94,242 @@ class Kapi:
             raise Exception(
                 f"Invalid parameter for test_section: {test_session}")
 
-        self._api = krakenex.API(key, secret)
+        if not isinstance(blocking, bool):
+            raise Exception(f"Invalid parameter for blocking: {blocking}")
+
+        if not isinstance(exact_decimals, bool):
+            raise Exception(
+                f"Invalid parameter for exact_decimals: {exact_decimals}")
+
+        if output not in ["raw"] + OUTPUTS:
+            raise Exception(f"Invalid parameter for output: {output}")
+
+        # each thread gets its own krakenex session, the nonce and the rate
+        # counters are shared so one Kapi can be used by a pool of workers
+        if transport is None:
+            transport = ThreadLocalAPI(
+                key, secret, nonce=nonce, http_config=http_config)
+        self._api = transport
+        self._exact_decimals = exact_decimals
         self._test_session = test_session
         self._account_type = account_type
 
-        self._max_api_counter = {
-            "starter": 15,
-            "intermediate": 20,
-            "pro": 20,
-        }[self._account_type]
-        self._api_call_counter = 0
-
-        self._max_num_orders = {
-            "starter": 60,
-            "intermediate": 80,
-            "pro": 225,
-        }[self._account_type]
-        self._order_counter = 0
-
-        self._max_rate_count = {
-            "starter": 60,
-            "intermediate": 125,
-            "pro": 180,
-        }[self._account_type]
-        self._order_rate_counter = 0
-
-        self._api_counter_decay = {
-            "starter": 0.33,
-            "intermediate": 0.5,
-            "pro": 1.,
-        }[self._account_type]
-
-        self._ratecount_decay = {
-            "starter": 1.,
-            "intermediate": 2.34,
-            "pro": 3.75,
-        }[self._account_type]
-
-        self._last_pair_used = None
-        self._last_query_time = None
-
-    def _update_counters(self, type_query, pair=None):
-        if type_query not in ["ledge/trade",
-                              "add_order", "other", "cancel_order"]:
-            raise Exception(f"Invalid type query parameter: {type_query}")
-
-        if type_query == ["cancel_order", "add_order"] and pair is None:
+        self._blocking = blocking
+        self._limiter = RateLimiter(self._account_type, reserves)
+        self._priority = contextvars.ContextVar("priority", default=None)
+
+        self._output = output
+        self._output_block = contextvars.ContextVar("output", default=None)
+
+        self._normalize_pairs = normalize_pairs
+        self._pairs = PairRegistry(self)
+
+        self._flights = SingleFlight() if coalesce else None
+
+        if local_checks not in [None, "check", "round"]:
             raise Exception(
-                f"You must provide a pair when adding or cancelling orders")
-
-        if self._last_query_time is None:
-            self._last_query_time = time.time()
-            return
-
-        last_last_time = self._last_query_time
-        self._last_query_time = time.time()
-        delta = self._last_query_time - last_last_time
-
-        self._api_call_counter -= delta * self._api_counter_decay
-        self._order_rate_counter -= delta * self._ratecount_decay
-
-        if type_query in ["add_order", "cancel_order"]:
-            self._order_counter += 1
-
-        if type_query == "ledge/trade":
-            self._api_call_counter += 2
-        elif type_query == "other":
-            self._api_call_counter += 1
-        elif type_query == "add_order":
-            self._order_rate_counter += 1
-        elif type_query == "cancel_order" and pair is not None:
-            if self._last_pair_used is None or self._last_pair_used != pair:
-                self._last_pair_used = pair
-                return
-            else:
-                augment = 0
-                if delta < 5:
-                    augment = 8
-                elif delta < 10:
-                    augment = 6
-                elif delta < 15:
-                    augment = 5
-                elif delta < 45:
-                    augment = 4
-                elif delta < 90:
-                    augment = 2
-                elif delta < 300:
-                    augment = 1
-
-                self._order_rate_counter += augment
-
-    def _public_query(self, method, data=None):
+                f"Invalid parameter for local_checks: {local_checks}")
+
+        self._local_checks = local_checks
+        self._order_validator = None
+
+        self._metrics = metrics
+        if metrics is not None:
+            metrics.track_budget(self._limiter.counters)
+
+    def _update_counters(self, type_query, pair=None, count=1, priority=None):
+        """
+        charge the rate counters before a query, waits until the query fits
+        in the budget of the account
+
+        :param type_query: "ledger/trade", "add_order", "cancel_order" or
+                           "other"
+        :param pair: the pair of the order added or cancelled
+        :param count: the number of orders added or cancelled at once
+        :param priority: the class of the query, one of limiter.PRIORITIES
+        """
+        self._limiter.acquire(
+            type_query, pair, blocking=self._blocking, count=count,
+            priority=priority)
+
+    def _public_query(self, method, data=None, type_query="other", pair=None,
+                      count=1, priority="market"):
         """
 
         :param method: method asked to kraken: Ticker, Assets,...
         :param data: data passed to the method as asset pair
+        :param type_query: the kind of query for the rate counters
+        :param pair: the pair of the order, for the rate counters
+        :param count: the number of orders, for the rate counters
+        :param priority: the class of the query, for the rate counters
         :return: the error else the result wrapped in a dict
         """
-        res = self._api.query_public(method, data)
+        return self._query(
+            self._api.query_public, method, data, type_query, pair, count,
+            priority)
+
+    def _private_query(self, method, data=None, type_query="other", pair=None,
+                       count=1, priority="account"):
+        return self._query(
+            self._api.query_private, method, data, type_query, pair, count,
+            priority)
+
+    def _query(self, query, method, data, type_query, pair, count, priority):
+        if self._metrics is None:
+            self._update_counters(type_query, pair, count, priority)
+            return endpoints.unwrap(query(method, data))
+
+        start = time.perf_counter()
+        self._update_counters(type_query, pair, count, priority)
+        sent = time.perf_counter()
+        self._metrics.observe_wait(method, sent - start)
+
+        try:
+            res = endpoints.unwrap(query(method, data))
+        except Exception as e:
+            self._metrics.observe_network(
+                method, time.perf_counter() - sent,
+                errors=[f"exception:{type(e).__name__}"])
+            raise
+
+        response_size = getattr(self._api, "response_size", None)
+        self._metrics.observe_network(
+            method,
+            time.perf_counter() - sent,
+            response_size() if response_size is not None else None,
+            error_codes(res))
 
-        if res["error"]:
-            return res["error"]
-        else:
-            return {"result": res["result"]}
+        return res
+
+    def _call(self, call, output=None):
+        """
+        send a Call built in the endpoints module and parse its result
+
+        :param call: the Call to send
+        :param output: the form of the result, by default the one of the
+                       enclosing Kapi.output block or of the instance
+        :return: the parsed result, or the error returned by kraken
+        """
+        output = output or self._current_output()
+        if output == "raw":
+            call = endpoints.raw(call)
+
+        if not call.private and self._flights is not None:
+            return self._flights.do(
+                (output, call_key(call)), lambda: self._send(call, output))
 
-    def _private_query(self, method, data=None):
-        res = self._api.query_private(method, data)
+        return self._send(call, output)
 
-        if res["error"]:
-            return res["error"]
+    def _send(self, call, output="pandas"):
+        if call.private:
+            query = self._private_query
         else:
-            return {"result": res["result"]}
+            query = self._public_query
+
+        priority = self._priority.get() or endpoints.call_priority(call)
+        res = query(
+            call.method, call.data, call.type_query, call.pair, call.count,
+            priority)
+        frame_builder = partial(self._frame_builder, output=output)
+        if self._metrics is None or "result" not in res:
+            return endpoints.parse_result(res, call, frame_builder)
+
+        start = time.perf_counter()
+        result = endpoints.parse_result(res, call, frame_builder)
+        self._metrics.observe_parse(
+            call.method, time.perf_counter() - start, count_rows(result))
+
+        return result
+
+    @property
+    def _validator(self):
+        # numpy is only loaded when the first order is checked
+        if self._order_validator is None:
+            from .validation import OrderValidator
+            self._order_validator = OrderValidator(self._pairs)
+        return self._order_validator
+
+    @contextlib.contextmanager
+    def priority(self, priority):
+        """
+        gives a class to all the queries made in the block by the current
+        thread, as a background job marking its polling as backfill:
+
+            with kapi.priority("backfill"):
+                sync.poll()
+
+        by default adding and cancelling orders is "trading", the other
+        private methods are "account", the public ones "market" and the
+        pages of iter_trades_history and iter_closed_orders "backfill"
+
+        :param priority: one of limiter.PRIORITIES
+        """
+        if priority not in PRIORITIES:
+            raise Exception(f"Invalid parameter for priority: {priority}")
+
+        token = self._priority.set(priority)
+        try:
+            yield
+        finally:
+            self._priority.reset(token)
+
+    @contextlib.contextmanager
+    def output(self, output):
+        """
+        gives a form to the results of the methods called in the block, as a
+        latency critical loop skipping pandas:
+
+            with kapi.output("numpy"):
+                book = kapi.depth("XXBTZEUR")
+                best_ask = book["ask_price"][0]
+
+        :param output: "pandas", "numpy", "records" or "raw", see Kapi
+        """
+        if output not in ["raw"] + OUTPUTS:
+            raise Exception(f"Invalid parameter for output: {output}")
+
+        token = self._output_block.set(output)
+        try:
+            yield
+        finally:
+            self._output_block.reset(token)
+
+    def _normalize(self, pair):
+        """
+        :param pair: a pair, a list of pairs or None
+        :return: the canonical keys of the pairs if normalize_pairs is on
+        """
+        if pair is None or not self._normalize_pairs:
+            return pair
+        return self._pairs.normalize(pair)
+
+    def _frame_builder(self, schema, output=None):
+        """
+        :param schema: the schema of the frame to build
+        :param output: the form of the frame, by default the current output
+        :return: an empty FrameBuilder typing the columns as in the schema
+        """
+        return schema.builder(
+            exact=self._exact_decimals, output=output or self._frame_output())
+
+    def _current_output(self):
+        return self._output_block.get() or self._output
+
+    def _frame_output(self):
+        # the results put together by the client from several answers
+        # (add_orders, cancel_orders, the pages of the iterators) have no raw
+        # form, they are dataframes
+        output = self._current_output()
+        return "pandas" if output == "raw" else output
 
     # ===========================================================================
     # these are all the market data methods of the kraken api
 
     def time(self):
-        res = self._public_query("Time")
-        self._update_counters("other")
-        return res
+        return self._call(endpoints.time())
 
     def system_status(self):
-        res = self._public_query("SystemStatus")
-        self._update_counters("other")
-        return res
+        return self._call(endpoints.system_status())
 
     def assets(self, asset=None, aclass="currency"):
         """
@@ -167,36 +339,7 @@ class Kapi:
                       if None is passed then gets all pairs
         :return: a data frame with the information:
         """
-        data = {"aclass": aclass}
-
-        if asset is not None:
-            data["pair"] = output_or_join_list(asset)
-
-        res = self._public_query("Assets", data=data)
-        self._update_counters("other")
-
-        if "result" in res:
-            columns = [
-                "cryptocurrency",
-                "aclass",
-                "altname",
-                "decimals",
-                "display_decimals"]
-            data = pd.DataFrame(columns=columns)
-            data_raw = res["result"]
-            for currency in data_raw:
-                inner_df = pd.DataFrame([[
-                    currency.startswith("X"),
-                    data_raw[currency]["aclass"],
-                    data_raw[currency]["altname"],
-                    data_raw[currency]["decimals"],
-                    data_raw[currency]["display_decimals"],
-                ]], columns=columns)
-                data = pd.concat([data, inner_df], ignore_index=True)
-
-            return data
-        else:
-            return res
+        return self._call(endpoints.assets(asset, aclass))
 
     def asset_pairs(self, pair=None, info="info"):
         """
@@ -205,146 +348,32 @@ class Kapi:
                      if None is provided it defaults to get for all the pairs
         :return: a dataframe with all the info
         """
-
-        if info not in ["info", "leverage", "fees", "margin"]:
-            raise Exception(f"Invalid parameter for info: {info}")
-        data = {"info": info}
-
-        if pair is not None:
-            data["pair"] = output_or_join_list(pair)
-
-        res = self._public_query("AssetPairs", data)
-        self._update_counters("other")
-
-        if "result" in res:
-            columns = [
-                "altname",
-                "wsname",
-                "aclass_base",
-                "base",
-                "aclass_quote",
-                "quote",
-                "lot",
-                "pair_decimals",
-                "lot_decimals",
-                "lot_multiplier",
-                "fees_0",
-                "fees_50000",
-                "fees_100000",
-                "fees_250000",
-                "fees_1000000",
-                "fees_maker_0",
-                "fees_maker_50000",
-                "fees_maker_100000",
-                "fees_maker_250000",
-                "fees_maker_1000000",
-                "fee_volume_currency",
-                "margin_call",
-                "margin_stop",
-                "ordermin"]
-
-            data = pd.DataFrame(columns=columns)
-            data_raw = res["result"]
-
-            for currency in data_raw:
-                inner_df = pd.DataFrame([[
-                    data_raw[currency]["altname"],
-                    data_raw[currency]["wsname"],
-                    data_raw[currency]["aclass_base"],
-                    data_raw[currency]["base"],
-                    data_raw[currency]["aclass_quote"],
-                    data_raw[currency]["quote"],
-                    data_raw[currency]["lot"],
-                    data_raw[currency]["pair_decimals"],
-                    data_raw[currency]["lot_decimals"],
-                    data_raw[currency]["lot_multiplier"],
-                    data_raw[currency]["fees"][0][1],
-                    data_raw[currency]["fees"][1][1],
-                    data_raw[currency]["fees"][2][1],
-                    data_raw[currency]["fees"][3][1],
-                    data_raw[currency]["fees"][4][1],
-                    data_raw[currency]["fees_maker"][0][1],
-                    data_raw[currency]["fees_maker"][1][1],
-                    data_raw[currency]["fees_maker"][2][1],
-                    data_raw[currency]["fees_maker"][3][1],
-                    data_raw[currency]["fees_maker"][4][1],
-                    data_raw[currency]["fee_volume_currency"],
-                    data_raw[currency]["margin_call"],
-                    data_raw[currency]["margin_stop"],
-                    data_raw[currency]["ordermin"],
-                ]], columns=columns)
-                data = pd.concat([data, inner_df], ignore_index=True)
-
-            return data
-        else:
-            return res
+        return self._call(endpoints.asset_pairs(pair, info))
 
     def ticker(self, pair):
         """
 
-        :param pair: a pair to get the current ticker info on
-        :return: a dataframe with the info
-        """
-        res = self._public_query("Ticker", {"pair": pair})
-        self._update_counters("other")
-
-        if "result" in res:
-            columns = [
-                "currency",
-                "ask",
-                "ask_whole_lot_volume",
-                "ask_lot_volume",
-                "bid",
-                "bid_whole_lot_volume",
-                "a_lot_volume",
-                "last_trade_closed_price",
-                "last_trade_closed_lot_volume",
-                "volume_today",
-                "volume_last_24_hours",
-                "wa_volume_price_today",
-                "wa_volume_price_last_24_hours",
-                "number_of_trades_today",
-                "number_of_trades_last_24_hours",
-                "low_today",
-                "low_last_24_hours",
-                "high_today",
-                "high_last_24_hours",
-                "today_opening_price",
-            ]
-
-            data = pd.DataFrame(columns=columns)
-            data_raw = res["result"]
-
-            for currency in data_raw:
-                values = [
-                    currency,
-                    data_raw[currency]["a"][0],
-                    data_raw[currency]["a"][1],
-                    data_raw[currency]["a"][2],
-                    data_raw[currency]["b"][0],
-                    data_raw[currency]["b"][1],
-                    data_raw[currency]["b"][2],
-                    data_raw[currency]["c"][0],
-                    data_raw[currency]["c"][1],
-                    data_raw[currency]["v"][0],
-                    data_raw[currency]["v"][1],
-                    data_raw[currency]["p"][0],
-                    data_raw[currency]["p"][1],
-                    data_raw[currency]["t"][0],
-                    data_raw[currency]["t"][1],
-                    data_raw[currency]["l"][0],
-                    data_raw[currency]["l"][1],
-                    data_raw[currency]["h"][0],
-                    data_raw[currency]["h"][1],
-                    data_raw[currency]["o"],
-                ]
-
-            inner_df = pd.DataFrame([values], columns=columns)
-            data = pd.concat([data, inner_df], ignore_index=True)
-
-            return data
-        else:
-            return res
+        :param pair: a pair, a comma separated string of pairs or a list of
+                     pairs to get the current ticker info on, the pairs are
+                     sent in as few Ticker queries as possible
+        :return: a dataframe with one row per pair, indexed by the canonical
+                 key of the pair
+        """
+        batches = endpoints.ticker_batches(self._normalize(pair))
+        if len(batches) == 1:
+            return self._call(endpoints.ticker(batches[0]))
+
+        results = {}
+        for batch in batches:
+            res = self._call(endpoints.raw(endpoints.ticker(batch)))
+            if "result" not in res:
+                return res
+            results.update(res["result"])
+
+        if self._current_output() == "raw":
+            return {"result": results}
+
+        return endpoints.parse_ticker(results, self._frame_builder)
 
     def ohlc(self, pair, interval=1, since=None):
         """
@@ -354,51 +383,8 @@ class Kapi:
 
         :return: a tuple (a dataframe with the result, time of last commit OHLC)
         """
-        if int(interval) not in [1, 5, 15, 30, 60, 240, 1440, 10080, 21600]:
-            raise Exception(f"Invalid interval for query: {interval}")
-
-        data = {"pair": pair, "interval": interval}
-        if since is not None:
-            data["since"] = since
-
-        res = self._public_query("OHLC", data=data)
-        self._update_counters("other")
-
-        if "result" in res:
-            columns = [
-                "pair",
-                "time",
-                "open",
-                "high",
-                "low",
-                "close",
-                "vwap",
-                "volume",
-                "count"
-            ]
-
-            data = pd.DataFrame(columns=columns)
-            correct_pair = list(res["result"].keys())[0]
-            data_raw = res["result"][correct_pair]
-            last = res["result"]["last"]
-
-            for currency in data_raw:
-                inner_df = pd.DataFrame([[
-                    correct_pair,
-                    currency[0],
-                    currency[1],
-                    currency[2],
-                    currency[3],
-                    currency[4],
-                    currency[5],
-                    currency[6],
-                    currency[7]
-                ]], columns=columns)
-                data = pd.concat([data, inner_df], ignore_index=True)
-
-            return data, last
-        else:
-            return res
+        return self._call(
+            endpoints.ohlc(self._normalize(pair), interval, since))
 
     def depth(self, pair, count=100):
         """
@@ -409,48 +395,84 @@ class Kapi:
 
         :return: a dataframe with the info in
         """
+        return self._call(endpoints.depth(self._normalize(pair), count))
+
+    def order_book(self, pair, count=100):
+        """
+        get the order book for a given pair as an OrderBook, built directly
+        from the answer of kraken without a dataframe
+
+        :param pair: the pair to get the order book on
+        :param count: number of orders to get per side, the book keeps at
+                      most count levels per side when it is updated
+
+        :return: an OrderBook
+        """
+        return self._call(endpoints.order_book(self._normalize(pair), count))
+
+    def depth_many(self, pairs, count=100, max_workers=8, as_frame=False):
+        """
+        get the order books of several pairs, the queries run concurrently
+        on a pool of max_workers threads and each one is charged to the rate
+        counters as a single depth call
+
+        :param pairs: a list of pairs, the names of a same pair ("XBTEUR",
+                      "XBT/EUR") share a single query
+        :param count: number of orders to get per pair
+        :param max_workers: the maximum number of queries running at once
+        :param as_frame: return the books in a single long-format dataframe
+                         (with its "pair" column, one book per pair) instead
+                         of a dict, not available with the raw output
+
+        :return: a tuple (books, errors), books is a dict pair -> dataframe
+                 (or a dataframe if as_frame), errors a dict pair -> the
+                 error of kraken or the exception raised for that pair, the
+                 pairs as they were given
+        """
         if not 1 <= count <= 500:
             raise Exception(
                 f"Invalid count parameter, count must be in the invterval [1, 500], count provided: {count}")
 
-        data = {"pair": pair, "count": count}
-
-        res = self._public_query("Depth", data=data)
-        self._update_counters("other")
-
-        if "result" in res:
-            columns = [
-                "pair",
-                "time",
-                "ask_price",
-                "ask_volume",
-                "bid_price",
-                "bid_volume"
-            ]
-
-            data = pd.DataFrame(columns=columns)
-            data_raw = res["result"][pair]
-            asks = data_raw["asks"]
-            bids = data_raw["bids"]
-
-            asks.sort(key=lambda x: x[2])
-            bids.sort(key=lambda x: x[2])
-
-            for index in range(len(asks)):
-                values = [
-                    pair,
-                    asks[index][2],
-                    asks[index][0],
-                    asks[index][1],
-                    bids[index][0],
-                    bids[index][1],
-                ]
-                inner_df = pd.DataFrame([values], columns=columns)
-                data = pd.concat([data, inner_df], ignore_index=True)
-
-            return data
-        else:
-            return res
+        if max_workers < 1:
+            raise Exception(
+                f"Invalid parameter for max_workers: {max_workers}")
+
+        if as_frame and self._current_output() == "raw":
+            raise Exception("as_frame needs an output other than raw")
+
+        books = {}
+        errors = {}
+        names = {name: self._normalize(name) for name in pairs}
+        pairs = list(dict.fromkeys(names.values()))
+        if not pairs:
+            return (collect([]) if as_frame else books), errors
+
+        with ThreadPoolExecutor(
+                max_workers=min(max_workers, len(pairs))) as executor:
+            # each query runs in a copy of the context of the caller so the
+            # output and priority blocks apply to it
+            futures = {
+                pair: executor.submit(
+                    contextvars.copy_context().run, self.depth, pair, count)
+                for pair in pairs}
+
+            for pair, future in futures.items():
+                try:
+                    res = future.result()
+                except Exception as e:
+                    errors[pair] = e
+                    continue
+
+                if endpoints.is_error(res):
+                    errors[pair] = res
+                else:
+                    books[pair] = res
+
+        errors = endpoints.by_name(names, errors)
+        if as_frame:
+            return collect(books.values()), errors
+
+        return endpoints.by_name(names, books), errors
 
     def trades(self, pair, since=None):
         """
@@ -459,48 +481,7 @@ class Kapi:
         :param pair: the pair to get the trades on
         :param since: return the trades since the given timestamp
         """
-
-        data = {"pair": pair}
-        if since is not None:
-            data["since"] = since
-
-        res = self._public_query("Trades", data=data)
-        self._update_counters("other")
-
-        if "result" in res:
-            columns = [
-                "pair",
-                "time",
-                "volume",
-                "price",
-                "is_sell",
-                "is_buy",
-                "market_limit",
-                "miscellaneous",
-            ]
-
-            data = pd.DataFrame(columns=columns)
-            data_raw = res["result"][pair]
-            last = res["result"]["last"]
-
-            for li in data_raw:
-                values = [
-                    pair,
-                    li[2],
-                    li[1],
-                    li[0],
-                    "s" in li,
-                    "b" in li,
-                    li[4],
-                    li[5]
-                ]
-
-                inner_df = pd.DataFrame([values], columns=columns)
-                data = pd.concat([data, inner_df], ignore_index=True)
-
-            return data, last
-        else:
-            return res
+        return self._call(endpoints.trades(self._normalize(pair), since))
 
     def spread(self, pair, since=None):
         """
@@ -510,40 +491,7 @@ class Kapi:
 
         :return: a tuple(a dataframe wit the info on, the time of the last item)
         """
-
-        data = {"pair": pair}
-        if since is not None:
-            data["since"] = since
-
-        res = self._public_query("Spread", data=data)
-        self._update_counters("other")
-
-        if "result" in res:
-            columns = [
-                "pair",
-                "time",
-                "bid",
-                "ask",
-            ]
-
-            data = pd.DataFrame(columns=columns)
-            data_raw = res["result"][pair]
-            last = res["result"]["last"]
-
-            for li in data_raw:
-                values = [
-                    pair,
-                    li[0],
-                    li[1],
-                    li[2],
-                ]
-
-                inner_df = pd.DataFrame([values], columns=columns)
-                data = pd.concat([data, inner_df], ignore_index=True)
-
-            return data, last
-        else:
-            return res
+        return self._call(endpoints.spread(self._normalize(pair), since))
 
     # ==========================================================================
     # query user data
@@ -554,28 +502,7 @@ class Kapi:
         get the balance of the account in a data frame
         :return: a dataframe
         """
-        res = self._private_query("Balance")
-        self._update_counters("other")
-
-        if "result" in res:
-            columns = [
-                "currency",
-                "amount",
-            ]
-
-            data = pd.DataFrame(columns=columns)
-            data_raw = res["result"]
-
-            for currency in data_raw:
-                inner_df = pd.DataFrame([[
-                    currency,
-                    data_raw[currency]
-                ]], columns=columns)
-                data = pd.concat([data, inner_df], ignore_index=True)
-
-            return data
-        else:
-            return res
+        return self._call(endpoints.balance())
 
     def trade_balance(self, asset="ZEUR"):
         """
@@ -583,46 +510,7 @@ class Kapi:
         :param asset: the asset to get the trade info on
         :return: a dataframe
         """
-
-        # the default is "ZUSD" but me I'm more interested in "ZEUR"
-        res = self._private_query("TradeBalance", data={"asset": asset})
-        self._update_counters("other")
-
-        if "result" in res:
-            columns = [
-                "eb",
-                "tb",
-                "m",
-                "n",
-                "c",
-                "v",
-                "e",
-                "mf",
-            ]
-
-            column_names = [
-                "equivalent_balance",
-                "trade_balance",
-                "margin",
-                "unrealized_profit_loss",
-                "cost_basis_open",
-                "current_floating_valuation_open",
-                "equity",
-                "free_margin",
-            ]
-
-            data = pd.DataFrame(columns=column_names)
-            data_raw = res["result"]
-
-            to_append = [data_raw[column] for column in columns]
-            inner_df = pd.DataFrame([
-                to_append
-            ], columns=column_names)
-            data = pd.concat([data, inner_df], ignore_index=True)
-
-            return data
-        else:
-            return res
+        return self._call(endpoints.trade_balance(asset))
 
     def open_orders(self, trades=False, userref=None):
         """
@@ -633,81 +521,7 @@ class Kapi:
 
         :return: a dataframe of transactions
         """
-        if trades not in [False, True] or not is_none_or_type(userref, int):
-            raise Exception(f"Invalid parameters : {trades}, {userref}")
-
-        data = {"trades": str(trades).lower()}
-        if userref is not None:
-            data["userref"] = userref
-
-        res = self._private_query("OpenOrders", data=data)
-        self._update_counters("other")
-
-        if "result" in res:
-            columns = [
-                "order_id",
-                "refid",
-                "userref",
-                "status",
-                "opentm",
-                "starttm",
-                "expiretim",
-                "pair",
-                "type",
-                "order_type",
-                "price",
-                "price_2",
-                "leverage",
-                "order",
-                "close",
-                "volume",
-                "volume_executed",
-                "cost",
-                "fee",
-                "price",
-                "stop_price",
-                "limit_price",
-                "misc",
-                "oflags"
-            ]
-
-            data = pd.DataFrame(columns=columns)
-            data_raw = res["result"]["open"]
-
-            for order in data_raw:
-                values = [
-                    order,
-                    data_raw[order]["refid"],
-                    data_raw[order]["userref"],
-                    data_raw[order]["status"],
-                    data_raw[order]["opentm"],
-                    data_raw[order]["starttm"],
-                    data_raw[order]["expiretm"],
-                    data_raw[order]["descr"]["pair"],
-                    data_raw[order]["descr"]["type"],
-                    data_raw[order]["descr"]["ordertype"],
-                    data_raw[order]["descr"]["price"],
-                    data_raw[order]["descr"]["price2"],
-                    data_raw[order]["descr"]["leverage"],
-                    data_raw[order]["descr"]["order"],
-                    data_raw[order]["descr"]["close"],
-                    data_raw[order]["vol"],
-                    data_raw[order]["vol_exec"],
-                    data_raw[order]["cost"],
-                    data_raw[order]["fee"],
-                    data_raw[order]["price"],
-                    data_raw[order]["stopprice"],
-                    data_raw[order]["limitprice"],
-                    data_raw[order]["misc"],
-                    data_raw[order]["oflags"],
-                ]
-
-                inner_df = pd.DataFrame([values], columns=columns)
-                data = pd.concat([data, inner_df], ignore_index=True)
-
-            return data
-        else:
-            return res
+        return self._call(endpoints.open_orders(trades, userref))
 
     def closed_orders(
             self,
@@ -727,96 +541,8 @@ class Kapi:
         :param ofs: result offset for pagination
         :param: closetime: wich time to use to search ("both", "open", "close")
         """
-        if (trades not in [False, True] or
-                not is_none_or_type(userref, int) or
-                not is_none_or_type(start, int) or
-                not is_none_or_type(end, int) or
-                not is_none_or_type(ofs, int) or
-                closetime not in ["both", "open", "close"]):
-            raise Exception(
-                f"Invalid parameter, please verify: {trades}, {userref}, {start}, {end}, {ofs}, {closetime}")
-
-        data = {"trades": str(trades).lower(), "closetime": closetime}
-
-        if userref is not None:
-            data["userref"] = userref
-        if start is not None:
-            data["start"] = start
-        if end is not None:
-            data["end"] = start
-        if ofs is not None:
-            data["ofs"] = ofs
-
-        res = self._private_query("ClosedOrders", data=data)
-        self._update_counters("other")
-
-        if "result" in res:
-            columns = [
-                "order_id",
-                "refid",
-                "userref",
-                "reason",
-                "status",
-                "opentm",
-                "starttm",
-                "expiretim",
-                "pair",
-                "type",
-                "order_type",
-                "price",
-                "price_2",
-                "leverage",
-                "order",
-                "close",
-                "volume",
-                "volume_executed",
-                "cost",
-                "fee",
-                "price",
-                "stop_price",
-                "limit_price",
-                "misc",
-                "oflags"
-            ]
-
-            data = pd.DataFrame(columns=columns)
-            data_raw = res["result"]["closed"]
-
-            for order in data_raw:
-                values = [
-                    order,
-                    data_raw[order]["refid"],
-                    data_raw[order]["userref"],
-                    data_raw[order]["status"],
-                    data_raw[order]["reason"],
-                    data_raw[order]["opentm"],
-                    data_raw[order]["starttm"],
-                    data_raw[order]["expiretm"],
-                    data_raw[order]["descr"]["pair"],
-                    data_raw[order]["descr"]["type"],
-                    data_raw[order]["descr"]["ordertype"],
-                    data_raw[order]["descr"]["price"],
-                    data_raw[order]["descr"]["price2"],
-                    data_raw[order]["descr"]["leverage"],
-                    data_raw[order]["descr"]["order"],
-                    data_raw[order]["descr"]["close"],
-                    data_raw[order]["vol"],
-                    data_raw[order]["vol_exec"],
-                    data_raw[order]["cost"],
-                    data_raw[order]["fee"],
-                    data_raw[order]["price"],
-                    data_raw[order]["stopprice"],
-                    data_raw[order]["limitprice"],
-                    data_raw[order]["misc"],
-                    data_raw[order]["oflags"],
-                ]
-
-                inner_df = pd.DataFrame([values], columns=columns)
-                data = pd.concat([data, inner_df], ignore_index=True)
-
-            return data
-        else:
-            return res
+        return self._call(endpoints.closed_orders(
+            trades, userref, start, end, ofs, closetime))
 
     def query_orders(self, txid, trades=False, userref=None):
         """
@@ -828,89 +554,7 @@ class Kapi:
 
         :return: a dataframe
         """
-
-        if trades not in [False, True] or not is_none_or_type(userref, int):
-            raise Exception(f"Invalid parameters: {trades}, {userref}")
-
-        if not isinstance(txid, str) and not isinstance(txid, list):
-            raise Exception(
-                f"Invalid parameter txid: {txid}, must be list or string")
-
-        txid_parsed = output_or_join_list(txid)
-
-        data = {"txid": txid_parsed, "trades": str(trades).lower()}
-
-        if userref is not None:
-            data["userref"] = userref
-
-        res = self._private_query("QueryOrders", data=data)
-        self._update_counters("other")
-
-        if "result" in res:
-            columns = [
-                "order_id",
-                "refid",
-                "userref",
-                "status",
-                "opentm",
-                "starttm",
-                "expiretim",
-                "pair",
-                "type",
-                "order_type",
-                "price",
-                "price_2",
-                "leverage",
-                "order",
-                "close",
-                "volume",
-                "volume_executed",
-                "cost",
-                "fee",
-                "price",
-                "stop_price",
-                "limit_price",
-                "misc",
-                "oflags"
-            ]
-
-            data = pd.DataFrame(columns=columns)
-            data_raw = res["result"]
-
-            for order in data_raw:
-                values = [
-                    order,
-                    data_raw[order]["refid"],
-                    data_raw[order]["userref"],
-                    data_raw[order]["status"],
-                    data_raw[order]["opentm"],
-                    data_raw[order]["starttm"],
-                    data_raw[order]["expiretm"],
-                    data_raw[order]["descr"]["pair"],
-                    data_raw[order]["descr"]["type"],
-                    data_raw[order]["descr"]["ordertype"],
-                    data_raw[order]["descr"]["price"],
-                    data_raw[order]["descr"]["price2"],
-                    data_raw[order]["descr"]["leverage"],
-                    data_raw[order]["descr"]["order"],
-                    data_raw[order]["descr"]["close"],
-                    data_raw[order]["vol"],
-                    data_raw[order]["vol_exec"],
-                    data_raw[order]["cost"],
-                    data_raw[order]["fee"],
-                    data_raw[order]["price"],
-                    data_raw[order]["stopprice"],
-                    data_raw[order]["limitprice"],
-                    data_raw[order]["misc"],
-                    data_raw[order]["oflags"],
-                ]
-
-                inner_df = pd.DataFrame([values], columns=columns)
-                data = pd.concat([data, inner_df], ignore_index=True)
-
-            return data
-        else:
-            return res
+        return self._call(endpoints.query_orders(txid, trades, userref))
 
     def trades_history(
             self,
@@ -933,71 +577,8 @@ class Kapi:
 
         :return: a dataframe
         """
-
-        if type not in [
-                "all",
-                "any position",
-                "closed position",
-                "closing position",
-                "no position"] or trades not in [
-                False,
-                True] or not is_none_or_type(
-                start,
-                int) or not is_none_or_type(
-                    end,
-                    int) or not is_none_or_type(
-                        ofs,
-                int):
-            raise Exception(
-                f"Invalid parameters: {type}, {trades}, {start}, {end}, {ofs}")
-
-        data = {"trades": str(trades).lower(), "type": type}
-        if start is not None:
-            data["start"] = start
-        if end is not None:
-            data["end"] = end
-        if ofs is not None:
-            data["ofs"] = ofs
-
-        res = self._private_query("TradesHistory", data=data)
-        self._update_counters("ledger/trade")
-
-        if "result" in res:
-            data_raw = res["result"]["trades"]
-            count = res["result"]["count"]
-
-            columns = [
-                "trade_id",
-                "ordertxid",
-                "postxid",
-                "pair",
-                "time",  # I'm going to cast to int !!!
-                "type",
-                "ordertype",
-                "price",
-                "cost",
-                "fee",
-                "vol",
-                "margin",
-                "misc"
-            ]
-
-            data = pd.DataFrame(columns=columns)
-
-            for trade in data_raw:
-                values = [trade]
-                values.extend([
-                    (data_raw[trade][column] if column in data_raw[trade] else None) for column in columns if column != "trade_id"])
-
-                inner_df = pd.DataFrame([values], columns=columns)
-                data = pd.concat([data, inner_df], ignore_index=True)
-
-            data = data.rename(columns={"ordertxid": "order_id"})
-            data["time"] = data["time"].apply(int)
-
-            return data, count
-        else:
-            return res
+        return self._call(
+            endpoints.trades_history(type, trades, start, end, ofs))
 
     def query_trades(self, txid, trades=False):
         """
@@ -1007,51 +588,7 @@ class Kapi:
         :param trades: include or not the trades
         :return: a dataframe
         """
-        if trades not in [False, True]:
-            raise Exception(f"Invalid 'trades' parameter: {trades}")
-
-        txid_parsed = output_or_join_list(txid)
-
-        data = {"txid": txid_parsed, "trades": str(trades).lower()}
-        res = self._private_query("QueryTrades", data=data)
-        self._update_counters("other")
-
-        if "result" in res:
-            data_raw = res["result"]
-
-            columns = [
-                "trade_id",
-                "ordertxid",
-                "postxid",
-                "pair",
-                "time",  # I'm going to cast to int !!!
-                "type",
-                "ordertype",
-                "price",
-                "cost",
-                "fee",
-                "vol",
-                "margin",
-                "misc"
-            ]
-
-            data = pd.DataFrame(columns=columns)
-
-            for trade in data_raw:
-                values = [trade]
-                values.extend([
-                    (data_raw[trade][column] if column in data_raw[trade] else None) for column in columns if
-                    column != "trade_id"])
-
-                inner_df = pd.DataFrame([values], columns=columns)
-                data = pd.concat([data, inner_df], ignore_index=True)
-
-            data = data.rename(columns={"ordertxid": "order_id"})
-            data["time"] = data["time"].apply(int)
-
-            return data
-        else:
-            return res
+        return self._call(endpoints.query_trades(txid, trades))
 
     def open_positions(self, txid, docalcs=False,
                        consolidation="market"):
@@ -1062,61 +599,120 @@ class Kapi:
         :param docalcs: wheter to include P&L calculations
         :param consolidation: consolidate positions by market/pair
         """
+        return self._call(
+            endpoints.open_positions(txid, docalcs, consolidation))
 
-        if docalcs not in [False, True] or consolidation not in [
-                "market", "pair"]:
-            raise Exception(f"Invalid parameters {docalcs}, {consolidation}")
-
-        data = {
-            "txid": output_or_join_list(txid),
-            "docalcs": str(docalcs).lower(),
-            "consolidation": consolidation,
-        }
-
-        res = self._private_query("OpenPositions", data=data)
-        self._update_counters("other")
-
-        if "result" in res:
-            data_raw = res["result"]
-
-            columns = [
-                "trade_id",
-                "ordertxid",
-                "posstatus",
-                "pair",
-                "time",
-                "type",
-                "ordertype",
-                "cost",
-                "fee",
-                "vol",
-                "vol_closed",
-                "margin",
-                "value",
-                "net",
-                "terms",
-                "rollovterm",
-                "misc",
-                "oflags"
-            ]
-
-            data = pd.DataFrame(columns=columns)
-
-            for trade in data_raw:
-                values = [trade]
-                values.extend([
-                    (data_raw[trade][column] if column in data_raw[trade] else None) for column in columns if
-                    column != "trade_id"])
-
-                inner_df = pd.DataFrame([values], columns=columns)
-                data = pd.concat([data, inner_df], ignore_index=True)
-
-            data = data.rename(columns={"ordertxid": "order_id"})
-            data["time"] = data["time"].apply(int)
-
-            return data
-        else:
-            return res
+    def iter_trades_history(
+            self,
+            type="all",
+            trades=False,
+            start=None,
+            end=None,
+            prefetch=True):
+        """
+        iterate over all the trades/fills, page by page, the next page is
+        fetched while the current one is processed
+
+        :param type: see trades_history
+        :param trades: to include trades or not
+        :param start: starting unix timestamp or trade ID (exclusive)
+        :param end: ending unix timestamp or trade ID (inclusive), defaults
+                    to now so the pages do not shift when new trades arrive
+        :param prefetch: to fetch the next page in the background
+
+        :return: a generator of dataframes, one per page, use collect() to
+                 get a single dataframe
+        """
+        if end is None:
+            end = int(time.time())
+
+        return self._iter_pages(
+            partial(endpoints.trades_history, type, trades, start, end),
+            prefetch)
+
+    def iter_closed_orders(
+            self,
+            trades=False,
+            userref=None,
+            start=None,
+            end=None,
+            closetime="both",
+            prefetch=True):
+        """
+        iterate over all the closed orders, page by page, the next page is
+        fetched while the current one is processed
+
+        :param trades: to include trades or not
+        :param userref: restrict to given user reference id
+        :param start: starting unit timestamp or order tx (exclusive)
+        :param end: ending unix timestamp or order tx (inclusive), defaults
+                    to now so the pages do not shift when orders are closed
+        :param closetime: wich time to use to search ("both", "open", "close")
+        :param prefetch: to fetch the next page in the background
+
+        :return: a generator of dataframes, one per page, use collect() to
+                 get a single dataframe
+        """
+        if end is None:
+            end = int(time.time())
+
+        return self._iter_pages(
+            partial(
+                endpoints.closed_orders,
+                trades,
+                userref,
+                start,
+                end,
+                closetime=closetime),
+            prefetch)
+
+    def _iter_pages(self, make_call, prefetch=True):
+        """
+        :param make_call: a function ofs -> Call of a paginated method
+        :param prefetch: to fetch the next page in a background thread
+        """
+        output = self._frame_output()
+
+        def fetch(ofs):
+            return self._call(endpoints.page(make_call(ofs=ofs)), output)
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        pending = None
+        ofs = 0
+
+        try:
+            res = fetch(ofs)
+            while True:
+                if not isinstance(res, tuple):
+                    raise Exception(f"Error while fetching a page: {res}")
+
+                data, count = res
+                ofs += len(data)
+                more = len(data) > 0 and ofs < count
+
+                # the next page is asked before the current one is yielded,
+                # the rate counters are charged as for any other query, in a
+                # copy of the context so the priority blocks apply to it
+                if more and executor is not None:
+                    pending = executor.submit(
+                        contextvars.copy_context().run, fetch, ofs)
+
+                if len(data):
+                    yield data
+
+                if not more:
+                    return
+
+                if pending is not None:
+                    res = pending.result()
+                    pending = None
+                else:
+                    res = fetch(ofs)
+        finally:
+            if pending is not None:
+                pending.cancel()
+            if executor is not None:
+                executor.shutdown(wait=False)
 
     # end of query user data
     # ==========================================================================
@@ -1142,100 +738,154 @@ class Kapi:
                   deadline=None,
                   validate=False,
                   ):
-
-        if ordertype not in ["market", "limit", "stop-loss", "take-profit", "stop-loss-limit",
-                             "take-profit-limit", "settle-position"]:
-            raise Exception(f"Invalid parameter for ordertype: {ordertype}")
-
-        if buy_or_sell not in ["buy", "sell"]:
-            raise Exception(f"Invalid parameter buy_or_sell: {buy_or_sell}")
-
-        if volume < 0:
-            raise Exception(
-                "Invalid parameter volume, the volume must be positive")
-
-        if ordertype in ["stop-loss-limit",
-                         "take-profit-limit"] and price2 is None:
-            raise Exception(
-                "Invalid parameters, price2 must be specified for the given ordertype")
-
-        if close_ordertype is not None and close_ordertype not in [
-                "limit", "stop-loss", "take-profit", "stop-loss-limit", "take-profit-limit"]:
-            raise Exception(
-                f"Invalid parameter close_ordertype: {close_ordertype}")
-
-        if validate not in [False, True]:
-            raise Exception(f"Invalid parameter validate: {validate}")
-
-        # defaults to True in the case of a test session
-        validate = True if self._test_session else validate
-
-        data = {
-            "ordertype": ordertype,
-            "type": buy_or_sell,
-            "pair": pair,
-            "volume": volume,
-            "price": price,
-            "starttm": starttm,
-            "expiretm": expiretm,
-            "validate": str(validate).lower(),
-        }
-
-        if userref is not None:
-            data["userref"] = userref
-        if price2 is not None:
-            data["price2"] = price2
-        if leverage is not None:
-            data["leverage"] = leverage
-        if oflags is not None:
-            data["oflags"] = oflags
-        if close_ordertype is not None and close_price is not None:
-            data["close[ordertype]"] = close_ordertype
-            data["close[price]"] = close_price
-
-            if close_price2 is not None:
-                data["close[price2]"] = close_price2
-        if deadline is not None:
-            data["deadline"] = deadline
-
-        res = self._private_query("AddOrder", data=data)
-        self._update_counters("add_order", pair)
-
-        if "result" in res:
-            return res["result"]
+        pair = self._normalize(pair)
+        if self._local_checks is not None:
+            order, errors = self._validator.check(
+                {"ordertype": ordertype, "buy_or_sell": buy_or_sell,
+                 "volume": volume, "pair": pair, "price": price,
+                 "price2": price2, "leverage": leverage},
+                round=self._local_checks == "round")
+            if errors:
+                raise Exception(f"Invalid order: {', '.join(errors)}")
+            volume, price, price2 = \
+                order["volume"], order["price"], order["price2"]
+
+        return self._call(endpoints.add_order(
+            ordertype=ordertype,
+            buy_or_sell=buy_or_sell,
+            volume=volume,
+            pair=pair,
+            price=price,
+            price2=price2,
+            userref=userref,
+            leverage=leverage,
+            oflags=oflags,
+            starttm=starttm,
+            expiretm=expiretm,
+            close_ordertype=close_ordertype,
+            close_price=close_price,
+            close_price2=close_price2,
+            deadline=deadline,
+            validate=validate,
+            test_session=self._test_session))
+
+    def add_orders(self, orders, deadline=None, validate=False):
+        """
+        add several orders, the orders of a same pair are sent together in
+        AddOrderBatch queries of at most 15 orders
+
+        every order is checked with the rules of add_order first, an invalid
+        order is not sent and its error is reported in the result
+
+        :param orders: a list of dicts or a dataframe, one order per item/row
+                       with the parameters of add_order as keys/columns
+                       (ordertype, buy_or_sell, volume, pair, price,...)
+        :param deadline: see add_order, for every batch
+        :param validate: see add_order, for every batch
+
+        :return: a dataframe with one row per order, in the order given, with
+                 its txid (or its description when only validated) or its
+                 error
+        """
+        orders = endpoints.order_records(orders)
+        for order in orders:
+            if "pair" in order:
+                order["pair"] = self._normalize(order["pair"])
+
+        refused = {}
+        if self._local_checks is not None:
+            orders, errors = self._validator.check_records(
+                orders, round=self._local_checks == "round")
+            refused = {
+                position: ", ".join(error)
+                for position, error in enumerate(errors) if error}
+
+        batches, errors = endpoints.add_order_batches(
+            orders, deadline, validate, self._test_session, refused)
+
+        outcomes = {
+            position: (None, None, error)
+            for position, error in errors.items()}
+        for positions, call in batches:
+            # an exception does not stop the other batches, the orders
+            # already sent must be reported
+            try:
+                res = self._call(call, self._frame_output())
+            except Exception as e:
+                res = str(e)
+            outcomes.update(endpoints.batch_outcomes(positions, res))
+
+        return endpoints.order_outcomes_frame(
+            orders, outcomes, self._frame_builder)
+
+    def cancel_order(self, txid, pair=None):
+        """
+        :param txid: the transaction id of the order to cancel
+        :param pair: the pair of the order, if given the cancel penalty of the
+                     rate counters is charged
+        """
+        return self._call(endpoints.cancel_order(txid, self._normalize(pair)))
+
+    def check_orders(self, orders, round=False):
+        """
+        check orders locally against the rules of their pair, without any
+        query but the AssetPairs data loaded once by the pair registry
+
+        :param orders: a dataframe or a list of dicts, one order per row/item
+                       with the parameters of add_order as columns/keys
+        :param round: round the prices to the tick of the pair and the volumes
+                      down to its lot decimals before checking them
+
+        :return: a dataframe of the orders (rounded if asked) with an "error"
+                 column, None for the valid orders
+        """
+        if isinstance(orders, list):
+            records = endpoints.order_records(orders)
+            columns = list(dict.fromkeys(
+                name for order in records for name in order))
+            orders = build_frame(columns, [
+                [order.get(name) for name in columns] for order in records])
+        return self._validator.check_frame(orders, round=round)
+
+    def cancel_orders(self, txids, pairs=None):
+        """
+        cancel several orders with CancelOrderBatch queries of at most 50
+        txids
+
+        :param txids: a list of transaction ids (or userrefs)
+        :param pairs: the pair of each txid, or a single pair for all of
+                      them, if given the txids are cancelled per pair and the
+                      cancel penalty of the rate counters is charged for
+                      each order
+
+        :return: a dataframe with one row per txid, kraken only gives the
+                 number of orders cancelled by each query so the outcome of
+                 a txid is the one of its batch: batch_cancelled is the count
+                 of kraken, all_cancelled is True if it equals batch_size
+        """
+        if pairs is not None and not isinstance(pairs, str):
+            pairs = [self._normalize(pair) for pair in pairs]
         else:
-            return res
+            pairs = self._normalize(pairs)
 
-    def cancel_order(self, txid):
-        data = {"txid": txid}
+        txids = list(txids)
+        batches = endpoints.cancel_order_batches(txids, pairs)
 
-        res = self._private_query("CancelOrder", data=data)
-        self._update_counters("cancel_order")
+        answers = []
+        for _, call in batches:
+            try:
+                answers.append(self._call(call, self._frame_output()))
+            except Exception as e:
+                answers.append(str(e))
 
-        if "result" in res:
-            return res["result"]
-        else:
-            return res
+        return endpoints.cancel_outcomes_frame(
+            txids, batches, answers, self._frame_builder)
 
     def cancel_all(self):
-        res = self._private_query("CancelAll")
-        self._update_counters("cancel_order")
-
-        if "result" in res:
-            return res["result"]
-        else:
-            return res
+        return self._call(endpoints.cancel_all())
 
     def cancel_all_orders_after(self, timeout):
-        data = {"timeout": timeout}
-
-        res = self._private_query("CancelAllOrdersAfter", data)
-        self._update_counters("cancel_order")
-
-        if "result" in res:
-            return res["result"]
-        else:
-            return res
+        return self._call(endpoints.cancel_all_orders_after(timeout))
 
     # end of query user trading
     # ==========================================================================
@@ -1249,32 +899,40 @@ class Kapi:
         :return: True if the connection is alive and the server online,
                  False otherwise
         """
-        res = self.query_system_status()
+        res = self.system_status()
         return "result" in res and res["result"]["status"] == "online"
 
+    @property
+    def pairs(self):
+        """
+        the PairRegistry of this Kapi: every AssetPairs and Assets record
+        indexed by canonical key, altname and wsname, loaded at the first use
+        """
+        return self._pairs
+
+    def close(self):
+        """
+        close the http sessions of all the threads
+        """
+        self._api.close()
+
+    @property
+    def metrics(self):
+        """
+        the Metrics given at the creation, None if there is none
+        """
+        return self._metrics
+
+    def transport_stats(self):
+        """
+        :return: a dict with the number of http sessions, of requests sent,
+                 of connections opened and of requests that reused an open
+                 connection
+        """
+        return self._api.connection_stats()
+
     def is_test_session(self):
         return self._test_session
 
     def user_counters(self):
-        return {
-            "api_counter": self._api_call_counter,
-            "api_counter_decay": self._api_counter_decay,
-            "max_api_counter": self._max_api_counter,
-            "order_counter": self._order_counter,
-            "order_counter_decay": self._ratecount_decay,
-            "max_num_orders": self._max_num_orders,
-            "max_ratecount": self._max_rate_count
-        }
-
-
-def is_none_or_type(o, t):
-    return o is None or isinstance(o, t)
-
-
-def output_or_join_list(obj):
-    if isinstance(obj, list):
-        return ",".join(obj)
-    elif isinstance(obj, str):
-        return obj
-    else:
-        raise Exception(f"Unknown objet type: {obj}, {type(obj)}")
+        return self._limiter.counters()
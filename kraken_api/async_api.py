@@ -0,0 +1,629 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import time
+import urllib.parse
+from functools import partial
+
+from . import endpoints
+from .flight import AsyncSingleFlight, call_key
+from .frames import OUTPUTS, build_frame, collect
+from .limiter import PRIORITIES, RateLimiter, RateLimitExceeded
+from .metrics import count_rows, error_codes
+from .registry import PairRegistry
+from .transport import NonceCounter, sign
+
+# aiohttp is only needed by this client, install it with
+# pip install kraken_api[async]
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncKapi:
+
+    def __init__(
+            self,
+            test_session=True,
+            account_type="starter",
+            key="",
+            secret="",
+            exact_decimals=False,
+            blocking=True,
+            uri="https://api.kraken.com",
+            session=None,
+            max_connections=100,
+            normalize_pairs=True,
+            coalesce=False,
+            nonce=None,
+            local_checks=None,
+            metrics=None,
+            reserves=None,
+            output="pandas"):
+        """
+        asyncio version of Kapi, every method has the same name, parameters
+        and return value as in Kapi but must be awaited
+
+        :param test_session: see Kapi
+        :param account_type: see Kapi
+        :param key: the key used for kraken authentication
+        :param secret: the secret used for kraken authentication
+        :param exact_decimals: see Kapi
+        :param blocking: see Kapi
+        :param uri: the root url of the kraken api
+        :param session: an aiohttp.ClientSession to use, by default one is
+                        created at the first query and closed by close()
+        :param max_connections: number of simultaneous connections of the
+                                session created
+        :param normalize_pairs: see Kapi, the pair registry is loaded with
+                                the queries of this client
+        :param coalesce: see Kapi, the identical public queries of several
+                         tasks are sent once
+        :param nonce: see Kapi
+        :param local_checks: see Kapi
+        :param metrics: see Kapi
+        :param reserves: see Kapi
+        :param output: see Kapi
+        """
+        if aiohttp is None:
+            raise Exception(
+                "AsyncKapi needs aiohttp, install it with: pip install aiohttp")
+
+        if account_type not in ["starter", "intermediate", "pro"]:
+            raise Exception(
+                f"Invalid parameter for account_type: {account_type}")
+
+        if not isinstance(test_session, bool):
+            raise Exception(
+                f"Invalid parameter for test_section: {test_session}")
+
+        if not isinstance(blocking, bool):
+            raise Exception(f"Invalid parameter for blocking: {blocking}")
+
+        if not isinstance(exact_decimals, bool):
+            raise Exception(
+                f"Invalid parameter for exact_decimals: {exact_decimals}")
+
+        if output not in ["raw"] + OUTPUTS:
+            raise Exception(f"Invalid parameter for output: {output}")
+
+        self._key = key
+        self._secret = secret
+        self._uri = uri.rstrip("/")
+        self._apiversion = "0"
+        self._session = session
+        self._own_session = session is None
+        self._max_connections = max_connections
+        self._nonce = nonce if nonce is not None else NonceCounter()
+
+        self._exact_decimals = exact_decimals
+        self._test_session = test_session
+        self._account_type = account_type
+
+        # the same accounting as Kapi, only the waiting is done with
+        # asyncio.sleep so the event loop is never blocked
+        self._blocking = blocking
+        self._limiter = RateLimiter(self._account_type, reserves)
+        self._priority = contextvars.ContextVar("priority", default=None)
+
+        self._output = output
+        self._output_block = contextvars.ContextVar("output", default=None)
+
+        self._normalize_pairs = normalize_pairs
+        # loaded by the coroutines of this client before every lookup, never
+        # in a thread of its own
+        self._pairs = PairRegistry(self, background=False)
+
+        self._flights = AsyncSingleFlight() if coalesce else None
+
+        if local_checks not in [None, "check", "round"]:
+            raise Exception(
+                f"Invalid parameter for local_checks: {local_checks}")
+
+        self._local_checks = local_checks
+        self._order_validator = None
+
+        self._metrics = metrics
+        if metrics is not None:
+            metrics.track_budget(self._limiter.counters)
+
+    async def _update_counters(self, type_query, pair=None, count=1,
+                               priority=None):
+        wait = self._limiter.try_acquire(
+            type_query, pair, count=count, priority=priority)
+        if wait <= 0:
+            return
+        if not self._blocking:
+            raise RateLimitExceeded(type_query, wait)
+
+        api_cost, _ = self._limiter.costs(type_query, pair, count=count)
+        with self._limiter.waiting(priority if api_cost else None):
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self._limiter.try_acquire(
+                    type_query, pair, count=count, priority=priority)
+
+    async def _validator(self):
+        # see Kapi._validator, the registry is loaded first
+        await self._pairs.async_load()
+        if self._order_validator is None:
+            from .validation import OrderValidator
+            self._order_validator = OrderValidator(self._pairs)
+        return self._order_validator
+
+    @contextlib.contextmanager
+    def priority(self, priority):
+        """
+        see Kapi.priority, the class is given to the queries of the current
+        task and of the tasks it creates in the block
+        """
+        if priority not in PRIORITIES:
+            raise Exception(f"Invalid parameter for priority: {priority}")
+
+        token = self._priority.set(priority)
+        try:
+            yield
+        finally:
+            self._priority.reset(token)
+
+    @contextlib.contextmanager
+    def output(self, output):
+        """
+        see Kapi.output, the form is given to the results of the current
+        task and of the tasks it creates in the block
+        """
+        if output not in ["raw"] + OUTPUTS:
+            raise Exception(f"Invalid parameter for output: {output}")
+
+        token = self._output_block.set(output)
+        try:
+            yield
+        finally:
+            self._output_block.reset(token)
+
+    def _get_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self._max_connections)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _request(self, urlpath, data, headers=None):
+        """
+        the public methods only accept GET since 2024-01-31, the private
+        ones are signed form-encoded POST
+
+        :return: a tuple (decoded answer, number of bytes of the answer)
+        """
+        session = self._get_session()
+        url = self._uri + urlpath
+
+        if "/public/" in urlpath:
+            # the query string as requests builds it for krakenex
+            params = {name: str(value) for name, value in data.items()}
+            request = session.get(url, params=params, headers=headers)
+        else:
+            headers = dict(headers) if headers is not None else {}
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            request = session.post(
+                url, data=urllib.parse.urlencode(data), headers=headers)
+
+        async with request as response:
+            response.raise_for_status()
+            content = await response.read()
+
+        return json.loads(content), len(content)
+
+    async def _query(self, method, urlpath, data, headers=None):
+        if self._metrics is None:
+            res, _ = await self._request(urlpath, data, headers)
+            return endpoints.unwrap(res)
+
+        sent = time.perf_counter()
+        try:
+            res, size = await self._request(urlpath, data, headers)
+        except Exception as e:
+            self._metrics.observe_network(
+                method, time.perf_counter() - sent,
+                errors=[f"exception:{type(e).__name__}"])
+            raise
+
+        res = endpoints.unwrap(res)
+        self._metrics.observe_network(
+            method, time.perf_counter() - sent, size, error_codes(res))
+
+        return res
+
+    async def _wait_counters(self, method, type_query, pair, count, priority):
+        start = time.perf_counter()
+        await self._update_counters(type_query, pair, count, priority)
+        if self._metrics is not None:
+            self._metrics.observe_wait(method, time.perf_counter() - start)
+
+    async def _public_query(
+            self, method, data=None, type_query="other", pair=None, count=1,
+            priority="market"):
+        await self._wait_counters(method, type_query, pair, count, priority)
+
+        data = dict(data) if data is not None else {}
+        urlpath = f"/{self._apiversion}/public/{method}"
+
+        return await self._query(method, urlpath, data)
+
+    async def _private_query(
+            self, method, data=None, type_query="other", pair=None, count=1,
+            priority="account"):
+        if not self._key or not self._secret:
+            raise Exception("Either key or secret is not set!")
+
+        await self._wait_counters(method, type_query, pair, count, priority)
+
+        data = dict(data) if data is not None else {}
+        data["nonce"] = self._nonce.next()
+        urlpath = f"/{self._apiversion}/private/{method}"
+        headers = {
+            "API-Key": self._key,
+            "API-Sign": sign(self._secret, data, urlpath),
+        }
+        return await self._query(method, urlpath, data, headers)
+
+    async def _call(self, call, output=None):
+        output = output or self._current_output()
+        if output == "raw":
+            call = endpoints.raw(call)
+
+        if not call.private and self._flights is not None:
+            return await self._flights.do(
+                (output, call_key(call)), lambda: self._send(call, output))
+
+        return await self._send(call, output)
+
+    async def _send(self, call, output="pandas"):
+        if call.private:
+            query = self._private_query
+        else:
+            query = self._public_query
+
+        priority = self._priority.get() or endpoints.call_priority(call)
+        res = await query(
+            call.method, call.data, call.type_query, call.pair, call.count,
+            priority)
+        frame_builder = partial(self._frame_builder, output=output)
+        if self._metrics is None or "result" not in res:
+            return endpoints.parse_result(res, call, frame_builder)
+
+        start = time.perf_counter()
+        result = endpoints.parse_result(res, call, frame_builder)
+        self._metrics.observe_parse(
+            call.method, time.perf_counter() - start, count_rows(result))
+
+        return result
+
+    async def _normalize(self, pair):
+        """
+        see Kapi._normalize
+        """
+        if pair is None or not self._normalize_pairs:
+            return pair
+
+        try:
+            await self._pairs.async_load()
+        except Exception:
+            # as in PairRegistry.normalize, kraken checks the names anyway
+            return pair
+        return self._pairs.normalize(pair)
+
+    def _frame_builder(self, schema, output=None):
+        return schema.builder(
+            exact=self._exact_decimals, output=output or self._frame_output())
+
+    def _current_output(self):
+        return self._output_block.get() or self._output
+
+    def _frame_output(self):
+        # see Kapi._frame_output
+        output = self._current_output()
+        return "pandas" if output == "raw" else output
+
+    # ==========================================================================
+    # market data
+
+    async def time(self):
+        return await self._call(endpoints.time())
+
+    async def system_status(self):
+        return await self._call(endpoints.system_status())
+
+    async def assets(self, asset=None, aclass="currency"):
+        return await self._call(endpoints.assets(asset, aclass))
+
+    async def asset_pairs(self, pair=None, info="info"):
+        return await self._call(endpoints.asset_pairs(pair, info))
+
+    async def ticker(self, pair):
+        batches = endpoints.ticker_batches(await self._normalize(pair))
+        if len(batches) == 1:
+            return await self._call(endpoints.ticker(batches[0]))
+
+        answers = await asyncio.gather(*[
+            self._call(endpoints.raw(endpoints.ticker(batch)))
+            for batch in batches])
+
+        results = {}
+        for res in answers:
+            if "result" not in res:
+                return res
+            results.update(res["result"])
+
+        if self._current_output() == "raw":
+            return {"result": results}
+
+        return endpoints.parse_ticker(results, self._frame_builder)
+
+    async def ohlc(self, pair, interval=1, since=None):
+        return await self._call(
+            endpoints.ohlc(await self._normalize(pair), interval, since))
+
+    async def depth(self, pair, count=100):
+        return await self._call(
+            endpoints.depth(await self._normalize(pair), count))
+
+    async def order_book(self, pair, count=100):
+        return await self._call(
+            endpoints.order_book(await self._normalize(pair), count))
+
+    async def depth_many(self, pairs, count=100, max_workers=8,
+                         as_frame=False):
+        if not 1 <= count <= 500:
+            raise Exception(
+                f"Invalid count parameter, count must be in the invterval [1, 500], count provided: {count}")
+
+        if max_workers < 1:
+            raise Exception(
+                f"Invalid parameter for max_workers: {max_workers}")
+
+        if as_frame and self._current_output() == "raw":
+            raise Exception("as_frame needs an output other than raw")
+
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch(pair):
+            async with semaphore:
+                return await self.depth(pair, count)
+
+        names = {name: await self._normalize(name) for name in pairs}
+        pairs = list(dict.fromkeys(names.values()))
+        answers = await asyncio.gather(
+            *[fetch(pair) for pair in pairs], return_exceptions=True)
+
+        books = {}
+        errors = {}
+        for pair, res in zip(pairs, answers):
+            if isinstance(res, Exception) or endpoints.is_error(res):
+                errors[pair] = res
+            else:
+                books[pair] = res
+
+        errors = endpoints.by_name(names, errors)
+        if as_frame:
+            return collect(books.values()), errors
+
+        return endpoints.by_name(names, books), errors
+
+    async def trades(self, pair, since=None):
+        return await self._call(
+            endpoints.trades(await self._normalize(pair), since))
+
+    async def spread(self, pair, since=None):
+        return await self._call(
+            endpoints.spread(await self._normalize(pair), since))
+
+    # ==========================================================================
+    # user data
+
+    async def balance(self):
+        return await self._call(endpoints.balance())
+
+    async def trade_balance(self, asset="ZEUR"):
+        return await self._call(endpoints.trade_balance(asset))
+
+    async def open_orders(self, trades=False, userref=None):
+        return await self._call(endpoints.open_orders(trades, userref))
+
+    async def closed_orders(
+            self,
+            trades=False,
+            userref=None,
+            start=None,
+            end=None,
+            ofs=None,
+            closetime="both"):
+        return await self._call(endpoints.closed_orders(
+            trades, userref, start, end, ofs, closetime))
+
+    async def query_orders(self, txid, trades=False, userref=None):
+        return await self._call(endpoints.query_orders(txid, trades, userref))
+
+    async def trades_history(
+            self,
+            type="all",
+            trades=False,
+            start=None,
+            end=None,
+            ofs=None):
+        return await self._call(
+            endpoints.trades_history(type, trades, start, end, ofs))
+
+    async def query_trades(self, txid, trades=False):
+        return await self._call(endpoints.query_trades(txid, trades))
+
+    async def open_positions(self, txid, docalcs=False,
+                             consolidation="market"):
+        return await self._call(
+            endpoints.open_positions(txid, docalcs, consolidation))
+
+    # ==========================================================================
+    # user trading
+
+    async def add_order(self,
+                        ordertype,
+                        buy_or_sell,
+                        volume,
+                        pair,
+                        price,
+                        price2=None,
+                        userref=None,
+                        leverage=None,
+                        oflags=None,
+                        starttm=0,
+                        expiretm=0,
+                        close_ordertype=None,
+                        close_price=None,
+                        close_price2=None,
+                        deadline=None,
+                        validate=False,
+                        ):
+        pair = await self._normalize(pair)
+        if self._local_checks is not None:
+            validator = await self._validator()
+            order, errors = validator.check(
+                {"ordertype": ordertype, "buy_or_sell": buy_or_sell,
+                 "volume": volume, "pair": pair, "price": price,
+                 "price2": price2, "leverage": leverage},
+                round=self._local_checks == "round")
+            if errors:
+                raise Exception(f"Invalid order: {', '.join(errors)}")
+            volume, price, price2 = \
+                order["volume"], order["price"], order["price2"]
+
+        return await self._call(endpoints.add_order(
+            ordertype=ordertype,
+            buy_or_sell=buy_or_sell,
+            volume=volume,
+            pair=pair,
+            price=price,
+            price2=price2,
+            userref=userref,
+            leverage=leverage,
+            oflags=oflags,
+            starttm=starttm,
+            expiretm=expiretm,
+            close_ordertype=close_ordertype,
+            close_price=close_price,
+            close_price2=close_price2,
+            deadline=deadline,
+            validate=validate,
+            test_session=self._test_session))
+
+    async def add_orders(self, orders, deadline=None, validate=False):
+        orders = endpoints.order_records(orders)
+        for order in orders:
+            if "pair" in order:
+                order["pair"] = await self._normalize(order["pair"])
+
+        refused = {}
+        if self._local_checks is not None:
+            validator = await self._validator()
+            orders, errors = validator.check_records(
+                orders, round=self._local_checks == "round")
+            refused = {
+                position: ", ".join(error)
+                for position, error in enumerate(errors) if error}
+
+        batches, errors = endpoints.add_order_batches(
+            orders, deadline, validate, self._test_session, refused)
+
+        outcomes = {
+            position: (None, None, error)
+            for position, error in errors.items()}
+        # the batches are sent one after the other, sent together their
+        # nonces could reach kraken out of order (EAPI:Invalid nonce)
+        for positions, call in batches:
+            try:
+                res = await self._call(call, self._frame_output())
+            except Exception as e:
+                res = str(e)
+            outcomes.update(endpoints.batch_outcomes(positions, res))
+
+        return endpoints.order_outcomes_frame(
+            orders, outcomes, self._frame_builder)
+
+    async def cancel_order(self, txid, pair=None):
+        return await self._call(
+            endpoints.cancel_order(txid, await self._normalize(pair)))
+
+    async def check_orders(self, orders, round=False):
+        validator = await self._validator()
+        if isinstance(orders, list):
+            records = endpoints.order_records(orders)
+            columns = list(dict.fromkeys(
+                name for order in records for name in order))
+            orders = build_frame(columns, [
+                [order.get(name) for name in columns] for order in records])
+        return validator.check_frame(orders, round=round)
+
+    async def cancel_orders(self, txids, pairs=None):
+        if pairs is not None and not isinstance(pairs, str):
+            pairs = [await self._normalize(pair) for pair in pairs]
+        else:
+            pairs = await self._normalize(pairs)
+
+        txids = list(txids)
+        batches = endpoints.cancel_order_batches(txids, pairs)
+
+        # one batch after the other, like the orders of add_orders
+        answers = []
+        for _, call in batches:
+            try:
+                answers.append(await self._call(call, self._frame_output()))
+            except Exception as e:
+                answers.append(str(e))
+
+        return endpoints.cancel_outcomes_frame(
+            txids, batches, answers, self._frame_builder)
+
+    async def cancel_all(self):
+        return await self._call(endpoints.cancel_all())
+
+    async def cancel_all_orders_after(self, timeout):
+        return await self._call(endpoints.cancel_all_orders_after(timeout))
+
+    # ==========================================================================
+    # useful methods
+
+    @property
+    def pairs(self):
+        """
+        see Kapi.pairs, loaded by the first method given a pair, or by
+        await kapi.pairs.async_load() before a lookup of its own
+        """
+        return self._pairs
+
+    async def test_connection(self):
+        res = await self.system_status()
+        return "result" in res and res["result"]["status"] == "online"
+
+    async def close(self):
+        """
+        close the http session if it was created by this client
+        """
+        if self._session is not None and self._own_session:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    @property
+    def metrics(self):
+        return self._metrics
+
+    def is_test_session(self):
+        return self._test_session
+
+    def user_counters(self):
+        return self._limiter.counters()
@@ -0,0 +1,1099 @@
+from functools import partial
+
+from . import schemas
+
+# each function of this module checks the parameters of a kraken method and
+# returns the Call to send, the Call knows how to parse the result so the
+# synchronous and the asynchronous clients share everything but the transport
+
+
+class Call:
+
+    def __init__(
+            self,
+            method,
+            data=None,
+            private=False,
+            type_query="other",
+            pair=None,
+            parse=None,
+            count=1,
+            priority=None):
+        """
+        a query to kraken and the way to parse its result
+
+        :param method: method asked to kraken: Ticker, Assets,...
+        :param data: data passed to the method
+        :param private: if the method needs authentication
+        :param type_query: the kind of query for the rate counters
+        :param pair: the pair of the order, for the rate counters
+        :param parse: a function (result, frame_builder) -> returned value,
+                      if None the answer is returned wrapped in a dict
+        :param count: the number of orders sent or cancelled, for the rate
+                      counters of the batch methods
+        :param priority: the class of the query for the scheduling of the
+                         rate counters, one of limiter.PRIORITIES, None for
+                         the class given by call_priority
+        """
+        self.method = method
+        self.data = data
+        self.private = private
+        self.type_query = type_query
+        self.pair = pair
+        self.parse = parse
+        self.count = count
+        self.priority = priority
+
+    def __repr__(self):
+        return f"Call({self.method}, {self.data})"
+
+
+def call_priority(call):
+    """
+    :return: the priority of the call if it has one, else "trading" for
+             adding and cancelling orders, "account" for the other private
+             methods and "market" for the public ones
+    """
+    if call.priority is not None:
+        return call.priority
+    if call.type_query in ["add_order", "cancel_order"]:
+        return "trading"
+    if call.private:
+        return "account"
+    return "market"
+
+
+def unwrap(res):
+    """
+    :param res: the answer of kraken
+    :return: the error else the result wrapped in a dict
+    """
+    if res["error"]:
+        return res["error"]
+    else:
+        return {"result": res["result"]}
+
+
+def is_error(res):
+    """
+    :param res: the value returned for a call
+    :return: True if it is the list of the errors of kraken, the results in
+             records are lists too but of records
+    """
+    return isinstance(res, list) and bool(res) and \
+        all(isinstance(error, str) for error in res)
+
+
+def parse_result(res, call, frame_builder):
+    """
+    :param res: the unwrapped answer of kraken
+    :param call: the Call that was sent
+    :param frame_builder: a function schema -> FrameBuilder
+    :return: the parsed result, or the error
+    """
+    if "result" in res and call.parse is not None:
+        return call.parse(res["result"], frame_builder)
+    else:
+        return res
+
+
+def result_pair(result, pair=None):
+    """
+    kraken answers with the canonical key of the pair whatever the name
+    used in the query ("XXBTZEUR" for "XBTEUR")
+
+    :param result: the result of a query on a single pair
+    :param pair: the pair asked
+    :return: the key of the pair in the result
+    """
+    if pair is not None and pair in result:
+        return pair
+
+    keys = [key for key in result if key != "last"]
+    if len(keys) != 1:
+        raise Exception(f"Cannot find the pair {pair} in the result: {keys}")
+
+    return keys[0]
+
+
+def _raw_result(result, frame_builder):
+    return result
+
+
+def raw(call):
+    """
+    the same call without parsing, the result is returned wrapped in a dict
+    """
+    return Call(
+        call.method,
+        call.data,
+        private=call.private,
+        type_query=call.type_query,
+        pair=call.pair,
+        count=call.count,
+        priority=call.priority)
+
+
+def page(call):
+    """
+    the same call but its parse returns a tuple (frame, total count of items),
+    for the paginated methods (ClosedOrders, TradesHistory), walking all the
+    pages is a backfill so the call gets the lowest priority
+    """
+    parse = call.parse
+
+    def parse_page(result, frame_builder):
+        data = parse(result, frame_builder)
+        if isinstance(data, tuple):
+            data = data[0]
+        return data, result["count"]
+
+    return Call(
+        call.method,
+        call.data,
+        private=call.private,
+        type_query=call.type_query,
+        pair=call.pair,
+        parse=parse_page,
+        priority="backfill")
+
+
+# ==============================================================================
+# market data
+
+def time():
+    return Call("Time")
+
+
+def system_status():
+    return Call("SystemStatus")
+
+
+def assets(asset=None, aclass="currency"):
+    data = {"aclass": aclass}
+
+    if asset is not None:
+        data["pair"] = output_or_join_list(asset)
+
+    return Call("Assets", data, parse=_parse_assets)
+
+
+def _parse_assets(data_raw, frame_builder):
+    data = frame_builder(schemas.ASSETS)
+    for currency in data_raw:
+        data.append([
+            currency.startswith("X"),
+            data_raw[currency]["aclass"],
+            data_raw[currency]["altname"],
+            data_raw[currency]["decimals"],
+            data_raw[currency]["display_decimals"],
+        ])
+
+    return data.build()
+
+
+def asset_pairs(pair=None, info="info"):
+    if info not in ["info", "leverage", "fees", "margin"]:
+        raise Exception(f"Invalid parameter for info: {info}")
+    data = {"info": info}
+
+    if pair is not None:
+        data["pair"] = output_or_join_list(pair)
+
+    return Call("AssetPairs", data, parse=_parse_asset_pairs)
+
+
+def _parse_asset_pairs(data_raw, frame_builder):
+    data = frame_builder(schemas.ASSET_PAIRS)
+
+    for currency in data_raw:
+        data.append([
+            data_raw[currency]["altname"],
+            data_raw[currency]["wsname"],
+            data_raw[currency]["aclass_base"],
+            data_raw[currency]["base"],
+            data_raw[currency]["aclass_quote"],
+            data_raw[currency]["quote"],
+            data_raw[currency]["lot"],
+            data_raw[currency]["pair_decimals"],
+            data_raw[currency]["lot_decimals"],
+            data_raw[currency]["lot_multiplier"],
+            data_raw[currency]["fees"][0][1],
+            data_raw[currency]["fees"][1][1],
+            data_raw[currency]["fees"][2][1],
+            data_raw[currency]["fees"][3][1],
+            data_raw[currency]["fees"][4][1],
+            data_raw[currency]["fees_maker"][0][1],
+            data_raw[currency]["fees_maker"][1][1],
+            data_raw[currency]["fees_maker"][2][1],
+            data_raw[currency]["fees_maker"][3][1],
+            data_raw[currency]["fees_maker"][4][1],
+            data_raw[currency]["fee_volume_currency"],
+            data_raw[currency]["margin_call"],
+            data_raw[currency]["margin_stop"],
+            data_raw[currency]["ordermin"],
+        ])
+
+    return data.build()
+
+
+# longest comma separated list of pairs sent in one Ticker query, kraken
+# reads the pairs from the url so it must stay well below the url limits
+TICKER_BATCH_LENGTH = 1000
+
+
+def ticker(pair):
+    return Call(
+        "Ticker", {"pair": output_or_join_list(pair)}, parse=parse_ticker)
+
+
+def ticker_batches(pair, max_length=TICKER_BATCH_LENGTH):
+    """
+    split a list of pairs in comma separated strings of at most max_length
+    characters, one per Ticker query
+
+    :param pair: a pair, a comma separated string of pairs or a list of pairs
+    :return: a list of comma separated strings
+    """
+    if isinstance(pair, str):
+        pair = pair.split(",")
+
+    batches = []
+    batch = []
+    length = 0
+    for name in pair:
+        if batch and length + 1 + len(name) > max_length:
+            batches.append(",".join(batch))
+            batch = []
+            length = 0
+        length += len(name) + (1 if batch else 0)
+        batch.append(name)
+
+    if batch:
+        batches.append(",".join(batch))
+
+    return batches
+
+
+def parse_ticker(data_raw, frame_builder):
+    """
+    :param data_raw: the result of one or several Ticker queries merged
+    :return: a dataframe with one row per pair, indexed by the canonical key
+             (the "currency" column for the other outputs)
+    """
+    data = frame_builder(schemas.TICKER)
+
+    for currency in data_raw:
+        values = [
+            currency,
+            data_raw[currency]["a"][0],
+            data_raw[currency]["a"][1],
+            data_raw[currency]["a"][2],
+            data_raw[currency]["b"][0],
+            data_raw[currency]["b"][1],
+            data_raw[currency]["b"][2],
+            data_raw[currency]["c"][0],
+            data_raw[currency]["c"][1],
+            data_raw[currency]["v"][0],
+            data_raw[currency]["v"][1],
+            data_raw[currency]["p"][0],
+            data_raw[currency]["p"][1],
+            data_raw[currency]["t"][0],
+            data_raw[currency]["t"][1],
+            data_raw[currency]["l"][0],
+            data_raw[currency]["l"][1],
+            data_raw[currency]["h"][0],
+            data_raw[currency]["h"][1],
+            data_raw[currency]["o"],
+        ]
+
+        data.append(values)
+
+    if data.output != "pandas":
+        return data.build()
+
+    data = data.build()
+    data.index = data["currency"].values
+    data.index.name = "pair"
+
+    return data
+
+
+def ohlc(pair, interval=1, since=None):
+    if int(interval) not in [1, 5, 15, 30, 60, 240, 1440, 10080, 21600]:
+        raise Exception(f"Invalid interval for query: {interval}")
+
+    data = {"pair": pair, "interval": interval}
+    if since is not None:
+        data["since"] = since
+
+    return Call("OHLC", data, parse=_parse_ohlc)
+
+
+def _parse_ohlc(result, frame_builder):
+    data = frame_builder(schemas.OHLC)
+    correct_pair = result_pair(result)
+    data_raw = result[correct_pair]
+    last = result["last"]
+
+    for currency in data_raw:
+        data.append([
+            correct_pair,
+            currency[0],
+            currency[1],
+            currency[2],
+            currency[3],
+            currency[4],
+            currency[5],
+            currency[6],
+            currency[7]
+        ])
+
+    return data.build(), last
+
+
+def depth(pair, count=100):
+    if not 1 <= count <= 500:
+        raise Exception(
+            f"Invalid count parameter, count must be in the invterval [1, 500], count provided: {count}")
+
+    data = {"pair": pair, "count": count}
+
+    return Call("Depth", data, parse=partial(_parse_depth, pair=pair))
+
+
+def _parse_depth(result, frame_builder, pair):
+    """
+    one row per level, the best ask and the best bid are on the level 0, the
+    side with fewer levels is completed with missing values
+    """
+    data = frame_builder(schemas.DEPTH)
+    pair = result_pair(result, pair)
+    data_raw = result[pair]
+    asks = sorted(data_raw["asks"], key=lambda x: float(x[0]))
+    bids = sorted(data_raw["bids"], key=lambda x: float(x[0]), reverse=True)
+
+    missing = [None, None, None]
+    for level in range(max(len(asks), len(bids))):
+        ask = asks[level] if level < len(asks) else missing
+        bid = bids[level] if level < len(bids) else missing
+        values = [
+            pair,
+            level,
+            ask[0],
+            ask[1],
+            ask[2],
+            bid[0],
+            bid[1],
+            bid[2],
+        ]
+        data.append(values)
+
+    return data.build()
+
+
+def by_name(names, results):
+    """
+    :param names: a dict name given -> canonical key of the pair, the names
+                  of a same pair are queried once by depth_many
+    :param results: a dict canonical key -> result
+    :return: the results under the names given
+    """
+    return {
+        name: results[pair]
+        for name, pair in names.items() if pair in results}
+
+
+def order_book(pair, count=100):
+    call = depth(pair, count)
+    return Call(
+        call.method,
+        call.data,
+        parse=partial(_parse_order_book, pair=pair, count=count))
+
+
+def _parse_order_book(result, frame_builder, pair, count):
+    pair = result_pair(result, pair)
+    # numpy is only loaded when an order book is asked
+    from .orderbook import OrderBook
+
+    return OrderBook.from_depth(result, pair, depth=count)
+
+
+def trades(pair, since=None):
+    data = {"pair": pair}
+    if since is not None:
+        data["since"] = since
+
+    return Call("Trades", data, parse=partial(_parse_trades, pair=pair))
+
+
+def _parse_trades(result, frame_builder, pair):
+    data = frame_builder(schemas.TRADES)
+    pair = result_pair(result, pair)
+    data_raw = result[pair]
+    last = result["last"]
+
+    for li in data_raw:
+        values = [
+            pair,
+            li[2],
+            li[1],
+            li[0],
+            "s" in li,
+            "b" in li,
+            li[4],
+            li[5]
+        ]
+
+        data.append(values)
+
+    return data.build(), last
+
+
+def spread(pair, since=None):
+    data = {"pair": pair}
+    if since is not None:
+        data["since"] = since
+
+    return Call("Spread", data, parse=partial(_parse_spread, pair=pair))
+
+
+def _parse_spread(result, frame_builder, pair):
+    data = frame_builder(schemas.SPREAD)
+    pair = result_pair(result, pair)
+    data_raw = result[pair]
+    last = result["last"]
+
+    for li in data_raw:
+        values = [
+            pair,
+            li[0],
+            li[1],
+            li[2],
+        ]
+
+        data.append(values)
+
+    return data.build(), last
+
+
+# ==============================================================================
+# user data
+
+def balance():
+    return Call("Balance", private=True, parse=_parse_balance)
+
+
+def _parse_balance(data_raw, frame_builder):
+    data = frame_builder(schemas.BALANCE)
+
+    for currency in data_raw:
+        data.append([
+            currency,
+            data_raw[currency]
+        ])
+
+    return data.build()
+
+
+def trade_balance(asset="ZEUR"):
+    # the default is "ZUSD" but me I'm more interested in "ZEUR"
+    return Call(
+        "TradeBalance",
+        {"asset": asset},
+        private=True,
+        parse=_parse_trade_balance)
+
+
+def _parse_trade_balance(data_raw, frame_builder):
+    columns = [
+        "eb",
+        "tb",
+        "m",
+        "n",
+        "c",
+        "v",
+        "e",
+        "mf",
+    ]
+
+    data = frame_builder(schemas.TRADE_BALANCE)
+    data.append([data_raw[column] for column in columns])
+
+    return data.build()
+
+
+def open_orders(trades=False, userref=None):
+    if trades not in [False, True] or not is_none_or_type(userref, int):
+        raise Exception(f"Invalid parameters : {trades}, {userref}")
+
+    data = {"trades": str(trades).lower()}
+    if userref is not None:
+        data["userref"] = userref
+
+    return Call(
+        "OpenOrders",
+        data,
+        private=True,
+        parse=partial(_parse_orders, schema=schemas.OPEN_ORDERS, key="open"))
+
+
+def closed_orders(
+        trades=False,
+        userref=None,
+        start=None,
+        end=None,
+        ofs=None,
+        closetime="both"):
+    if (trades not in [False, True] or
+            not is_none_or_type(userref, int) or
+            not is_none_or_type(start, int) or
+            not is_none_or_type(end, int) or
+            not is_none_or_type(ofs, int) or
+            closetime not in ["both", "open", "close"]):
+        raise Exception(
+            f"Invalid parameter, please verify: {trades}, {userref}, {start}, {end}, {ofs}, {closetime}")
+
+    data = {"trades": str(trades).lower(), "closetime": closetime}
+
+    if userref is not None:
+        data["userref"] = userref
+    if start is not None:
+        data["start"] = start
+    if end is not None:
+        data["end"] = end
+    if ofs is not None:
+        data["ofs"] = ofs
+
+    return Call(
+        "ClosedOrders",
+        data,
+        private=True,
+        parse=partial(
+            _parse_orders, schema=schemas.CLOSED_ORDERS, key="closed"))
+
+
+def query_orders(txid, trades=False, userref=None):
+    if trades not in [False, True] or not is_none_or_type(userref, int):
+        raise Exception(f"Invalid parameters: {trades}, {userref}")
+
+    if not isinstance(txid, str) and not isinstance(txid, list):
+        raise Exception(
+            f"Invalid parameter txid: {txid}, must be list or string")
+
+    txid_parsed = output_or_join_list(txid)
+
+    data = {"txid": txid_parsed, "trades": str(trades).lower()}
+
+    if userref is not None:
+        data["userref"] = userref
+
+    return Call(
+        "QueryOrders",
+        data,
+        private=True,
+        parse=partial(_parse_orders, schema=schemas.QUERY_ORDERS, key=None))
+
+
+def _parse_orders(result, frame_builder, schema, key):
+    data = frame_builder(schema)
+    data_raw = result[key] if key is not None else result
+    with_reason = "reason" in schema.columns
+
+    for order in data_raw:
+        values = [
+            order,
+            data_raw[order]["refid"],
+            data_raw[order]["userref"],
+        ]
+        if with_reason:
+            values.append(data_raw[order]["reason"])
+        values.extend([
+            data_raw[order]["status"],
+            data_raw[order]["opentm"],
+            data_raw[order]["starttm"],
+            data_raw[order]["expiretm"],
+            data_raw[order]["descr"]["pair"],
+            data_raw[order]["descr"]["type"],
+            data_raw[order]["descr"]["ordertype"],
+            data_raw[order]["descr"]["price"],
+            data_raw[order]["descr"]["price2"],
+            data_raw[order]["descr"]["leverage"],
+            data_raw[order]["descr"]["order"],
+            data_raw[order]["descr"]["close"],
+            data_raw[order]["vol"],
+            data_raw[order]["vol_exec"],
+            data_raw[order]["cost"],
+            data_raw[order]["fee"],
+            data_raw[order]["price"],
+            data_raw[order]["stopprice"],
+            data_raw[order]["limitprice"],
+            data_raw[order]["misc"],
+            data_raw[order]["oflags"],
+        ])
+
+        data.append(values)
+
+    return data.build()
+
+
+def trades_history(
+        type="all",
+        trades=False,
+        start=None,
+        end=None,
+        ofs=None):
+    if type not in [
+            "all",
+            "any position",
+            "closed position",
+            "closing position",
+            "no position"] or trades not in [
+            False,
+            True] or not is_none_or_type(
+            start,
+            int) or not is_none_or_type(
+                end,
+                int) or not is_none_or_type(
+                    ofs,
+            int):
+        raise Exception(
+            f"Invalid parameters: {type}, {trades}, {start}, {end}, {ofs}")
+
+    data = {"trades": str(trades).lower(), "type": type}
+    if start is not None:
+        data["start"] = start
+    if end is not None:
+        data["end"] = end
+    if ofs is not None:
+        data["ofs"] = ofs
+
+    return Call(
+        "TradesHistory",
+        data,
+        private=True,
+        type_query="ledger/trade",
+        parse=_parse_trades_history)
+
+
+def _parse_trades_history(result, frame_builder):
+    data = _parse_by_column(
+        result["trades"], frame_builder, schemas.TRADES_HISTORY)
+
+    return data, result["count"]
+
+
+def query_trades(txid, trades=False):
+    if trades not in [False, True]:
+        raise Exception(f"Invalid 'trades' parameter: {trades}")
+
+    txid_parsed = output_or_join_list(txid)
+
+    data = {"txid": txid_parsed, "trades": str(trades).lower()}
+
+    return Call(
+        "QueryTrades",
+        data,
+        private=True,
+        type_query="ledger/trade",
+        parse=partial(_parse_by_column, schema=schemas.QUERY_TRADES))
+
+
+def open_positions(txid, docalcs=False, consolidation="market"):
+    if docalcs not in [False, True] or consolidation not in [
+            "market", "pair"]:
+        raise Exception(f"Invalid parameters {docalcs}, {consolidation}")
+
+    data = {
+        "txid": output_or_join_list(txid),
+        "docalcs": str(docalcs).lower(),
+        "consolidation": consolidation,
+    }
+
+    return Call(
+        "OpenPositions",
+        data,
+        private=True,
+        parse=partial(_parse_by_column, schema=schemas.OPEN_POSITIONS))
+
+
+def _parse_by_column(data_raw, frame_builder, schema):
+    """
+    parse a dict of trades or positions whose keys are the names of the
+    columns of the schema, the first column is the id of the item
+    """
+    data = frame_builder(schema)
+
+    for trade in data_raw:
+        values = [trade]
+        values.extend([
+            (data_raw[trade][column] if column in data_raw[trade] else None)
+            for column in schema.columns[1:]])
+
+        data.append(values)
+
+    return data.build(columns=[
+        "order_id" if column == "ordertxid" else column
+        for column in schema.columns])
+
+
+# ==============================================================================
+# user trading
+
+def add_order(
+        ordertype,
+        buy_or_sell,
+        volume,
+        pair,
+        price,
+        price2=None,
+        userref=None,
+        leverage=None,
+        oflags=None,
+        starttm=0,
+        expiretm=0,
+        close_ordertype=None,
+        close_price=None,
+        close_price2=None,
+        deadline=None,
+        validate=False,
+        test_session=False):
+    """
+    :param test_session: if True the order is only validated by kraken
+    """
+    if ordertype not in ["market", "limit", "stop-loss", "take-profit", "stop-loss-limit",
+                         "take-profit-limit", "settle-position"]:
+        raise Exception(f"Invalid parameter for ordertype: {ordertype}")
+
+    if buy_or_sell not in ["buy", "sell"]:
+        raise Exception(f"Invalid parameter buy_or_sell: {buy_or_sell}")
+
+    if volume < 0:
+        raise Exception(
+            "Invalid parameter volume, the volume must be positive")
+
+    if ordertype in ["stop-loss-limit",
+                     "take-profit-limit"] and price2 is None:
+        raise Exception(
+            "Invalid parameters, price2 must be specified for the given ordertype")
+
+    if close_ordertype is not None and close_ordertype not in [
+            "limit", "stop-loss", "take-profit", "stop-loss-limit", "take-profit-limit"]:
+        raise Exception(
+            f"Invalid parameter close_ordertype: {close_ordertype}")
+
+    if validate not in [False, True]:
+        raise Exception(f"Invalid parameter validate: {validate}")
+
+    # defaults to True in the case of a test session
+    validate = True if test_session else validate
+
+    data = {
+        "ordertype": ordertype,
+        "type": buy_or_sell,
+        "pair": pair,
+        "volume": volume,
+        "price": price,
+        "starttm": starttm,
+        "expiretm": expiretm,
+        "validate": str(validate).lower(),
+    }
+
+    if userref is not None:
+        data["userref"] = userref
+    if price2 is not None:
+        data["price2"] = price2
+    if leverage is not None:
+        data["leverage"] = leverage
+    if oflags is not None:
+        data["oflags"] = oflags
+    if close_ordertype is not None and close_price is not None:
+        data["close[ordertype]"] = close_ordertype
+        data["close[price]"] = close_price
+
+        if close_price2 is not None:
+            data["close[price2]"] = close_price2
+    if deadline is not None:
+        data["deadline"] = deadline
+
+    return Call(
+        "AddOrder",
+        data,
+        private=True,
+        type_query="add_order",
+        pair=pair,
+        parse=_raw_result)
+
+
+# AddOrderBatch takes from 2 to 15 orders, all on the same pair
+MAX_ORDERS_PER_BATCH = 15
+
+# the parameters of add_order given per order in AddOrderBatch, the others
+# (pair, deadline, validate) are given once for the batch
+_BATCH_FIELDS = ["pair", "deadline", "validate"]
+
+
+def order_records(orders):
+    """
+    :param orders: a list of dicts or a dataframe, one order per item/row
+                   with the parameters of add_order as keys/columns
+    :return: a list of dicts without the missing values
+    """
+    if hasattr(orders, "to_dict"):
+        # the missing values turn the integer columns (userref) into floats
+        orders = [
+            {key: _from_frame(value) for key, value in order.items()}
+            for order in orders.to_dict("records")]
+
+    # the missing values of a dataframe are nan, the only value not equal
+    # to itself
+    return [
+        {key: value for key, value in order.items()
+         if value is not None and value == value}
+        for order in orders]
+
+
+def _from_frame(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def add_order_batches(orders, deadline=None, validate=False,
+                      test_session=False, refused=None):
+    """
+    check each order with the rules of add_order and group the valid ones
+    by pair in AddOrderBatch calls, a pair with a single order gets an
+    AddOrder call
+
+    :param orders: a list of dicts, see order_records
+    :param refused: a dict position -> error of the orders already refused,
+                    they are not sent
+    :return: a tuple (list of (positions of the orders, Call), dict position
+             -> error of the orders refused before sending them), the calls
+             parse into a list of (txid, description, error) per order
+    """
+    errors = dict(refused) if refused is not None else {}
+    groups = {}
+    for position, order in enumerate(orders):
+        if position in errors:
+            continue
+        try:
+            call = add_order(
+                **order,
+                deadline=deadline,
+                validate=validate,
+                test_session=test_session)
+        except Exception as e:
+            errors[position] = str(e)
+            continue
+        groups.setdefault(call.pair, []).append((position, call))
+
+    batches = []
+    for pair, calls in groups.items():
+        for start in range(0, len(calls), MAX_ORDERS_PER_BATCH):
+            chunk = calls[start:start + MAX_ORDERS_PER_BATCH]
+            positions = [position for position, _ in chunk]
+            if len(chunk) == 1:
+                call = chunk[0][1]
+                call.parse = _parse_single_order
+            else:
+                call = _add_order_batch([call for _, call in chunk], pair)
+            batches.append((positions, call))
+
+    return batches, errors
+
+
+def _add_order_batch(calls, pair):
+    # the fields of each order are bracket encoded, orders[0][price],
+    # orders[0][close][ordertype],...
+    data = {key: calls[0].data[key]
+            for key in _BATCH_FIELDS if key in calls[0].data}
+    for index, call in enumerate(calls):
+        for key, value in call.data.items():
+            if key in _BATCH_FIELDS:
+                continue
+            if key.startswith("close["):
+                key = "close][" + key[len("close["):-1]
+            data[f"orders[{index}][{key}]"] = value
+
+    return Call(
+        "AddOrderBatch",
+        data,
+        private=True,
+        type_query="add_order",
+        pair=pair,
+        parse=_parse_order_batch,
+        count=len(calls))
+
+
+def _parse_order_batch(result, frame_builder):
+    return [
+        (order.get("txid"), order.get("descr", {}).get("order"),
+         order.get("error"))
+        for order in result["orders"]]
+
+
+def _parse_single_order(result, frame_builder):
+    txid = result.get("txid")
+    if isinstance(txid, list):
+        txid = ",".join(txid)
+    return [(txid, result.get("descr", {}).get("order"), None)]
+
+
+def batch_outcomes(positions, res):
+    """
+    :param positions: the positions of the orders sent in the call
+    :param res: the parsed result of the call, or the error of kraken
+    :return: a dict position -> (txid, description, error)
+    """
+    if isinstance(res, list) and all(isinstance(item, tuple) for item in res):
+        return dict(zip(positions, res))
+
+    error = ", ".join(res) if isinstance(res, list) else str(res)
+    return {position: (None, None, error) for position in positions}
+
+
+def order_outcomes_frame(orders, outcomes, frame_builder):
+    """
+    :param orders: the orders, see order_records
+    :param outcomes: a dict position -> (txid, description, error) for
+                     every order
+    :return: a dataframe with one row per order, in the order given
+    """
+    data = frame_builder(schemas.ADD_ORDERS)
+    for position, order in enumerate(orders):
+        txid, description, error = outcomes[position]
+        data.append([
+            position,
+            order.get("pair"),
+            txid,
+            description,
+            error,
+        ])
+
+    return data.build()
+
+
+def cancel_order(txid, pair=None):
+    return Call(
+        "CancelOrder",
+        {"txid": txid},
+        private=True,
+        type_query="cancel_order",
+        pair=pair,
+        parse=_raw_result)
+
+
+# CancelOrderBatch takes at most 50 txids
+MAX_CANCELS_PER_BATCH = 50
+
+
+def cancel_order_batches(txids, pairs=None):
+    """
+    split the txids in CancelOrderBatch calls, the txids of a same pair are
+    cancelled together so the cancel penalty can be charged
+
+    :param txids: a list of transaction ids (or userrefs)
+    :param pairs: the pair of each txid, a single pair for all of them or
+                  None if unknown
+    :return: a list of (positions of the txids, Call), the calls parse into
+             the number of orders cancelled
+    """
+    if pairs is None or isinstance(pairs, str):
+        pairs = [pairs] * len(txids)
+
+    if len(pairs) != len(txids):
+        raise Exception(
+            f"Invalid pairs, expected {len(txids)} pairs, got {len(pairs)}")
+
+    groups = {}
+    for position, (txid, pair) in enumerate(zip(txids, pairs)):
+        groups.setdefault(pair, []).append(position)
+
+    batches = []
+    for pair, positions in groups.items():
+        for start in range(0, len(positions), MAX_CANCELS_PER_BATCH):
+            chunk = positions[start:start + MAX_CANCELS_PER_BATCH]
+            data = {
+                f"orders[{index}]": txids[position]
+                for index, position in enumerate(chunk)}
+            batches.append((chunk, Call(
+                "CancelOrderBatch",
+                data,
+                private=True,
+                type_query="cancel_order",
+                pair=pair,
+                parse=_parse_cancel_batch,
+                count=len(chunk))))
+
+    return batches
+
+
+def _parse_cancel_batch(result, frame_builder):
+    return int(result["count"])
+
+
+def cancel_outcomes_frame(txids, batches, answers, frame_builder):
+    """
+    kraken answers a CancelOrderBatch with the number of orders cancelled
+    only, the outcome of a txid is the one of its batch
+
+    :param txids: the txids asked
+    :param batches: the batches sent, see cancel_order_batches
+    :param answers: the parsed result of each batch, or its error
+    :return: a dataframe with one row per txid, in the order given
+    """
+    rows = [None] * len(txids)
+    for index, ((positions, _), res) in enumerate(zip(batches, answers)):
+        if isinstance(res, int):
+            count, error = res, None
+        else:
+            count = None
+            error = ", ".join(res) if isinstance(res, list) else str(res)
+
+        for position in positions:
+            rows[position] = [
+                txids[position],
+                index,
+                len(positions),
+                count,
+                count == len(positions),
+                error,
+            ]
+
+    data = frame_builder(schemas.CANCEL_ORDERS)
+    data.extend(rows)
+
+    return data.build()
+
+
+def cancel_all():
+    return Call(
+        "CancelAll",
+        private=True,
+        type_query="cancel_order",
+        parse=_raw_result)
+
+
+def cancel_all_orders_after(timeout):
+    return Call(
+        "CancelAllOrdersAfter",
+        {"timeout": timeout},
+        private=True,
+        type_query="cancel_order",
+        parse=_raw_result)
+
+
+def is_none_or_type(o, t):
+    return o is None or isinstance(o, t)
+
+
+def output_or_join_list(obj):
+    if isinstance(obj, list):
+        return ",".join(obj)
+    elif isinstance(obj, str):
+        return obj
+    else:
+        raise Exception(f"Unknown objet type: {obj}, {type(obj)}")
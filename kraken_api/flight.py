@@ -0,0 +1,123 @@
+import threading
+from functools import partial
+
+# identical public queries sent at the same moment by several callers are
+# sent once, the callers arriving while the query is in flight wait for it
+# and get the same parsed result
+
+
+def call_key(call):
+    """
+    :param call: an endpoints.Call
+    :return: a hashable key, equal for the calls sending the same query and
+             parsing its result the same way
+    """
+    data = tuple(sorted(
+        (name, str(value)) for name, value in (call.data or {}).items()))
+    return call.method, data, _parse_key(call.parse)
+
+
+def _parse_key(parse):
+    """
+    :return: the identity of a parser, the same for two partials of the same
+             function with the same arguments (depth and order_book both
+             send Depth with the same data but parse it differently)
+    """
+    if isinstance(parse, partial):
+        keywords = tuple(sorted(
+            (name, str(value)) for name, value in parse.keywords.items()))
+        return (_parse_key(parse.func),
+                tuple(str(arg) for arg in parse.args), keywords)
+
+    # a function is hashed by identity, a closure built for each call is
+    # never shared
+    return parse
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self):
+        """
+        coalesces the identical calls made by several threads
+        """
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def __len__(self):
+        return len(self._flights)
+
+    def do(self, key, function):
+        """
+        :param key: the key of the call
+        :param function: the function doing the call, run only if no call
+                         with the same key is in flight
+        :return: the result of function, the same object for every caller
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result
+
+
+class AsyncSingleFlight:
+
+    def __init__(self):
+        """
+        coalesces the identical calls made by several tasks of an event loop
+        """
+        self._flights = {}
+
+    def __len__(self):
+        return len(self._flights)
+
+    async def do(self, key, function):
+        """
+        :param key: the key of the call
+        :param function: a coroutine function doing the call
+        :return: the result of the coroutine, the same object for every
+                 caller
+        """
+        # imported here, it is already loaded when a coroutine runs and the
+        # threaded clients do not pay for it
+        import asyncio
+
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function())
+            self._flights[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+
+        # a caller cancelled does not cancel the query of the others
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
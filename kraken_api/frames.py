@@ -0,0 +1,378 @@
+import functools
+from collections import namedtuple
+from decimal import Decimal
+
+# numpy and pandas are imported by the functions building the frames, not at
+# the import of the module: a process only sending orders or checking the
+# time never loads them
+
+# building a dataframe row by row with pd.concat copies the whole frame at
+# each step, the builders here collect the values column by column and
+# create the dataframe only once
+
+# the kinds a column can be converted to:
+# - "object": the values are left as returned by kraken
+# - "float": float64, or Decimal when the exact mode is asked
+# - "int": int64, Int64 if some values are missing, float64 if some values
+#   are not integers, they are never truncated
+# - "time": datetime64[ns] from unix timestamps in seconds
+# - "category": pandas categorical, for columns with few distinct values
+# - "bool": numpy bool
+KINDS = ["object", "float", "int", "time", "category", "bool"]
+
+# the forms a builder can give its rows in, all typed by the same kinds:
+# - "pandas": a dataframe, typed as above
+# - "numpy": a structured array with one field per column, the "category"
+#   columns are objects and the "int" columns with missing or non integer
+#   values float64
+# - "records": a list of namedtuples, one per row, the "time" columns are
+#   unix timestamps in seconds (float)
+OUTPUTS = ["pandas", "numpy", "records"]
+
+
+class Schema:
+
+    def __init__(self, *fields):
+        """
+        the columns of a frame returned by an endpoint and how to type them
+
+        :param fields: tuples (column name, kind), see KINDS
+        """
+        for name, kind in fields:
+            if kind not in KINDS:
+                raise Exception(f"Invalid kind for column {name}: {kind}")
+
+        self.fields = list(fields)
+        self.columns = [name for name, _ in self.fields]
+        self.kinds = [kind for _, kind in self.fields]
+
+    def builder(self, exact=False, output="pandas"):
+        """
+        :param exact: convert the "float" columns to Decimal instead of float64
+        :param output: the form of the built rows, see OUTPUTS
+        :return: an empty FrameBuilder for this schema
+        """
+        return FrameBuilder(
+            self.columns, kinds=self.kinds, exact=exact, output=output)
+
+
+class FrameBuilder:
+
+    def __init__(self, columns, kinds=None, exact=False, output="pandas"):
+        """
+        collects rows in one list per column
+
+        :param columns: the names of the columns of the final dataframe,
+                        duplicated names are allowed, for the other outputs
+                        they get a suffix (see unique_names)
+        :param kinds: the kind of each column, if None the values are not
+                      converted
+        :param exact: convert the "float" columns to Decimal
+        :param output: the form of the built rows, see OUTPUTS
+        """
+        if kinds is not None and len(kinds) != len(columns):
+            raise Exception(
+                f"Invalid kinds, expected {len(columns)} kinds, got {len(kinds)}")
+
+        if output not in OUTPUTS:
+            raise Exception(f"Invalid parameter for output: {output}")
+
+        self.columns = list(columns)
+        self.kinds = list(kinds) if kinds is not None else None
+        self.exact = exact
+        self.output = output
+        self._data = [[] for _ in self.columns]
+
+    def __len__(self):
+        return len(self._data[0]) if self._data else 0
+
+    def append(self, values):
+        """
+        add a row to the builder
+
+        :param values: the values of the row, in the same order as the columns
+        """
+        if len(values) != len(self.columns):
+            raise Exception(
+                f"Invalid row, expected {len(self.columns)} values, got {len(values)}")
+
+        for column, value in zip(self._data, values):
+            column.append(value)
+
+    def extend(self, rows):
+        for values in rows:
+            self.append(values)
+
+    def build(self, columns=None):
+        """
+        create the dataframe from the collected rows
+
+        :param columns: the names of the columns of the result, by default
+                        the columns of the builder
+        :return: a dataframe with one row per appended row, or a structured
+                 array or a list of records, see output
+        """
+        names = list(columns) if columns is not None else self.columns
+        if self.output == "numpy":
+            return self._build_array(names)
+        elif self.output == "records":
+            return self._build_records(names)
+
+        import pandas as pd
+
+        if self.kinds is None:
+            if not len(self):
+                return pd.DataFrame(columns=names)
+            columns = self._data
+        else:
+            columns = [
+                convert_column(values, kind, self.exact)
+                for values, kind in zip(self._data, self.kinds)]
+
+        # the columns are first indexed by position, this way duplicated
+        # names are not lost in the dict
+        data = pd.DataFrame(dict(enumerate(columns)))
+        data.columns = names
+
+        return data
+
+    def _kinds(self):
+        return self.kinds if self.kinds is not None else \
+            ["object"] * len(self.columns)
+
+    def _build_array(self, names):
+        import numpy as np
+
+        arrays = [
+            convert_array(values, kind, self.exact)
+            for values, kind in zip(self._data, self._kinds())]
+        names = unique_names(names)
+
+        data = np.empty(
+            len(self),
+            dtype=[(name, array.dtype) for name, array in zip(names, arrays)])
+        for name, array in zip(names, arrays):
+            data[name] = array
+
+        return data
+
+    def _build_records(self, names):
+        record = record_type(tuple(unique_names(names)))
+        columns = [
+            convert_list(values, kind, self.exact)
+            for values, kind in zip(self._data, self._kinds())]
+
+        return list(map(record._make, zip(*columns)))
+
+
+def convert_column(values, kind, exact=False):
+    """
+    convert a list of raw values with vectorized operations
+
+    :param values: a list of values as returned by kraken (mostly strings)
+    :param kind: one of KINDS
+    :param exact: "float" columns are converted to Decimal if True
+    :return: a series
+    """
+    import numpy as np
+    import pandas as pd
+
+    if kind == "float":
+        if exact:
+            return pd.Series(
+                [to_decimal(value) for value in values], dtype=object)
+        return _to_numeric(values).astype("float64")
+    elif kind == "int":
+        column = _to_numeric(values)
+        if (column.dropna() % 1 != 0).any():
+            return column.astype("float64")
+        if column.isna().any():
+            return column.astype("Int64")
+        return column.astype("int64")
+    elif kind == "time":
+        # pandas 3 picks the unit from the values, datetime64[s] for integer
+        # timestamps
+        return pd.to_datetime(
+            _to_numeric(values).astype("float64"), unit="s"
+        ).astype("datetime64[ns]")
+    elif kind == "category":
+        return pd.Series(pd.Categorical(values))
+    elif kind == "bool":
+        return pd.Series(np.asarray(values, dtype=bool))
+    else:
+        return pd.Series(values, dtype=object)
+
+
+def convert_array(values, kind, exact=False):
+    """
+    convert a list of raw values to a numpy array, see convert_column
+
+    :return: a one dimension array
+    """
+    import numpy as np
+
+    if kind == "float" and not exact:
+        try:
+            # numpy parses the strings of kraken itself
+            return np.array(values, dtype="float64")
+        except (TypeError, ValueError):
+            return np.array(convert_list(values, kind), dtype="float64")
+    elif kind == "int":
+        ints = convert_list(values, kind)
+        if any(value is None or isinstance(value, float) for value in ints):
+            return np.array(
+                [np.nan if value is None else value for value in ints],
+                dtype="float64")
+        return np.array(ints, dtype="int64")
+    elif kind == "time":
+        seconds = np.array(convert_list(values, kind), dtype="float64")
+        missing = np.isnan(seconds)
+        seconds[missing] = 0.
+        # the whole seconds and the fraction apart, as pandas.to_datetime
+        # does, seconds * 1e9 is not exact and the two outputs would differ
+        # by some hundreds of nanoseconds
+        whole = seconds.astype("int64")
+        fraction = np.round(seconds - whole, 9)
+        times = (whole * 10 ** 9 + (fraction * 1e9).astype("int64")) \
+            .view("datetime64[ns]")
+        times[missing] = np.datetime64("NaT")
+        return times
+    elif kind == "bool":
+        return np.asarray(values, dtype=bool)
+
+    # fromiter keeps the lists of the values as objects, np.array would
+    # make them a second dimension
+    return np.fromiter(
+        convert_list(values, kind, exact), dtype=object, count=len(values))
+
+
+def convert_list(values, kind, exact=False):
+    """
+    convert a list of raw values in pure python, see convert_column, the
+    "time" columns are left as unix timestamps in seconds
+
+    :return: a list
+    """
+    if kind == "float" and exact:
+        return [to_decimal(value) for value in values]
+    elif kind in ["float", "time"]:
+        try:
+            return [float(value) for value in values]
+        except (TypeError, ValueError):
+            return [_to_float(value) for value in values]
+    elif kind == "int":
+        return [_to_int(value) for value in values]
+    elif kind == "bool":
+        return [bool(value) for value in values]
+    else:
+        return list(values)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _to_int(value):
+    # a value that is not an integer is kept as a float, not truncated
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        number = _to_float(value)
+        return int(number) if number.is_integer() else number
+
+
+def unique_names(columns):
+    """
+    :param columns: names of columns, some of them repeated (the orders have
+                    two "price" columns)
+    :return: the names with a suffix _1, _2... added to the repetitions
+    """
+    used = set(columns)
+    taken = set()
+    names = []
+    for name in columns:
+        unique, suffix = name, 0
+        while unique in taken or unique != name and unique in used:
+            suffix += 1
+            unique = f"{name}_{suffix}"
+        taken.add(unique)
+        names.append(unique)
+
+    return names
+
+
+@functools.lru_cache(maxsize=None)
+def record_type(names):
+    """
+    :param names: a tuple of unique names of columns
+    :return: the namedtuple class of the rows having these columns
+    """
+    return namedtuple("Record", names, rename=True)
+
+
+def _to_numeric(values):
+    import pandas as pd
+
+    return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce")
+
+
+def to_decimal(value):
+    if value is None or value == "":
+        return None
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def build_frame(columns, rows):
+    """
+    build a dataframe in one allocation from an iterable of rows
+
+    :param columns: the names of the columns, or a Schema
+    :param rows: an iterable of lists of values
+    :return: a dataframe
+    """
+    if isinstance(columns, Schema):
+        builder = columns.builder()
+    else:
+        builder = FrameBuilder(columns)
+    builder.extend(rows)
+    return builder.build()
+
+
+def collect(frames):
+    """
+    concatenate the frames of a paginated query in one allocation
+
+    :param frames: an iterable of frames with the same columns, as returned
+                   by Kapi.iter_trades_history
+    :return: a single dataframe, empty if there was no frame, or a single
+             structured array or list of records if the frames have one of
+             these forms
+    """
+    frames = list(frames)
+    if frames and isinstance(frames[0], list):
+        return [record for frame in frames for record in frame]
+    # a structured array has a dtype, a dataframe only dtypes
+    if frames and hasattr(frames[0], "dtype"):
+        import numpy as np
+        return np.concatenate(frames)
+
+    import pandas as pd
+
+    if not frames:
+        return pd.DataFrame()
+
+    data = pd.concat(frames, ignore_index=True)
+
+    # categoricals with different categories are concatenated as objects
+    for name, dtype in frames[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and \
+                list(data.columns).count(name) == 1 and \
+                not isinstance(data[name].dtype, pd.CategoricalDtype):
+            data[name] = data[name].astype("category")
+
+    return data
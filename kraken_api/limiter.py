@@ -0,0 +1,313 @@
+import contextlib
+import threading
+import time
+
+# see https://docs.kraken.com/rest/#section/Rate-Limits
+# the api counter is charged by every call except the trading ones, the order
+# rate counter is charged by the trading calls, both decay with time at a
+# speed depending on the account tier
+
+QUERY_TYPES = ["ledger/trade", "add_order", "other", "cancel_order"]
+
+# the largest charge of a query to the api counter, the ledger queries
+_MAX_API_COST = 2
+
+# the classes of queries, from the most to the least urgent, a query waits
+# as long as a query of a more urgent class is waiting
+PRIORITIES = ["trading", "account", "market", "backfill"]
+
+# the part of the api counter each class leaves free for the more urgent ones
+RESERVES = {"trading": 0., "account": 0.1, "market": 0.2, "backfill": 0.4}
+
+# the backfill also leaves free the recent consumption of the other classes,
+# forgotten with this half-life in seconds, so it slows down while the
+# trading and the polling are busy and speeds up when they are idle
+DEMAND_HALF_LIFE = 10.
+
+# the delay before checking again when a more urgent query is waiting
+_PREEMPTED_WAIT = 0.05
+
+
+class RateLimitExceeded(Exception):
+
+    def __init__(self, type_query, wait):
+        super().__init__(
+            f"Rate limit reached for query {type_query}, retry in {wait:.3f}s")
+        self.type_query = type_query
+        self.wait = wait
+
+
+class RateLimiter:
+
+    def __init__(self, account_type="starter", reserves=None):
+        """
+        token bucket model of the kraken rate limits, the counters are
+        checked and charged before the query is sent
+
+        the queries given a priority (one of PRIORITIES) are scheduled: the
+        less urgent ones leave a reserve of the api counter free and wait
+        while a more urgent one is waiting, the queries without priority are
+        first come first served
+
+        :param account_type: "starter", "intermediate" or "pro"
+        :param reserves: a dict priority -> part of the api counter left free,
+                         to change some of RESERVES, a class must keep room
+                         for a ledger query
+        """
+        if account_type not in ["starter", "intermediate", "pro"]:
+            raise Exception(
+                f"Invalid parameter for account_type: {account_type}")
+
+        self.max_api_counter = {
+            "starter": 15,
+            "intermediate": 20,
+            "pro": 20,
+        }[account_type]
+        self.api_counter = 0.
+
+        # any class can be given a ledger query, with less room than its
+        # cost the query would wait forever
+        self.reserves = dict(RESERVES)
+        for priority, reserve in (reserves or {}).items():
+            if priority not in PRIORITIES or not 0 <= reserve < 1 or \
+                    self.max_api_counter * (1 - reserve) < _MAX_API_COST:
+                raise Exception(
+                    f"Invalid reserve for {priority}: {reserve}")
+            self.reserves[priority] = reserve
+
+        self.max_num_orders = {
+            "starter": 60,
+            "intermediate": 80,
+            "pro": 225,
+        }[account_type]
+        self.order_counter = 0
+
+        self.max_rate_count = {
+            "starter": 60,
+            "intermediate": 125,
+            "pro": 180,
+        }[account_type]
+        self.order_rate_counter = 0.
+
+        self.api_counter_decay = {
+            "starter": 0.33,
+            "intermediate": 0.5,
+            "pro": 1.,
+        }[account_type]
+
+        self.ratecount_decay = {
+            "starter": 1.,
+            "intermediate": 2.34,
+            "pro": 3.75,
+        }[account_type]
+
+        # the counters are shared by all the threads using the same Kapi,
+        # every read-modify-write is done holding the lock
+        self._lock = threading.RLock()
+
+        self._last_query_time = None
+        # time of the last order added for each pair, the cancel penalty
+        # depends on the age of the order cancelled
+        self._last_order_time = {}
+
+        # the number of queries waiting in acquire for each priority
+        self._waiting = {priority: 0 for priority in PRIORITIES}
+        # the api counter recently charged by the classes above the backfill
+        self._demand = 0.
+
+    def _decay(self, now):
+        if self._last_query_time is not None:
+            delta = max(0., now - self._last_query_time)
+            self.api_counter = max(
+                0., self.api_counter - delta * self.api_counter_decay)
+            self.order_rate_counter = max(
+                0., self.order_rate_counter - delta * self.ratecount_decay)
+            self._demand *= 0.5 ** (delta / DEMAND_HALF_LIFE)
+
+        self._last_query_time = now
+
+    def _check_priority(self, priority):
+        if priority is not None and priority not in PRIORITIES:
+            raise Exception(f"Invalid priority parameter: {priority}")
+
+    def _preempted(self, priority):
+        """
+        :return: True if a query more urgent than priority is waiting
+        """
+        if priority is None:
+            return False
+        index = PRIORITIES.index(priority)
+        return any(self._waiting[urgent] for urgent in PRIORITIES[:index])
+
+    def _api_limit(self, priority):
+        """
+        :return: the value of the api counter a query of this priority can
+                 reach
+        """
+        if priority is None:
+            return self.max_api_counter
+
+        limit = self.max_api_counter * (1 - self.reserves[priority])
+        if priority == "backfill":
+            limit -= self._demand
+        return limit
+
+    def costs(self, type_query, pair=None, now=None, count=1):
+        """
+        :param type_query: one of QUERY_TYPES
+        :param pair: the pair of the order added or cancelled
+        :param now: the time of the query, defaults to now
+        :param count: the number of orders added or cancelled by the query,
+                      for the batch methods
+        :return: a tuple (cost for the api counter, cost for the order rate
+                 counter)
+        """
+        if type_query not in QUERY_TYPES:
+            raise Exception(f"Invalid type query parameter: {type_query}")
+
+        if type_query == "ledger/trade":
+            return _MAX_API_COST, 0
+        elif type_query == "other":
+            return 1, 0
+        elif type_query == "add_order":
+            return 0, count
+
+        if pair is None or pair not in self._last_order_time:
+            return 0, 0
+
+        now = time.time() if now is None else now
+        delta = now - self._last_order_time[pair]
+
+        penalty = 0
+        if delta < 5:
+            penalty = 8
+        elif delta < 10:
+            penalty = 6
+        elif delta < 15:
+            penalty = 5
+        elif delta < 45:
+            penalty = 4
+        elif delta < 90:
+            penalty = 2
+        elif delta < 300:
+            penalty = 1
+
+        return 0, penalty * count
+
+    def wait_time(self, type_query, pair=None, now=None, count=1,
+                  priority=None):
+        """
+        :param priority: one of PRIORITIES, None for no scheduling
+        :return: the number of seconds to wait before the query fits in the
+                 budget, 0 if it can be sent now
+        """
+        self._check_priority(priority)
+
+        with self._lock:
+            now = time.time() if now is None else now
+            self._decay(now)
+            api_cost, rate_cost = self.costs(type_query, pair, now, count)
+
+            wait = _PREEMPTED_WAIT if self._preempted(priority) else 0.
+            if api_cost:
+                excess = self.api_counter + api_cost - \
+                    self._api_limit(priority)
+                wait = max(wait, excess / self.api_counter_decay)
+            if rate_cost:
+                excess = self.order_rate_counter + rate_cost - self.max_rate_count
+                wait = max(wait, excess / self.ratecount_decay)
+
+            return wait
+
+    def try_acquire(self, type_query, pair=None, now=None, count=1,
+                    priority=None):
+        """
+        charge the counters if the query fits in the budget
+
+        :param priority: one of PRIORITIES, None for no scheduling
+        :return: 0 if the counters were charged, else the number of seconds
+                 to wait before trying again
+        """
+        if type_query == "add_order" and pair is None:
+            raise Exception("You must provide a pair when adding orders")
+
+        with self._lock:
+            now = time.time() if now is None else now
+            wait = self.wait_time(type_query, pair, now, count, priority)
+            if wait > 0:
+                return wait
+
+            api_cost, rate_cost = self.costs(type_query, pair, now, count)
+            self.api_counter += api_cost
+            self.order_rate_counter += rate_cost
+            if priority is not None and priority != "backfill":
+                self._demand += api_cost
+
+            if type_query in ["add_order", "cancel_order"]:
+                self.order_counter += count
+            if type_query == "add_order":
+                self._last_order_time[pair] = now
+
+            return 0.
+
+    def acquire(self, type_query, pair=None, blocking=True, count=1,
+                priority=None):
+        """
+        charge the counters, waiting only as long as needed for the query to
+        fit in the budget
+
+        :param blocking: if False raise RateLimitExceeded instead of waiting
+        :param priority: one of PRIORITIES, None for no scheduling
+        """
+        wait = self.try_acquire(type_query, pair, count=count,
+                                priority=priority)
+        if wait <= 0:
+            return
+        if not blocking:
+            raise RateLimitExceeded(type_query, wait)
+
+        # only the queries waiting for the api counter hold back the others,
+        # adding and cancelling orders use the order rate counter which the
+        # other queries never charge
+        api_cost, _ = self.costs(type_query, pair, count=count)
+
+        # the sleep is done without holding the lock so the other threads
+        # can still charge the counters meanwhile
+        with self.waiting(priority if api_cost else None):
+            while wait > 0:
+                time.sleep(wait)
+                wait = self.try_acquire(type_query, pair, count=count,
+                                        priority=priority)
+
+    @contextlib.contextmanager
+    def waiting(self, priority):
+        """
+        marks a query of this priority as waiting for the budget, the less
+        urgent queries are held back meanwhile
+        """
+        self._check_priority(priority)
+        if priority is None:
+            yield
+            return
+
+        with self._lock:
+            self._waiting[priority] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._waiting[priority] -= 1
+
+    def counters(self):
+        with self._lock:
+            return {
+                "api_counter": self.api_counter,
+                "api_counter_decay": self.api_counter_decay,
+                "max_api_counter": self.max_api_counter,
+                "order_counter": self.order_counter,
+                "order_counter_decay": self.ratecount_decay,
+                "order_rate_counter": self.order_rate_counter,
+                "max_num_orders": self.max_num_orders,
+                "max_ratecount": self.max_rate_count,
+                "waiting": dict(self._waiting),
+            }
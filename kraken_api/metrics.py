@@ -0,0 +1,251 @@
+import bisect
+import threading
+
+# the upper bounds in seconds of the buckets of the latency histograms
+BUCKETS = [
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.]
+
+_PREFIX = "kraken_api"
+
+
+class Histogram:
+
+    def __init__(self, buckets=BUCKETS):
+        """
+        counts of observations per bucket, as the histograms of Prometheus
+
+        :param buckets: the sorted upper bounds of the buckets, a last bucket
+                        without bound is added
+        """
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        :return: a list of (upper bound, number of observations below it),
+                 the last bound is inf
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics:
+
+    def __init__(self, buckets=BUCKETS):
+        """
+        latency, size and error statistics of the queries of a Kapi, per
+        kraken method, filled when given to Kapi(metrics=...)
+
+        - wait: the time spent waiting for the rate limits
+        - network: the time of the http query, up to the decoded json
+        - parse: the time to build the returned frames
+        - bytes: the size of the answers, when the transport knows it
+        - rows: the number of rows of the returned frames
+        - errors: the kraken error codes ("EAPI:Rate limit exceeded") and the
+          exceptions of the transport
+
+        :param buckets: the upper bounds of the latency histograms
+        """
+        self.buckets = list(buckets)
+
+        self._lock = threading.Lock()
+        self._histograms = {"wait": {}, "network": {}, "parse": {}}
+        self._bytes = {}
+        self._rows = {}
+        self._calls = {}
+        self._errors = {}
+        self._hooks = []
+        self._counters = None
+
+    def __repr__(self):
+        return f"Metrics({sum(self._calls.values())} calls)"
+
+    def add_hook(self, hook):
+        """
+        :param hook: a function called with a dict for each observation:
+                     {"method", "stage" ("wait", "network" or "parse"),
+                     "seconds", and "bytes", "errors" for "network", "rows"
+                     for "parse"}, it runs in the thread of the query
+        """
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def _observe(self, stage, method, seconds):
+        histograms = self._histograms[stage]
+        if method not in histograms:
+            histograms[method] = Histogram(self.buckets)
+        histograms[method].observe(seconds)
+
+    def _notify(self, event):
+        for hook in self._hooks:
+            hook(event)
+
+    def observe_wait(self, method, seconds):
+        with self._lock:
+            self._observe("wait", method, seconds)
+        self._notify({"method": method, "stage": "wait", "seconds": seconds})
+
+    def observe_network(self, method, seconds, size=None, errors=None):
+        """
+        :param size: the number of bytes of the answer, None if unknown
+        :param errors: the list of error codes of the answer
+        """
+        errors = errors or []
+        with self._lock:
+            self._observe("network", method, seconds)
+            self._calls[method] = self._calls.get(method, 0) + 1
+            if size is not None:
+                self._bytes[method] = self._bytes.get(method, 0) + size
+            for error in errors:
+                key = (method, error)
+                self._errors[key] = self._errors.get(key, 0) + 1
+        self._notify({
+            "method": method,
+            "stage": "network",
+            "seconds": seconds,
+            "bytes": size,
+            "errors": errors,
+        })
+
+    def observe_parse(self, method, seconds, rows=None):
+        with self._lock:
+            self._observe("parse", method, seconds)
+            if rows is not None:
+                self._rows[method] = self._rows.get(method, 0) + rows
+        self._notify({
+            "method": method,
+            "stage": "parse",
+            "seconds": seconds,
+            "rows": rows,
+        })
+
+    def track_budget(self, counters):
+        """
+        :param counters: a function returning the rate counters, as
+                         Kapi.user_counters, read at each export
+        """
+        self._counters = counters
+
+    def headroom(self):
+        """
+        :return: the part of each rate budget still available, from 0 to 1
+        """
+        if self._counters is None:
+            return {}
+
+        counters = self._counters()
+        return {
+            "api": 1 - counters["api_counter"] / counters["max_api_counter"],
+            "order_rate":
+                1 - counters["order_rate_counter"] / counters["max_ratecount"],
+        }
+
+    def snapshot(self):
+        """
+        :return: a dict with, per method, the number of calls, the count, sum
+                 and mean of each latency, the bytes, the rows and the errors
+        """
+        with self._lock:
+            methods = set(self._calls)
+            for histograms in self._histograms.values():
+                methods.update(histograms)
+
+            result = {}
+            for method in sorted(methods):
+                stats = {"calls": self._calls.get(method, 0)}
+                for stage, histograms in self._histograms.items():
+                    histogram = histograms.get(method)
+                    if histogram is None:
+                        continue
+                    stats[f"{stage}_count"] = histogram.count
+                    stats[f"{stage}_seconds"] = histogram.sum
+                    stats[f"{stage}_mean"] = histogram.sum / histogram.count
+                stats["bytes"] = self._bytes.get(method, 0)
+                stats["rows"] = self._rows.get(method, 0)
+                stats["errors"] = {
+                    error: count
+                    for (name, error), count in self._errors.items()
+                    if name == method}
+                result[method] = stats
+
+        return result
+
+    def to_prometheus(self):
+        """
+        :return: the metrics in the text format of Prometheus
+        """
+        lines = []
+        with self._lock:
+            for stage, histograms in self._histograms.items():
+                name = f"{_PREFIX}_{stage}_seconds"
+                lines.append(f"# TYPE {name} histogram")
+                for method in sorted(histograms):
+                    histogram = histograms[method]
+                    for bound, count in histogram.cumulative():
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(
+                            f'{name}_bucket{{method="{method}",le="{le}"}} {count}')
+                    lines.append(
+                        f'{name}_sum{{method="{method}"}} {histogram.sum!r}')
+                    lines.append(
+                        f'{name}_count{{method="{method}"}} {histogram.count}')
+
+            for stage, values in [("calls", self._calls),
+                                  ("response_bytes", self._bytes),
+                                  ("rows", self._rows)]:
+                name = f"{_PREFIX}_{stage}_total"
+                lines.append(f"# TYPE {name} counter")
+                for method in sorted(values):
+                    lines.append(
+                        f'{name}{{method="{method}"}} {values[method]}')
+
+            name = f"{_PREFIX}_errors_total"
+            lines.append(f"# TYPE {name} counter")
+            for (method, error), count in sorted(self._errors.items()):
+                error = error.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(
+                    f'{name}{{method="{method}",error="{error}"}} {count}')
+
+        name = f"{_PREFIX}_budget_headroom"
+        lines.append(f"# TYPE {name} gauge")
+        for budget, value in self.headroom().items():
+            lines.append(f'{name}{{budget="{budget}"}} {value!r}')
+
+        return "\n".join(lines) + "\n"
+
+
+def count_rows(result):
+    """
+    :return: the number of rows of a parsed result (a frame, a structured
+             array, a list of records or a tuple starting with one of them),
+             None for the other results
+    """
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    if hasattr(result, "shape"):
+        return result.shape[0]
+    if isinstance(result, list):
+        return len(result)
+    return None
+
+
+def error_codes(res):
+    """
+    :param res: the answer of kraken unwrapped, the list of errors if any
+    """
+    if isinstance(res, list):
+        return [str(error) for error in res]
+    return []
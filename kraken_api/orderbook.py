@@ -0,0 +1,265 @@
+import numpy as np
+
+# a side of the book is a pair of float64 arrays (prices, volumes) sorted from
+# the best level to the worst one: increasing prices for the asks, decreasing
+# prices for the bids, this way the best price is always at index 0
+
+_EMPTY = np.empty(0, dtype="float64")
+
+
+class OrderBook:
+
+    def __init__(self, pair, asks=None, bids=None, depth=None):
+        """
+        a local L2 order book kept in numpy arrays, the queries (best prices,
+        cumulative volume, vwap, slippage) never build a dataframe
+
+        :param pair: the pair of the book
+        :param asks: the asks levels as returned by kraken, [price, volume,
+                     timestamp] lists in any order
+        :param bids: the bids levels, same format
+        :param depth: if given only the depth best levels of each side are
+                      kept after each update, as kraken does for its books
+        """
+        self.pair = pair
+        self.depth = depth
+        self.time = None
+
+        self._asks = (_EMPTY, _EMPTY)
+        self._bids = (_EMPTY, _EMPTY)
+        self._cumulated = {}
+
+        self.replace(asks or [], bids or [])
+
+    def __repr__(self):
+        return f"OrderBook({self.pair}, bid={self.best_bid}, ask={self.best_ask})"
+
+    def __len__(self):
+        return len(self._asks[0]) + len(self._bids[0])
+
+    @classmethod
+    def from_depth(cls, result, pair=None, depth=None):
+        """
+        :param result: the result of a Depth query, {pair: {"asks": [...],
+                       "bids": [...]}}, or directly the {"asks", "bids"} dict
+        :param pair: the pair to take from the result, the first one if None
+        :param depth: see OrderBook
+        """
+        if "asks" not in result:
+            if pair is None or pair not in result:
+                pair = next(iter(result))
+            result = result[pair]
+
+        return cls(pair, result["asks"], result["bids"], depth=depth)
+
+    # ==========================================================================
+    # updates
+
+    def replace(self, asks, bids):
+        """
+        replace the whole book with a new snapshot
+        """
+        self._asks = _side(asks, ascending=True, depth=self.depth)
+        self._bids = _side(bids, ascending=False, depth=self.depth)
+        self._cumulated = {}
+        self._update_time(asks, bids)
+
+    def update(self, asks=None, bids=None):
+        """
+        apply level diffs, a level with a volume of 0 is removed, any other
+        level replaces the level of the same price
+
+        :param asks: the changed asks levels, [price, volume, ...] lists
+        :param bids: the changed bids levels
+        """
+        if asks:
+            self._asks = _merge(
+                self._asks, asks, ascending=True, depth=self.depth)
+        if bids:
+            self._bids = _merge(
+                self._bids, bids, ascending=False, depth=self.depth)
+
+        self._cumulated = {}
+        self._update_time(asks or [], bids or [])
+
+    def _update_time(self, asks, bids):
+        times = [float(level[2]) for level in asks if len(level) > 2]
+        times += [float(level[2]) for level in bids if len(level) > 2]
+        if times:
+            self.time = max(times + ([self.time] if self.time else []))
+
+    # ==========================================================================
+    # queries
+
+    @property
+    def asks(self):
+        """
+        :return: (prices, volumes) of the asks, best level first
+        """
+        return self._asks
+
+    @property
+    def bids(self):
+        """
+        :return: (prices, volumes) of the bids, best level first
+        """
+        return self._bids
+
+    @property
+    def best_ask(self):
+        prices = self._asks[0]
+        return prices[0] if len(prices) else np.nan
+
+    @property
+    def best_bid(self):
+        prices = self._bids[0]
+        return prices[0] if len(prices) else np.nan
+
+    @property
+    def spread(self):
+        return self.best_ask - self.best_bid
+
+    @property
+    def mid(self):
+        return (self.best_ask + self.best_bid) / 2
+
+    def _side(self, side):
+        if side == "ask":
+            return self._asks
+        elif side == "bid":
+            return self._bids
+        else:
+            raise Exception(f"Invalid parameter for side: {side}")
+
+    def _taken_side(self, buy_or_sell):
+        # a buy order is filled by the asks, a sell order by the bids
+        if buy_or_sell == "buy":
+            return "ask"
+        elif buy_or_sell == "sell":
+            return "bid"
+        else:
+            raise Exception(
+                f"Invalid parameter for buy_or_sell: {buy_or_sell}")
+
+    def _cumulative(self, side):
+        # the cumulated volumes and notionals are computed once per update
+        if side not in self._cumulated:
+            prices, volumes = self._side(side)
+            self._cumulated[side] = (
+                np.cumsum(volumes), np.cumsum(prices * volumes))
+        return self._cumulated[side]
+
+    def cumulative_volume(self, side):
+        """
+        :param side: "ask" or "bid"
+        :return: (prices, cumulated volumes), the volume available from the
+                 best level down to each price
+        """
+        return self._side(side)[0], self._cumulative(side)[0]
+
+    def volume_within(self, side, price):
+        """
+        :param side: "ask" or "bid"
+        :param price: a price or an array of prices
+        :return: the volume of the levels at least as good as price
+        """
+        prices, _ = self._side(side)
+        cumulated, _ = self._cumulative(side)
+        price = np.asarray(price, dtype="float64")
+
+        if side == "ask":
+            count = np.searchsorted(prices, price, side="right")
+        else:
+            count = np.searchsorted(-prices, -price, side="right")
+
+        total = np.concatenate(([0.0], cumulated))[count]
+        return total if total.ndim else float(total)
+
+    def vwap(self, buy_or_sell, volume):
+        """
+        the average price of a market order of the given volume filled by the
+        current book
+
+        :param buy_or_sell: "buy" (filled by the asks) or "sell"
+        :param volume: a volume or an array of volumes
+        :return: the average price, nan when the book is not deep enough
+        """
+        side = self._taken_side(buy_or_sell)
+        prices, _ = self._side(side)
+        cumulated, notional = self._cumulative(side)
+        volume = np.asarray(volume, dtype="float64")
+
+        if not len(prices):
+            average = np.full(volume.shape, np.nan)
+            return average if average.ndim else float(average)
+
+        # the level where the order ends, the levels before it are taken
+        # entirely and this one partially
+        last = np.searchsorted(cumulated, volume, side="left")
+        enough = last < len(prices)
+        last = np.minimum(last, len(prices) - 1)
+
+        volume_before = np.where(last > 0, cumulated[last - 1], 0.0)
+        notional_before = np.where(last > 0, notional[last - 1], 0.0)
+        total = notional_before + (volume - volume_before) * prices[last]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            average = np.where(volume > 0, total / volume, prices[0])
+        average = np.where(enough, average, np.nan)
+
+        return average if average.ndim else float(average)
+
+    def slippage(self, buy_or_sell, volume):
+        """
+        :return: the relative cost of a market order of the given volume
+                 compared to the best price, positive when the order moves
+                 the price against it, nan when the book is not deep enough
+        """
+        average = self.vwap(buy_or_sell, volume)
+        if buy_or_sell == "buy":
+            best = self.best_ask
+            return (average - best) / best
+        else:
+            best = self.best_bid
+            return (best - average) / best
+
+
+def _side(levels, ascending, depth=None):
+    """
+    :param levels: [price, volume, ...] lists as returned by kraken
+    :return: (prices, volumes) sorted from the best level, without the empty
+             levels
+    """
+    if not len(levels):
+        return _EMPTY, _EMPTY
+
+    prices = np.array([level[0] for level in levels], dtype="float64")
+    volumes = np.array([level[1] for level in levels], dtype="float64")
+
+    return _sorted(prices, volumes, ascending, depth)
+
+
+def _sorted(prices, volumes, ascending, depth):
+    keep = volumes > 0
+    prices = prices[keep]
+    volumes = volumes[keep]
+
+    order = np.argsort(prices if ascending else -prices, kind="stable")
+    if depth is not None:
+        order = order[:depth]
+
+    return prices[order], volumes[order]
+
+
+def _merge(current, levels, ascending, depth=None):
+    # reversed so that the last diff of a price wins
+    prices = np.array([level[0] for level in levels[::-1]], dtype="float64")
+    volumes = np.array([level[1] for level in levels[::-1]], dtype="float64")
+
+    # the new levels are put first, np.unique keeps the first occurrence of
+    # each price so they replace the current levels of the same price
+    prices = np.concatenate((prices, current[0]))
+    volumes = np.concatenate((volumes, current[1]))
+    prices, first = np.unique(prices, return_index=True)
+
+    return _sorted(prices, volumes[first], ascending, depth)
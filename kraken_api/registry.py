@@ -0,0 +1,246 @@
+import threading
+import time
+
+# seconds before a failed load is tried again, the lookups meanwhile fail at
+# once instead of charging two queries each to the rate counters
+RETRY_DELAY = 30
+
+
+class PairRegistry:
+
+    def __init__(self, kapi, ttl=3600, background=True):
+        """
+        the AssetPairs and Assets data of kraken, loaded once and indexed by
+        every name a pair or an asset can have
+
+        the data is loaded at the first lookup, when it is older than ttl the
+        lookups keep answering with it while a background thread reloads it
+
+        :param kapi: the Kapi used to load the data, or an AsyncKapi loading
+                     it with async_load
+        :param ttl: the number of seconds the data is considered fresh
+        :param background: if False an expired registry is reloaded in the
+                           lookup itself
+        """
+        self.kapi = kapi
+        self.ttl = ttl
+        self.background = background
+
+        self._lock = threading.Lock()
+        # held during the loads done in a lookup, the threads arriving
+        # meanwhile wait for the data instead of loading it again
+        self._load_lock = threading.Lock()
+        self._async_load_lock = None
+        self._refreshing = False
+        self._loaded_at = None
+        self._failed_at = None
+        self._load_error = None
+
+        self._pairs = {}
+        self._pair_names = {}
+        self._assets = {}
+        self._asset_names = {}
+
+    def __repr__(self):
+        return f"PairRegistry({len(self._pairs)} pairs, {len(self._assets)} assets)"
+
+    def load(self):
+        """
+        query AssetPairs and Assets and rebuild the indexes
+        """
+        res_pairs = self.kapi._public_query("AssetPairs", {"info": "info"})
+        res_assets = self.kapi._public_query("Assets")
+        self._index(res_pairs, res_assets)
+
+    def _index(self, res_pairs, res_assets):
+        if "result" not in res_pairs or "result" not in res_assets:
+            raise Exception(
+                f"Error while loading the pairs: {res_pairs}, {res_assets}")
+
+        pairs = {}
+        pair_names = {}
+        for key, record in res_pairs["result"].items():
+            record = dict(record, pair=key)
+            pairs[key] = record
+
+            names = [key, record.get("altname"), record.get("wsname")]
+            if record.get("wsname"):
+                names.append(record["wsname"].replace("/", ""))
+            for name in names:
+                if name:
+                    pair_names.setdefault(name.upper(), key)
+
+        assets = {}
+        asset_names = {}
+        for key, record in res_assets["result"].items():
+            record = dict(record, asset=key)
+            assets[key] = record
+            for name in [key, record.get("altname")]:
+                if name:
+                    asset_names.setdefault(name.upper(), key)
+
+        # the indexes are replaced at once, lookups running meanwhile see
+        # either the old or the new data
+        with self._lock:
+            self._pairs = pairs
+            self._pair_names = pair_names
+            self._assets = assets
+            self._asset_names = asset_names
+            self._loaded_at = time.time()
+            self._refreshing = False
+
+    def _fresh(self):
+        return self._loaded_at is not None and \
+            time.time() - self._loaded_at < self.ttl
+
+    def _failed_recently(self):
+        return self._failed_at is not None and \
+            time.time() - self._failed_at < RETRY_DELAY
+
+    def _ensure_loaded(self):
+        if self._fresh():
+            return
+
+        if self._loaded_at is not None and self.background:
+            # the stale data is served until the next try after a failed
+            # refresh, the lookups do not reload it each
+            with self._lock:
+                if self._refreshing or self._failed_recently():
+                    return
+                self._refreshing = True
+
+            thread = threading.Thread(target=self._refresh, daemon=True)
+            thread.start()
+            return
+
+        with self._load_lock:
+            # loaded by another thread while this one was waiting
+            if self._fresh():
+                return
+
+            if self._failed_recently():
+                raise self._load_error
+
+            try:
+                self.load()
+            except Exception as e:
+                self._failed_at = time.time()
+                self._load_error = e
+                raise
+
+            self._failed_at = None
+            self._load_error = None
+
+    async def async_load(self):
+        """
+        the loading of _ensure_loaded for the registry of an AsyncKapi, the
+        data is queried with its coroutines and the lookups made after it
+        find the data loaded, or raise the error of the load
+        """
+        if self._fresh():
+            return
+
+        # created here, in the event loop of the AsyncKapi
+        if self._async_load_lock is None:
+            import asyncio
+            self._async_load_lock = asyncio.Lock()
+
+        async with self._async_load_lock:
+            if self._fresh():
+                return
+
+            if self._failed_recently():
+                raise self._load_error
+
+            try:
+                res_pairs = await self.kapi._public_query(
+                    "AssetPairs", {"info": "info"})
+                res_assets = await self.kapi._public_query("Assets")
+                self._index(res_pairs, res_assets)
+            except Exception as e:
+                self._failed_at = time.time()
+                self._load_error = e
+                raise
+
+            self._failed_at = None
+            self._load_error = None
+
+    def _refresh(self):
+        try:
+            with self._load_lock:
+                self.load()
+        except Exception as e:
+            with self._lock:
+                self._failed_at = time.time()
+                self._load_error = e
+                self._refreshing = False
+        else:
+            self._failed_at = None
+            self._load_error = None
+
+    def canonical(self, name):
+        """
+        :param name: a pair as the canonical key ("XXBTZEUR"), the altname
+                     ("XBTEUR") or the wsname ("XBT/EUR")
+        :return: the canonical key, or None if the pair is unknown
+        """
+        self._ensure_loaded()
+        return self._pair_names.get(name.upper())
+
+    def normalize(self, pair):
+        """
+        :param pair: a pair, a comma separated string of pairs or a list of
+                     pairs
+        :return: the same with the canonical keys, the unknown names are kept
+                 as they are, and all of them if the registry cannot be
+                 loaded: kraken checks the names anyway
+        """
+        try:
+            self._ensure_loaded()
+        except Exception:
+            return pair
+
+        if isinstance(pair, list):
+            return [self.normalize(name) for name in pair]
+        if "," in pair:
+            return ",".join(self.normalize(name) for name in pair.split(","))
+
+        return self.canonical(pair) or pair
+
+    def get(self, name, default=None):
+        """
+        :return: the full AssetPairs record of the pair (lot_decimals,
+                 pair_decimals, ordermin, fees, fees_maker,...) with its
+                 canonical key under "pair"
+        """
+        key = self.canonical(name)
+        return self._pairs.get(key, default) if key is not None else default
+
+    def __getitem__(self, name):
+        record = self.get(name)
+        if record is None:
+            raise KeyError(name)
+        return record
+
+    def __contains__(self, name):
+        return self.canonical(name) is not None
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._pairs)
+
+    def asset(self, name, default=None):
+        """
+        :param name: an asset as its key ("XXBT") or its altname ("XBT")
+        :return: the Assets record of the asset with its key under "asset"
+        """
+        self._ensure_loaded()
+        key = self._asset_names.get(name.upper())
+        return self._assets.get(key, default) if key is not None else default
+
+    def pair_names(self):
+        """
+        :return: the list of the canonical keys of all the pairs
+        """
+        self._ensure_loaded()
+        return list(self._pairs)
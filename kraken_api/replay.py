@@ -0,0 +1,195 @@
+import collections
+import gzip
+import json
+import threading
+import time
+
+# a session log is a gzip file of json lines, one per query:
+# {"t": seconds since the start of the recording, "duration": seconds,
+#  "private": bool, "method": "Ticker", "data": {...}, "response": {...}}
+# an exception raised by the transport is saved as "exception" instead of
+# "response"
+
+# the data never saved, the nonce changes at each query and the one-time
+# password must not be written to disk
+_STRIPPED = ["nonce", "otp"]
+
+# the data derived from the time of the query, the end of the pagers
+# iter_trades_history and iter_closed_orders defaults to now: it is saved
+# but a replay, run at another time, does not match on it
+_TIME_DERIVED = {"TradesHistory": ["end"], "ClosedOrders": ["end"]}
+
+
+def _data_key(private, method, data):
+    data = {
+        name: value for name, value in (data or {}).items()
+        if name not in _STRIPPED}
+    # the same key before saving and after loading the json
+    data = json.loads(json.dumps(data, default=str))
+    return private, method, json.dumps(data, sort_keys=True)
+
+
+def _replay_key(private, method, data):
+    ignored = _TIME_DERIVED.get(method, [])
+    data = {
+        name: value for name, value in (data or {}).items()
+        if name not in ignored}
+    return _data_key(private, method, data)
+
+
+class RecordingTransport:
+
+    def __init__(self, transport, path):
+        """
+        a transport saving every query sent through another transport with
+        its answer and its timing, see ReplayTransport to serve them back
+
+        :param transport: the transport doing the queries, a ThreadLocalAPI
+        :param path: the file of the log, a gzip of json lines
+        """
+        self.transport = transport
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._start = time.monotonic()
+
+    def __repr__(self):
+        return f"RecordingTransport({self.path})"
+
+    def _record(self, private, method, data, query):
+        start = time.monotonic()
+        record = {
+            "t": start - self._start,
+            "private": private,
+            "method": method,
+            "data": json.loads(_data_key(private, method, data)[2]),
+        }
+
+        try:
+            res = query(method, data)
+        except Exception as e:
+            record["exception"] = f"{type(e).__name__}: {e}"
+            raise
+        else:
+            record["response"] = res
+        finally:
+            record["duration"] = time.monotonic() - start
+            line = json.dumps(record, default=str)
+            with self._lock:
+                self._file.write(line + "\n")
+
+        return res
+
+    def query_public(self, method, data=None):
+        return self._record(
+            False, method, data, self.transport.query_public)
+
+    def query_private(self, method, data=None):
+        return self._record(
+            True, method, data, self.transport.query_private)
+
+    def connection_stats(self):
+        return self.transport.connection_stats()
+
+    def response_size(self):
+        response_size = getattr(self.transport, "response_size", None)
+        return response_size() if response_size is not None else None
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        self.transport.close()
+
+
+class ReplayTransport:
+
+    def __init__(self, path, timing=False, speed=1.):
+        """
+        a transport answering the queries with the answers saved by a
+        RecordingTransport, without any network
+
+        the answers of a query (same method, same data but the nonce) are
+        served in the order they were recorded, the end of TradesHistory and
+        ClosedOrders is not compared: the pagers set it to the time of the
+        query
+
+        :param path: the file written by a RecordingTransport
+        :param timing: if True each answer is served when it was received
+                       in the recording, else as fast as possible
+        :param speed: with timing, how many times faster than the recording
+        """
+        if speed <= 0:
+            raise Exception(f"Invalid parameter for speed: {speed}")
+
+        self.path = path
+        self.timing = timing
+        self.speed = speed
+
+        self._answers = collections.defaultdict(collections.deque)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                key = _replay_key(
+                    record["private"], record["method"], record["data"])
+                self._answers[key].append(record)
+
+        self._lock = threading.Lock()
+        self._start = None
+        self.requests = 0
+
+    def __repr__(self):
+        return f"ReplayTransport({self.path})"
+
+    def remaining(self):
+        """
+        :return: the number of recorded answers not served yet
+        """
+        with self._lock:
+            return sum(len(answers) for answers in self._answers.values())
+
+    def _replay(self, private, method, data):
+        key = _replay_key(private, method, data)
+        with self._lock:
+            if self._start is None:
+                self._start = time.monotonic()
+            answers = self._answers.get(key)
+            if not answers:
+                raise Exception(
+                    f"No recorded answer for {method} with {key[2]}")
+            record = answers.popleft()
+            self.requests += 1
+
+        if self.timing:
+            ready = self._start + \
+                (record["t"] + record["duration"]) / self.speed
+            wait = ready - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+        if "exception" in record:
+            raise Exception(f"Recorded exception: {record['exception']}")
+
+        return record["response"]
+
+    def query_public(self, method, data=None):
+        return self._replay(False, method, data)
+
+    def query_private(self, method, data=None):
+        return self._replay(True, method, data)
+
+    def connection_stats(self):
+        return {
+            "sessions": 0,
+            "requests": self.requests,
+            "connections": 0,
+            "reused": 0,
+        }
+
+    def close(self):
+        pass
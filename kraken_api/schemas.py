@@ -0,0 +1,210 @@
+from .frames import Schema
+
+# the schemas of the frames returned by Kapi, one per endpoint, the order of
+# the fields is the order of the columns
+
+ASSETS = Schema(
+    ("cryptocurrency", "bool"),
+    ("aclass", "category"),
+    ("altname", "object"),
+    ("decimals", "int"),
+    ("display_decimals", "int"),
+)
+
+ASSET_PAIRS = Schema(
+    ("altname", "object"),
+    ("wsname", "object"),
+    ("aclass_base", "category"),
+    ("base", "category"),
+    ("aclass_quote", "category"),
+    ("quote", "category"),
+    ("lot", "category"),
+    ("pair_decimals", "int"),
+    ("lot_decimals", "int"),
+    ("lot_multiplier", "int"),
+    ("fees_0", "float"),
+    ("fees_50000", "float"),
+    ("fees_100000", "float"),
+    ("fees_250000", "float"),
+    ("fees_1000000", "float"),
+    ("fees_maker_0", "float"),
+    ("fees_maker_50000", "float"),
+    ("fees_maker_100000", "float"),
+    ("fees_maker_250000", "float"),
+    ("fees_maker_1000000", "float"),
+    ("fee_volume_currency", "category"),
+    ("margin_call", "int"),
+    ("margin_stop", "int"),
+    ("ordermin", "float"),
+)
+
+TICKER = Schema(
+    ("currency", "object"),
+    ("ask", "float"),
+    ("ask_whole_lot_volume", "float"),
+    ("ask_lot_volume", "float"),
+    ("bid", "float"),
+    ("bid_whole_lot_volume", "float"),
+    ("a_lot_volume", "float"),
+    ("last_trade_closed_price", "float"),
+    ("last_trade_closed_lot_volume", "float"),
+    ("volume_today", "float"),
+    ("volume_last_24_hours", "float"),
+    ("wa_volume_price_today", "float"),
+    ("wa_volume_price_last_24_hours", "float"),
+    ("number_of_trades_today", "int"),
+    ("number_of_trades_last_24_hours", "int"),
+    ("low_today", "float"),
+    ("low_last_24_hours", "float"),
+    ("high_today", "float"),
+    ("high_last_24_hours", "float"),
+    ("today_opening_price", "float"),
+)
+
+OHLC = Schema(
+    ("pair", "category"),
+    ("time", "time"),
+    ("open", "float"),
+    ("high", "float"),
+    ("low", "float"),
+    ("close", "float"),
+    ("vwap", "float"),
+    ("volume", "float"),
+    ("count", "int"),
+)
+
+DEPTH = Schema(
+    ("pair", "category"),
+    ("level", "int"),
+    ("ask_price", "float"),
+    ("ask_volume", "float"),
+    ("ask_time", "time"),
+    ("bid_price", "float"),
+    ("bid_volume", "float"),
+    ("bid_time", "time"),
+)
+
+TRADES = Schema(
+    ("pair", "category"),
+    ("time", "time"),
+    ("volume", "float"),
+    ("price", "float"),
+    ("is_sell", "bool"),
+    ("is_buy", "bool"),
+    ("market_limit", "category"),
+    ("miscellaneous", "object"),
+)
+
+SPREAD = Schema(
+    ("pair", "category"),
+    ("time", "time"),
+    ("bid", "float"),
+    ("ask", "float"),
+)
+
+BALANCE = Schema(
+    ("currency", "object"),
+    ("amount", "float"),
+)
+
+TRADE_BALANCE = Schema(
+    ("equivalent_balance", "float"),
+    ("trade_balance", "float"),
+    ("margin", "float"),
+    ("unrealized_profit_loss", "float"),
+    ("cost_basis_open", "float"),
+    ("current_floating_valuation_open", "float"),
+    ("equity", "float"),
+    ("free_margin", "float"),
+)
+
+# open and queried orders share the same columns, the closed ones have also
+# the reason of the closing
+_ORDER_FIELDS = [
+    ("order_id", "object"),
+    ("refid", "object"),
+    ("userref", "int"),
+    ("status", "category"),
+    ("opentm", "time"),
+    ("starttm", "time"),
+    ("expiretim", "time"),
+    ("pair", "category"),
+    ("type", "category"),
+    ("order_type", "category"),
+    ("price", "float"),
+    ("price_2", "float"),
+    ("leverage", "category"),
+    ("order", "object"),
+    ("close", "object"),
+    ("volume", "float"),
+    ("volume_executed", "float"),
+    ("cost", "float"),
+    ("fee", "float"),
+    ("price", "float"),
+    ("stop_price", "float"),
+    ("limit_price", "float"),
+    ("misc", "object"),
+    ("oflags", "object"),
+]
+
+OPEN_ORDERS = Schema(*_ORDER_FIELDS)
+
+CLOSED_ORDERS = Schema(*(_ORDER_FIELDS[:3] + [("reason", "object")] + _ORDER_FIELDS[3:]))
+
+QUERY_ORDERS = OPEN_ORDERS
+
+TRADES_HISTORY = Schema(
+    ("trade_id", "object"),
+    ("ordertxid", "object"),
+    ("postxid", "object"),
+    ("pair", "category"),
+    ("time", "time"),
+    ("type", "category"),
+    ("ordertype", "category"),
+    ("price", "float"),
+    ("cost", "float"),
+    ("fee", "float"),
+    ("vol", "float"),
+    ("margin", "float"),
+    ("misc", "object"),
+)
+
+QUERY_TRADES = TRADES_HISTORY
+
+OPEN_POSITIONS = Schema(
+    ("trade_id", "object"),
+    ("ordertxid", "object"),
+    ("posstatus", "category"),
+    ("pair", "category"),
+    ("time", "time"),
+    ("type", "category"),
+    ("ordertype", "category"),
+    ("cost", "float"),
+    ("fee", "float"),
+    ("vol", "float"),
+    ("vol_closed", "float"),
+    ("margin", "float"),
+    ("value", "float"),
+    ("net", "float"),
+    ("terms", "object"),
+    ("rollovterm", "object"),
+    ("misc", "object"),
+    ("oflags", "object"),
+)
+
+ADD_ORDERS = Schema(
+    ("order", "int"),
+    ("pair", "category"),
+    ("txid", "object"),
+    ("description", "object"),
+    ("error", "object"),
+)
+
+CANCEL_ORDERS = Schema(
+    ("txid", "object"),
+    ("batch", "int"),
+    ("batch_size", "int"),
+    ("batch_cancelled", "int"),
+    ("all_cancelled", "bool"),
+    ("error", "object"),
+)
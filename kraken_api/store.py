@@ -0,0 +1,189 @@
+import os
+import uuid
+
+import pandas as pd
+
+from .frames import collect
+
+# pyarrow is only needed by the store, install it with
+# pip install kraken_api[store]
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# the frames are saved as Arrow IPC files (the Feather v2 format) without
+# compression, this way the reads memory-map the files instead of copying
+# them
+_SUFFIX = ".arrow"
+
+
+class MarketStore:
+
+    def __init__(self, root):
+        """
+        a local store of the frames returned by Kapi.ohlc, Kapi.trades,
+        Kapi.spread,... keyed by endpoint, pair and day
+
+        the layout is root/endpoint/pair/YYYY-MM-DD/part-*.arrow, each write
+        adds new part files and never modifies the existing ones
+
+        :param root: the directory of the store, created if needed
+        """
+        if pa is None:
+            raise Exception(
+                "MarketStore needs pyarrow, install it with: pip install pyarrow")
+
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def __repr__(self):
+        return f"MarketStore({self.root})"
+
+    def _directory(self, endpoint, pair):
+        return os.path.join(self.root, endpoint, pair)
+
+    def write(self, frame, endpoint, pair):
+        """
+        append a frame to the store, the rows are split by day of their
+        "time" column
+
+        a write killed in the middle leaves at most a temporary file that is
+        ignored by the reads, the parts already written are never touched
+
+        :param frame: a frame with a "time" column, a dataframe or the same
+                      data in the numpy or records output of Kapi
+        :param endpoint: the name of the endpoint, as "ohlc" or "trades"
+        :param pair: the pair of the data
+        :return: the paths of the part files written
+        """
+        frame = _as_frame(frame)
+        if "time" not in frame.columns:
+            if not len(frame):
+                return []
+            raise Exception("Invalid frame, a 'time' column is needed")
+
+        if not len(frame):
+            return []
+
+        paths = []
+        days = frame["time"].dt.strftime("%Y-%m-%d")
+        for day, rows in frame.groupby(days.values, sort=True):
+            directory = os.path.join(self._directory(endpoint, pair), day)
+            os.makedirs(directory, exist_ok=True)
+
+            table = pa.Table.from_pandas(
+                rows.reset_index(drop=True), preserve_index=False)
+            paths.append(_write_atomic(directory, table))
+
+        return paths
+
+    def partitions(self, endpoint, pair):
+        """
+        :return: the sorted list of the days stored for endpoint and pair
+        """
+        directory = self._directory(endpoint, pair)
+        if not os.path.isdir(directory):
+            return []
+
+        return sorted(
+            day for day in os.listdir(directory)
+            if os.path.isdir(os.path.join(directory, day)))
+
+    def read(self, endpoint, pair, start=None, end=None):
+        """
+        read the rows of endpoint and pair whose time is in [start, end),
+        only the partitions of the days in the range are opened
+
+        :param start: a timestamp (anything pd.Timestamp accepts), None for
+                      no lower bound
+        :param end: a timestamp, None for no upper bound
+        :return: a dataframe, empty if nothing is stored
+        """
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+
+        directory = self._directory(endpoint, pair)
+        frames = []
+        for day in self.partitions(endpoint, pair):
+            day_start = pd.Timestamp(day)
+            if start is not None and \
+                    day_start + pd.Timedelta(days=1) <= start:
+                continue
+            if end is not None and day_start >= end:
+                continue
+
+            day_directory = os.path.join(directory, day)
+            for name in sorted(os.listdir(day_directory)):
+                if name.endswith(_SUFFIX):
+                    frames.append(
+                        _read_mapped(os.path.join(day_directory, name)))
+
+        data = collect(frames)
+        if not len(data):
+            return data
+
+        mask = pd.Series(True, index=data.index)
+        if start is not None:
+            mask &= data["time"] >= start
+        if end is not None:
+            mask &= data["time"] < end
+
+        return data[mask].sort_values(
+            "time", kind="stable").reset_index(drop=True)
+
+
+def _as_frame(frame):
+    """
+    :return: the frame as a dataframe, the records of Kapi keep the times
+             in unix seconds
+    """
+    if isinstance(frame, pd.DataFrame):
+        return frame
+
+    frame = pd.DataFrame(frame)
+    if "time" in frame.columns and \
+            not pd.api.types.is_datetime64_any_dtype(frame["time"]):
+        frame["time"] = pd.to_datetime(
+            frame["time"], unit="s").astype("datetime64[ns]")
+    return frame
+
+
+def _write_atomic(directory, table):
+    """
+    write the table to a temporary file, flush it to the disk and only then
+    give it its final name
+    """
+    name = f"part-{pd.Timestamp.now('UTC').value}-{uuid.uuid4().hex}"
+    path = os.path.join(directory, name + _SUFFIX)
+    tmp_path = os.path.join(directory, name + ".tmp")
+
+    with open(tmp_path, "wb") as f:
+        with pa.ipc.new_file(f, table.schema) as writer:
+            writer.write_table(table)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+    _fsync_directory(directory)
+
+    return path
+
+
+def _fsync_directory(directory):
+    # makes the rename durable, not possible on every platform
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _read_mapped(path):
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
@@ -0,0 +1,267 @@
+import asyncio
+import inspect
+import json
+import logging
+
+from . import endpoints
+from .orderbook import OrderBook
+
+# websockets is only needed by the stream, install it with
+# pip install kraken_api[stream]
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+# documentation: https://docs.kraken.com/websockets/
+
+WS_URI = "wss://ws.kraken.com"
+
+# an update that cannot be parsed or a callback raising is logged here, the
+# other updates and subscriptions go on
+logger = logging.getLogger(__name__)
+
+# the names used by MarketStream -> the names of the kraken channels
+CHANNELS = {
+    "ticker": "ticker",
+    "book": "book",
+    "trades": "trade",
+    "spread": "spread",
+}
+
+BOOK_DEPTHS = [10, 25, 100, 500, 1000]
+
+
+class MarketStream:
+
+    def __init__(
+            self,
+            uri=WS_URI,
+            pairs=None,
+            exact_decimals=False,
+            book_depth=10,
+            reconnect_delay=1,
+            max_reconnect_delay=30):
+        """
+        a subscriber to the public websocket channels of kraken, the updates
+        are delivered as the frames of the REST methods (ticker, trades,
+        spread) or as an OrderBook (book) kept up to date locally
+
+        the connection is opened again after any error, with an exponential
+        backoff, and all the subscriptions are sent again
+
+        :param uri: the url of the websocket api
+        :param pairs: a PairRegistry (Kapi.pairs), if given the pairs can be
+                      subscribed by any name and the updates carry the
+                      canonical key, as with the REST methods
+        :param exact_decimals: see Kapi
+        :param book_depth: number of levels per side of the books
+        :param reconnect_delay: seconds to wait before the first reconnection
+        :param max_reconnect_delay: the maximum wait between reconnections
+        """
+        if websockets is None:
+            raise Exception(
+                "MarketStream needs websockets, install it with: pip install websockets")
+
+        if book_depth not in BOOK_DEPTHS:
+            raise Exception(f"Invalid parameter for book_depth: {book_depth}")
+
+        self.uri = uri
+        self.pairs = pairs
+        self.book_depth = book_depth
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self._exact_decimals = exact_decimals
+        self._subscriptions = {}
+        self._books = {}
+        self._websocket = None
+        self._closed = False
+        self.reconnections = 0
+
+    def __repr__(self):
+        return f"MarketStream({self.uri}, {list(self._subscriptions)})"
+
+    def _frame_builder(self, schema):
+        return schema.builder(exact=self._exact_decimals)
+
+    def _wsname(self, pair):
+        if self.pairs is None:
+            return pair
+        record = self.pairs.get(pair)
+        return record["wsname"] if record is not None else pair
+
+    def _pair(self, wsname):
+        if self.pairs is None:
+            return wsname
+        return self.pairs.canonical(wsname) or wsname
+
+    def subscribe(self, channel, pairs, callback):
+        """
+        :param channel: "ticker", "book", "trades" or "spread"
+        :param pairs: a pair or a list of pairs
+        :param callback: a function (channel, pair, data) called for each
+                         update, data is a dataframe or for "book" the
+                         OrderBook of the pair, it can be a coroutine function
+        """
+        if channel not in CHANNELS:
+            raise Exception(f"Invalid parameter for channel: {channel}")
+
+        if isinstance(pairs, str):
+            pairs = [pairs]
+
+        wsnames = [self._wsname(pair) for pair in pairs]
+        for wsname in wsnames:
+            self._subscriptions[(channel, wsname)] = callback
+
+        # before run() the subscriptions are sent at the connection, once
+        # running subscribe must be called from the event loop
+        if self._websocket is not None:
+            asyncio.ensure_future(self._send_subscriptions(channel, wsnames))
+
+    def book(self, pair):
+        """
+        :return: the OrderBook of a pair subscribed to "book", None before
+                 the first snapshot
+        """
+        return self._books.get(self._pair(pair))
+
+    async def _send_subscriptions(self, channel, wsnames):
+        subscription = {"name": CHANNELS[channel]}
+        if channel == "book":
+            subscription["depth"] = self.book_depth
+
+        await self._websocket.send(json.dumps({
+            "event": "subscribe",
+            "pair": wsnames,
+            "subscription": subscription,
+        }))
+
+    async def _subscribe_all(self):
+        channels = {}
+        for channel, wsname in self._subscriptions:
+            channels.setdefault(channel, []).append(wsname)
+
+        for channel, wsnames in channels.items():
+            await self._send_subscriptions(channel, wsnames)
+
+    async def run(self):
+        """
+        connect, subscribe and deliver the updates until close() is called
+        """
+        delay = self.reconnect_delay
+        while not self._closed:
+            try:
+                async with websockets.connect(self.uri) as websocket:
+                    self._websocket = websocket
+                    await self._subscribe_all()
+                    delay = self.reconnect_delay
+
+                    async for message in websocket:
+                        await self._handle(json.loads(message))
+            except (OSError, websockets.exceptions.WebSocketException):
+                pass
+            finally:
+                self._websocket = None
+
+            if self._closed:
+                return
+
+            self.reconnections += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def run_forever(self):
+        asyncio.run(self.run())
+
+    async def close(self):
+        self._closed = True
+        if self._websocket is not None:
+            await self._websocket.close()
+
+    async def _handle(self, message):
+        # the events (heartbeat, systemStatus, subscriptionStatus) are dicts,
+        # the updates are lists [channel id, payload..., channel name, pair]
+        if isinstance(message, dict):
+            if message.get("event") == "subscriptionStatus" and \
+                    message.get("status") == "error":
+                raise Exception(
+                    f"Error while subscribing: {message.get('errorMessage')}")
+            return
+
+        try:
+            channel, wsname, data = self._parse(message)
+        except Exception:
+            logger.exception("Invalid update: %s", message)
+            return
+
+        callback = self._subscriptions.get((channel, wsname))
+        if callback is None or data is None:
+            return
+
+        try:
+            res = callback(channel, self._pair(wsname), data)
+            if inspect.isawaitable(res):
+                await res
+        except Exception:
+            logger.exception(
+                "Error in the callback of %s for %s", channel, wsname)
+
+    def _parse(self, message):
+        """
+        :return: a tuple (channel, wsname, data), data is None for the
+                 channels not handled
+        """
+        channel_name = message[-2]
+        wsname = message[-1]
+        payloads = message[1:-2]
+
+        if channel_name.startswith("book"):
+            return "book", wsname, self._update_book(wsname, payloads)
+        elif channel_name == "ticker":
+            return "ticker", wsname, self._parse_ticker(wsname, payloads[0])
+        elif channel_name == "trade":
+            return "trades", wsname, self._parse_trades(wsname, payloads[0])
+        elif channel_name == "spread":
+            return "spread", wsname, self._parse_spread(wsname, payloads[0])
+
+        return None, wsname, None
+
+    def _update_book(self, wsname, payloads):
+        pair = self._pair(wsname)
+        book = self._books.get(pair)
+
+        for payload in payloads:
+            if "as" in payload or "bs" in payload:
+                # a snapshot, sent after each (re)subscription
+                if book is None:
+                    book = OrderBook(pair, depth=self.book_depth)
+                    self._books[pair] = book
+                book.replace(payload.get("as", []), payload.get("bs", []))
+            elif book is not None:
+                book.update(asks=payload.get("a"), bids=payload.get("b"))
+
+        return book
+
+    def _parse_ticker(self, wsname, payload):
+        # the websocket gives the opening prices of today and of the last 24
+        # hours where the REST method gives only the one of today
+        payload = dict(payload, o=payload["o"][0])
+        return endpoints.parse_ticker(
+            {self._pair(wsname): payload}, self._frame_builder)
+
+    def _parse_trades(self, wsname, payload):
+        # the rows have the REST layout, [price, volume, time, side, type,
+        # miscellaneous]
+        pair = self._pair(wsname)
+        data, _ = endpoints.trades(pair).parse(
+            {pair: payload, "last": None}, self._frame_builder)
+        return data
+
+    def _parse_spread(self, wsname, payload):
+        # [bid, ask, time, bid volume, ask volume] -> [time, bid, ask]
+        pair = self._pair(wsname)
+        rows = [[payload[2], payload[0], payload[1]]]
+        data, _ = endpoints.spread(pair).parse(
+            {pair: rows, "last": None}, self._frame_builder)
+        return data
@@ -0,0 +1,168 @@
+import collections
+
+from .frames import collect
+
+# number of polls kept as separate frames before they are merged in one
+_MAX_CHUNKS = 64
+
+# the unit of the cursor of each endpoint, the last of trades is a time in
+# nanoseconds, the one of spread in seconds
+_CURSOR_UNITS = {"trades": "ns", "spread": "s"}
+
+# the times are read from floats of seconds, a row at the time of the cursor
+# can be this far after it
+_CURSOR_TOLERANCE = "1us"
+
+
+class MarketSync:
+
+    def __init__(self, kapi, endpoint, pair, interval=1, since=None,
+                 max_rows=None):
+        """
+        keeps a local copy of the ohlc, trades or spread data of a pair up to
+        date, each poll asks kraken only for the rows after the cursor (the
+        'last' value returned by the previous call)
+
+        :param kapi: the Kapi used for the queries
+        :param endpoint: "ohlc", "trades" or "spread"
+        :param pair: the pair to follow
+        :param interval: the interval of the candles, only for "ohlc"
+        :param since: the initial cursor, None gets the data kraken returns
+                      by default
+        :param max_rows: if given only the most recent max_rows rows are kept,
+                         the older ones are dropped when the polls are merged
+        """
+        if endpoint not in ["ohlc", "trades", "spread"]:
+            raise Exception(f"Invalid parameter for endpoint: {endpoint}")
+
+        if max_rows is not None and max_rows < 1:
+            raise Exception(f"Invalid parameter for max_rows: {max_rows}")
+
+        self.kapi = kapi
+        self.endpoint = endpoint
+        self.pair = pair
+        self.interval = interval
+        self.cursor = since
+        self.max_rows = max_rows
+
+        self._chunks = []
+        self._frame = None
+
+    def __repr__(self):
+        return f"MarketSync({self.endpoint}, {self.pair}, cursor={self.cursor})"
+
+    def _fetch(self):
+        # the local copy is kept in dataframes whatever the output of the kapi
+        with self.kapi.output("pandas"):
+            if self.endpoint == "ohlc":
+                return self.kapi.ohlc(
+                    self.pair, self.interval, since=self.cursor)
+            elif self.endpoint == "trades":
+                return self.kapi.trades(self.pair, since=self.cursor)
+            else:
+                return self.kapi.spread(self.pair, since=self.cursor)
+
+    def poll(self):
+        """
+        fetch the rows after the cursor and append them to the local data,
+        for "ohlc" the candle still forming is replaced, not duplicated
+
+        :return: the new rows (with the updated candles for "ohlc")
+        """
+        res = self._fetch()
+        if not isinstance(res, tuple):
+            raise Exception(f"Error while syncing {self}: {res}")
+
+        data, last = res
+
+        if len(data) and self._chunks:
+            start = data["time"].min()
+            if self.endpoint == "ohlc":
+                # the last candle returned is not committed yet, it comes
+                # back in the next poll with its final values
+                self._drop_from(start)
+            else:
+                data = self._drop_known(data)
+
+        if len(data):
+            self._chunks.append(data.reset_index(drop=True))
+            self._frame = None
+            if len(self._chunks) > _MAX_CHUNKS:
+                self._compact()
+
+        self.cursor = last
+
+        return data
+
+    def _drop_from(self, start):
+        """
+        remove the rows whose time is at least start, only the last chunks
+        can have such rows
+        """
+        while self._chunks:
+            chunk = self._chunks.pop()
+            keep = chunk[chunk["time"] < start]
+            if len(keep):
+                self._chunks.append(keep)
+            if len(keep) < len(chunk):
+                self._frame = None
+            if len(keep):
+                break
+
+    def _drop_known(self, data):
+        """
+        remove from data the rows already stored, kraken can return again the
+        rows having the same time as the cursor
+
+        only the rows at or before the cursor are compared, and each stored
+        row removes a single one: two trades of the same price, volume, time
+        and side are both kept
+        """
+        if self.cursor is None:
+            return data
+
+        import pandas as pd
+        cursor = pd.Timestamp(
+            int(self.cursor), unit=_CURSOR_UNITS[self.endpoint]) + \
+            pd.Timedelta(_CURSOR_TOLERANCE)
+        again = (data["time"] <= cursor).tolist()
+        if not any(again):
+            return data
+
+        tail = self._chunks[-1]
+        start = data["time"][again].min()
+        known = collections.Counter(
+            tail[tail["time"] >= start].itertuples(index=False, name=None))
+
+        mask = []
+        for row, maybe_known in zip(
+                data.itertuples(index=False, name=None), again):
+            if maybe_known and known[row]:
+                known[row] -= 1
+                mask.append(False)
+            else:
+                mask.append(True)
+
+        return data[mask]
+
+    def _compact(self):
+        data = collect(self._chunks)
+        if self.max_rows is not None and len(data) > self.max_rows:
+            data = data.iloc[-self.max_rows:].reset_index(drop=True)
+
+        self._chunks = [data]
+        self._frame = data
+
+    @property
+    def frame(self):
+        """
+        :return: all the rows synced so far in a single dataframe
+        """
+        if self._frame is None:
+            if not self._chunks:
+                return None
+            self._compact()
+        return self._frame
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self._chunks)
@@ -0,0 +1,322 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+import urllib.parse
+
+import krakenex
+import requests
+from requests.adapters import HTTPAdapter
+
+# the file locks of FileNonce, fcntl on unix and msvcrt on windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+class NonceCounter:
+
+    def __init__(self):
+        """
+        a nonce in milliseconds that always increases, even when several
+        threads ask for one in the same millisecond
+        """
+        self._lock = threading.Lock()
+        self._last = 0
+
+    def next(self):
+        with self._lock:
+            self._last = max(self._last + 1, int(1000 * time.time()))
+            return self._last
+
+
+class FileNonce:
+
+    def __init__(self, path):
+        """
+        a nonce in milliseconds that always increases across all the processes
+        using the same file, the last nonce is stored in the file and read
+        and written under an exclusive lock
+
+        :param path: the file of the counter, created if needed, every process
+                     sharing an API key must use the same one
+        """
+        self.path = path
+        # the file locks are held by the process, the threads of the process
+        # are serialized by this lock
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"FileNonce({self.path})"
+
+    def next(self):
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                _lock_file(fd)
+                try:
+                    raw = os.read(fd, 64).strip()
+                    last = int(raw) if raw else 0
+                    nonce = max(last + 1, int(1000 * time.time()))
+
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    os.ftruncate(fd, 0)
+                    os.write(fd, str(nonce).encode())
+                finally:
+                    _unlock_file(fd)
+            finally:
+                os.close(fd)
+
+        return nonce
+
+
+def _lock_file(fd):
+    if fcntl is not None:
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+    else:
+        # msvcrt locks a range of bytes from the current position, the first
+        # byte is used as the lock of the whole file
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        os.lseek(fd, 0, os.SEEK_SET)
+
+
+def _unlock_file(fd):
+    if fcntl is not None:
+        fcntl.lockf(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class HttpConfig:
+
+    def __init__(
+            self,
+            pool_size=10,
+            keep_alive=True,
+            max_retries=0,
+            timeout=None,
+            timeouts=None,
+            session=None,
+            adapter=None):
+        """
+        configuration of the http sessions used to reach kraken
+
+        :param pool_size: number of connections kept open to kraken by each
+                          session
+        :param keep_alive: if False the connections are closed after each
+                           query
+        :param max_retries: number of retries on connection errors, passed to
+                            the default adapter
+        :param timeout: timeout of the queries in seconds, or a tuple
+                        (connect timeout, read timeout), None waits forever
+        :param timeouts: a dict kraken method -> timeout to override the
+                         timeout of some methods, as {"Depth": (1, 2)}
+        :param session: a function returning a new requests.Session, called
+                        once per thread
+        :param adapter: a function returning a new requests adapter mounted
+                        on the kraken url, replaces the default HTTPAdapter
+        """
+        if not isinstance(pool_size, int) or pool_size < 1:
+            raise Exception(f"Invalid parameter for pool_size: {pool_size}")
+
+        if timeouts is not None and not isinstance(timeouts, dict):
+            raise Exception(f"Invalid parameter for timeouts: {timeouts}")
+
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.timeouts = dict(timeouts) if timeouts is not None else {}
+        self.session = session
+        self.adapter = adapter
+
+    def timeout_for(self, method):
+        return self.timeouts.get(method, self.timeout)
+
+    def new_session(self, uri):
+        """
+        :param uri: the root url of kraken, the adapter is mounted on it
+        :return: a configured requests.Session
+        """
+        session = self.session() if self.session is not None else \
+            requests.Session()
+
+        if self.adapter is not None:
+            adapter = self.adapter()
+        else:
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=self.pool_size,
+                max_retries=self.max_retries)
+        session.mount(uri, adapter)
+
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+
+        return session
+
+
+class KrakenexAPI(krakenex.API):
+
+    def __init__(self, key="", secret="", nonce=None, http_config=None):
+        """
+        krakenex.API taking its nonces from a shared source
+
+        :param nonce: an object with a next() method, defaults to a new
+                      NonceCounter, use a FileNonce to share it between
+                      processes
+        :param http_config: a HttpConfig for the session and the timeouts
+        """
+        super().__init__(key, secret)
+        self.nonce_source = nonce if nonce is not None else NonceCounter()
+        self.http_config = http_config if http_config is not None else \
+            HttpConfig()
+
+        user_agent = self.session.headers["User-Agent"]
+        self.session.close()
+        self.session = self.http_config.new_session(self.uri)
+        self.session.headers.setdefault("User-Agent", user_agent)
+
+    def query_public(self, method, data=None, timeout=None):
+        if timeout is None:
+            timeout = self.http_config.timeout_for(method)
+        return super().query_public(method, data, timeout=timeout)
+
+    def query_private(self, method, data=None, timeout=None):
+        if timeout is None:
+            timeout = self.http_config.timeout_for(method)
+        return super().query_private(method, data, timeout=timeout)
+
+    def connection_stats(self):
+        """
+        :return: a dict with the number of requests sent and of connections
+                 opened by the session
+        """
+        num_requests = 0
+        num_connections = 0
+
+        for adapter in self.session.adapters.values():
+            poolmanager = getattr(adapter, "poolmanager", None)
+            if poolmanager is None:
+                continue
+            for key in poolmanager.pools.keys():
+                pool = poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                num_requests += pool.num_requests
+                num_connections += pool.num_connections
+
+        return {"requests": num_requests, "connections": num_connections}
+
+    def _nonce(self):
+        return self.nonce_source.next()
+
+
+class ThreadLocalAPI:
+
+    def __init__(self, key="", secret="", nonce=None, http_config=None):
+        """
+        one krakenex.API (and so one requests session) per thread, all of them
+        sharing the same nonce source
+
+        the nonces are increasing when generated but concurrent private
+        queries can still reach kraken out of order, in that case set a nonce
+        window on the API key
+
+        :param key: the key used for kraken authentication
+        :param secret: the secret used for kraken authentication
+        :param nonce: an object with a next() method, defaults to a new
+                      NonceCounter, use a FileNonce to share it between
+                      processes
+        :param http_config: a HttpConfig for the sessions and the timeouts
+        """
+        self._key = key
+        self._secret = secret
+        self.nonce = nonce if nonce is not None else NonceCounter()
+        self.http_config = http_config if http_config is not None else \
+            HttpConfig()
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._apis = []
+
+    def api(self):
+        """
+        :return: the krakenex.API of the current thread
+        """
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = KrakenexAPI(
+                self._key, self._secret, self.nonce, self.http_config)
+            self._local.api = api
+            with self._lock:
+                self._apis.append(api)
+        return api
+
+    def query_public(self, method, data=None):
+        return self.api().query_public(method, data)
+
+    def query_private(self, method, data=None):
+        # krakenex adds the nonce to the data, copy it so the caller's dict
+        # is never shared between threads
+        data = dict(data) if data is not None else None
+        return self.api().query_private(method, data)
+
+    def response_size(self):
+        """
+        :return: the number of bytes of the last answer received by the
+                 current thread, None if there is none
+        """
+        api = getattr(self._local, "api", None)
+        response = getattr(api, "response", None)
+        if response is None:
+            return None
+        return len(response.content)
+
+    def connection_stats(self):
+        """
+        :return: a dict with the number of sessions, of requests sent, of
+                 connections opened and of requests sent on an already open
+                 connection, summed over all the threads
+        """
+        with self._lock:
+            apis = list(self._apis)
+
+        stats = {"sessions": len(apis), "requests": 0, "connections": 0}
+        for api in apis:
+            api_stats = api.connection_stats()
+            stats["requests"] += api_stats["requests"]
+            stats["connections"] += api_stats["connections"]
+        stats["reused"] = max(0, stats["requests"] - stats["connections"])
+
+        return stats
+
+    def close(self):
+        with self._lock:
+            for api in self._apis:
+                api.close()
+            self._apis = []
+        self._local = threading.local()
+
+
+def sign(secret, data, urlpath):
+    """
+    the API-Sign header of a private query, as krakenex computes it
+
+    :param secret: the secret used for kraken authentication
+    :param data: the data of the query, with its nonce
+    :param urlpath: the path of the method, as "/0/private/Balance"
+    :return: the signature as a string
+    """
+    postdata = urllib.parse.urlencode(data)
+    encoded = (str(data["nonce"]) + postdata).encode()
+    message = urlpath.encode() + hashlib.sha256(encoded).digest()
+
+    signature = hmac.new(base64.b64decode(secret), message, hashlib.sha512)
+    return base64.b64encode(signature.digest()).decode()
@@ -0,0 +1,250 @@
+import numpy as np
+
+# the checks kraken does on an order that can be done locally with the
+# AssetPairs data, an order refused here is never sent and costs nothing to
+# the rate counters
+
+# the order types needing a secondary price
+_PRICE2_ORDERTYPES = ["stop-loss-limit", "take-profit-limit"]
+
+# a value is on the grid if it is at most this fraction of a step away
+_TOLERANCE = 1e-6
+
+
+class OrderValidator:
+
+    def __init__(self, pairs):
+        """
+        checks orders against the rules of their pair: minimum volume (and
+        minimum cost when kraken gives one), price tick, lot decimals,
+        secondary price and leverage
+
+        :param pairs: a PairRegistry, Kapi.pairs
+        """
+        self.pairs = pairs
+
+    def __repr__(self):
+        return f"OrderValidator({self.pairs})"
+
+    def check(self, order, round=False):
+        """
+        :param order: a dict with the parameters of add_order
+        :param round: round the prices to the tick of the pair and the volume
+                      down to its lot decimals before checking
+        :return: a tuple (order, errors), the order rounded if asked and the
+                 list of the errors, empty if the order is valid
+        """
+        orders, errors = self.check_records([order], round=round)
+        return orders[0], errors[0]
+
+    def check_records(self, orders, round=False):
+        """
+        :param orders: a list of dicts with the parameters of add_order
+        :return: a tuple (orders, errors), the orders rounded if asked and a
+                 list of errors per order
+        """
+        columns = _columns(orders, lambda name: [
+            order.get(name) for order in orders])
+        errors = self._check_columns(columns, round)
+
+        if round:
+            orders = [dict(order) for order in orders]
+            for name in ["price", "price2", "volume"]:
+                for order, value in zip(orders, columns[name]):
+                    if name in order and not np.isnan(value):
+                        order[name] = float(value)
+
+        return orders, errors
+
+    def check_frame(self, frame, round=False):
+        """
+        the same checks on a dataframe of orders, one order per row, the
+        columns are the parameters of add_order
+
+        :return: a copy of the frame (rounded if asked) with an "error"
+                 column, None for the valid orders
+        """
+        columns = _columns(frame, lambda name: (
+            frame[name].tolist() if name in frame.columns
+            else [None] * len(frame)))
+        errors = self._check_columns(columns, round)
+
+        frame = frame.copy()
+        if round:
+            for name in ["price", "price2", "volume"]:
+                if name in frame.columns:
+                    frame[name] = np.where(
+                        np.isnan(columns[name]), frame[name], columns[name])
+
+        # an object column, else pandas 3 stores the strings as str and the
+        # valid orders get nan instead of None
+        import pandas as pd
+        frame["error"] = pd.Series(
+            [", ".join(error) if error else None for error in errors],
+            index=frame.index, dtype=object)
+
+        return frame
+
+    def _check_columns(self, columns, round):
+        size = len(columns["pair"])
+        errors = [[] for _ in range(size)]
+
+        rules = self._rules(columns["pair"])
+        known = ~np.isnan(rules["ordermin"])
+        for index in np.flatnonzero(~known):
+            errors[index].append(f"Unknown pair: {columns['pair'][index]}")
+
+        market = np.array(
+            [ordertype == "market" for ordertype in columns["ordertype"]])
+        needs_price2 = np.array([
+            ordertype in _PRICE2_ORDERTYPES
+            for ordertype in columns["ordertype"]])
+
+        price, price2, volume = \
+            columns["price"], columns["price2"], columns["volume"]
+        tick, lot = rules["tick"], rules["lot"]
+
+        if round:
+            price[:] = _round_to(price, tick, np.round)
+            price2[:] = _round_to(price2, tick, np.round)
+            volume[:] = _round_to(volume, lot, np.floor)
+
+        _add(errors, known & ~np.isnan(volume) & (volume < rules["ordermin"]),
+             lambda i: f"Volume {volume[i]} below the minimum {rules['ordermin'][i]}")
+
+        cost = volume * price
+        _add(errors, known & ~market & ~np.isnan(cost) &
+             (cost < rules["costmin"]),
+             lambda i: f"Cost {cost[i]} below the minimum {rules['costmin'][i]}")
+
+        _add(errors, known & ~market & ~_on_grid(price, tick),
+             lambda i: f"Price {price[i]} is not a multiple of the tick {tick[i]}")
+        _add(errors, known & ~_on_grid(price2, tick),
+             lambda i: f"Price2 {price2[i]} is not a multiple of the tick {tick[i]}")
+        _add(errors, known & ~_on_grid(volume, lot),
+             lambda i: f"Volume {volume[i]} has more than {rules['lot_decimals'][i]} decimals")
+
+        missing_price2 = np.array(
+            [value is None for value in columns["raw_price2"]])
+        _add(errors, needs_price2 & missing_price2,
+             lambda i: f"price2 is needed for {columns['ordertype'][i]} orders")
+
+        for index, (leverage, allowed) in enumerate(
+                zip(columns["leverage"], rules["leverage"])):
+            if leverage is None or not known[index]:
+                continue
+            side = columns["buy_or_sell"][index]
+            if _leverage(leverage) not in allowed.get(side, []):
+                errors[index].append(
+                    f"Leverage {leverage} not available for {side} orders on this pair")
+
+        return errors
+
+    def _rules(self, pairs):
+        """
+        :return: a dict of arrays of the rules of each pair, nan for the
+                 unknown pairs
+        """
+        records = {}
+        for pair in set(pairs):
+            records[pair] = self.pairs.get(pair) if pair is not None else None
+
+        ordermin, costmin, tick, lot, lot_decimals, leverage = \
+            [], [], [], [], [], []
+        for pair in pairs:
+            record = records[pair]
+            if record is None:
+                ordermin.append(np.nan)
+                costmin.append(np.nan)
+                tick.append(np.nan)
+                lot.append(np.nan)
+                lot_decimals.append(None)
+                leverage.append({})
+                continue
+
+            ordermin.append(float(record.get("ordermin") or 0))
+            costmin.append(float(record.get("costmin") or 0))
+            # recent AssetPairs records give the tick, older ones only the
+            # number of decimals of the prices
+            tick.append(float(
+                record.get("tick_size") or 10. ** -record["pair_decimals"]))
+            lot.append(10. ** -record["lot_decimals"])
+            lot_decimals.append(record["lot_decimals"])
+            leverage.append({
+                "buy": [1] + list(record.get("leverage_buy", [])),
+                "sell": [1] + list(record.get("leverage_sell", [])),
+            })
+
+        return {
+            "ordermin": np.array(ordermin, dtype="float64"),
+            "costmin": np.array(costmin, dtype="float64"),
+            "tick": np.array(tick, dtype="float64"),
+            "lot": np.array(lot, dtype="float64"),
+            "lot_decimals": lot_decimals,
+            "leverage": leverage,
+        }
+
+
+def _columns(orders, get):
+    columns = {
+        name: get(name)
+        for name in ["pair", "ordertype", "buy_or_sell", "leverage"]}
+    columns["leverage"] = [_missing_to_none(value)
+                           for value in columns["leverage"]]
+
+    for name in ["price", "price2", "volume"]:
+        raw = [_missing_to_none(value) for value in get(name)]
+        columns["raw_" + name] = raw
+        columns[name] = np.array([_to_float(value) for value in raw],
+                                 dtype="float64")
+
+    return columns
+
+
+def _missing_to_none(value):
+    # the missing values of a dataframe are nan, the only value not equal
+    # to itself
+    return None if value is None or value != value else value
+
+
+def _to_float(value):
+    # the prices relative to the market ("+5", "#2%",...) are not checked
+    if value is None or isinstance(value, bool):
+        return np.nan
+    if isinstance(value, str) and value[:1] in "+-#" or \
+            isinstance(value, str) and value.endswith("%"):
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _leverage(value):
+    # kraken writes the leverage "2" or "2:1"
+    try:
+        return int(str(value).split(":")[0])
+    except ValueError:
+        return None
+
+
+def _round_to(values, step, rounding):
+    with np.errstate(invalid="ignore"):
+        rounded = rounding(values / step + _TOLERANCE * np.sign(values)) * step
+        # removes the noise of the float multiplication, 1e-10 is finer
+        # than any tick of kraken
+        rounded = np.round(rounded, 10)
+    return np.where(np.isnan(values) | np.isnan(step), values, rounded)
+
+
+def _on_grid(values, step):
+    with np.errstate(invalid="ignore"):
+        steps = values / step
+        on_grid = np.abs(steps - np.round(steps)) <= _TOLERANCE
+    return on_grid | np.isnan(values) | np.isnan(step)
+
+
+def _add(errors, mask, message):
+    for index in np.flatnonzero(mask):
+        errors[index].append(message(index))
+
@@ -17,6 +17,11 @@ setup(name='kraken_api',
       install_requires=[
           'krakenex>=2.1.0'
       ],
+      extras_require={
+          'async': ['aiohttp>=3.8'],
+          'store': ['pyarrow>=7.0'],
+          'stream': ['websockets>=10.0'],
+      },
       packages=['kraken_api'],
       python_requires='>=3.7',
       classifiers=[
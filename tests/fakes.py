@@ -0,0 +1,34 @@
+"""
+the fake transports shared by the tests
+"""
+
+
+def trades(count):
+    return {
+        f"T{index}": {
+            "ordertxid": f"O{index}", "pair": "XXBTZEUR",
+            "time": 1650000000 + index,
+            "type": "buy", "ordertype": "limit", "price": "30000.0",
+            "cost": "300.0", "fee": "0.5", "vol": "0.01", "margin": "0.0",
+            "misc": ""}
+        for index in range(count)
+    }
+
+
+class PagedTransport:
+    """
+    answers TradesHistory with count trades, page_size per page
+    """
+
+    def __init__(self, count=3, page_size=2):
+        self.trades = trades(count)
+        self.page_size = page_size
+
+    def query_private(self, method, data=None):
+        ofs = int(data.get("ofs", 0))
+        page = dict(list(self.trades.items())[ofs:ofs + self.page_size])
+        return {"error": [], "result": {
+            "trades": page, "count": len(self.trades)}}
+
+    def close(self):
+        pass
@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+from kraken_api import AsyncKapi  # noqa: E402
+from kraken_api.transport import sign  # noqa: E402
+
+KEY = "key"
+SECRET = "c2VjcmV0"
+
+DEPTH = {
+    "XXBTZEUR": {
+        "asks": [["30000.2", "1.5", 1650000001], ["30000.1", "0.5", 1650000000]],
+        "bids": [["29999.9", "2.0", 1650000002]],
+    }
+}
+
+ASSET_PAIRS = {
+    "XXBTZEUR": {
+        "altname": "XBTEUR", "wsname": "XBT/EUR", "ordermin": "0.0001",
+        "tick_size": "0.1", "pair_decimals": 1, "lot_decimals": 8,
+    }
+}
+
+
+def make_app(requests):
+    """
+    a stand-in for the kraken api: the public methods answer only GET, the
+    private ones only a POST whose signature is valid
+    """
+    async def public(request):
+        requests.append(("GET", request.path, dict(request.query)))
+        method = request.match_info["method"]
+        if method == "Time":
+            result = {"unixtime": 1650000000, "rfc1123": ""}
+        elif method == "Depth":
+            result = DEPTH
+        elif method == "AssetPairs":
+            result = ASSET_PAIRS
+        elif method == "Assets":
+            result = {}
+        else:
+            return web.json_response({"error": ["EQuery:Unknown method"]})
+        return web.json_response({"error": [], "result": result})
+
+    async def private(request):
+        data = dict(await request.post())
+        requests.append(("POST", request.path, data))
+
+        if request.headers.get("API-Key") != KEY or \
+                request.headers.get("API-Sign") != \
+                sign(SECRET, data, request.path):
+            return web.json_response({"error": ["EAPI:Invalid signature"]})
+
+        method = request.match_info["method"]
+        if method == "AddOrderBatch":
+            count = len({key.split("]")[0] for key in data
+                         if key.startswith("orders[")})
+            result = {"orders": [
+                {"descr": {"order": f"order {index}"}}
+                for index in range(count)]}
+        elif method == "AddOrder":
+            result = {"descr": {"order": "order"}}
+        else:
+            result = {"ZEUR": "100.5000", "XXBT": "0.1"}
+        return web.json_response({"error": [], "result": result})
+
+    app = web.Application()
+    app.router.add_get("/0/public/{method}", public)
+    app.router.add_post("/0/private/{method}", private)
+    return app
+
+
+def run(coroutine_function, **kwargs):
+    async def main():
+        requests = []
+        server = TestServer(make_app(requests))
+        await server.start_server()
+        try:
+            uri = str(server.make_url("")).rstrip("/")
+            async with AsyncKapi(
+                    key=KEY, secret=SECRET, uri=uri, **kwargs) as kapi:
+                return await coroutine_function(kapi), requests
+        finally:
+            await server.close()
+
+    return asyncio.run(main())
+
+
+def test_public_queries_use_get():
+    async def queries(kapi):
+        return await kapi.time(), await kapi.depth("XXBTZEUR", count=2)
+
+    (time, depth), requests = run(queries)
+
+    assert time["result"]["unixtime"] == 1650000000
+    assert list(depth["ask_price"]) == [30000.1, 30000.2]
+    assert list(depth["bid_price"])[:1] == [29999.9]
+
+    # the pair registry is loaded before the depth query
+    assert {method for method, _, _ in requests} == {"GET"}
+    assert [path for _, path, _ in requests] == [
+        "/0/public/Time", "/0/public/AssetPairs", "/0/public/Assets",
+        "/0/public/Depth"]
+    assert requests[3][2] == {"pair": "XXBTZEUR", "count": "2"}
+
+
+def test_private_queries_are_signed_posts():
+    async def queries(kapi):
+        return await kapi.balance()
+
+    balance, requests = run(queries)
+
+    assert not isinstance(balance, list), balance
+    assert len(balance) == 2
+    method, path, data = requests[0]
+    assert (method, path) == ("POST", "/0/private/Balance")
+    assert "nonce" in data
+
+
+def test_orders_are_normalized_and_checked_locally():
+    orders = [
+        {"ordertype": "limit", "buy_or_sell": "buy", "volume": 0.01,
+         "pair": "XBTEUR", "price": 30000.1},
+        {"ordertype": "limit", "buy_or_sell": "buy", "volume": 0.00001,
+         "pair": "XBT/EUR", "price": 30000.1},
+        {"ordertype": "limit", "buy_or_sell": "buy", "volume": 0.02,
+         "pair": "XXBTZEUR", "price": 30000.1},
+    ]
+
+    async def queries(kapi):
+        return await kapi.add_orders(orders), await kapi.check_orders(orders)
+
+    (outcomes, checked), requests = run(queries, local_checks="check")
+
+    assert list(outcomes["pair"]) == ["XXBTZEUR"] * 3
+    assert outcomes["error"][0] is None and outcomes["error"][2] is None
+    assert "below the minimum" in outcomes["error"][1]
+    assert [error is None for error in checked["error"]] == \
+        [True, False, True]
+
+    sent = [(method, path) for method, path, _ in requests]
+    assert sent == [
+        ("GET", "/0/public/AssetPairs"),
+        ("GET", "/0/public/Assets"),
+        ("POST", "/0/private/AddOrderBatch"),
+    ]
+    assert requests[2][2]["pair"] == "XXBTZEUR"
+
+
+def test_depth_many_queries_each_pair_once_whatever_its_name():
+    names = ["XBTEUR", "XXBTZEUR", "XBT/EUR"]
+
+    async def queries(kapi):
+        return await kapi.depth_many(names)
+
+    (books, errors), requests = run(queries)
+
+    assert not errors
+    assert list(books) == names
+    assert [data["pair"] for _, path, data in requests
+            if path == "/0/public/Depth"] == ["XXBTZEUR"]
+
+
+def test_depth_many_refuses_an_invalid_count():
+    async def queries(kapi):
+        with pytest.raises(Exception, match="Invalid count parameter"):
+            await kapi.depth_many(["XXBTZEUR"], count=501)
+
+    _, requests = run(queries)
+
+    assert requests == []
@@ -0,0 +1,64 @@
+import pandas as pd
+
+from kraken_api import Kapi
+from kraken_api.endpoints import (
+    TICKER_BATCH_LENGTH, order_records, query_trades, ticker_batches,
+    trades_history)
+
+
+def test_order_records_keep_the_integer_columns_of_a_frame():
+    orders = pd.DataFrame([
+        {"pair": "XXBTZEUR", "volume": 1.5, "userref": 7},
+        {"pair": "XXBTZEUR", "volume": 2.5},
+    ])
+
+    records = order_records(orders)
+
+    assert records == [
+        {"pair": "XXBTZEUR", "volume": 1.5, "userref": 7},
+        {"pair": "XXBTZEUR", "volume": 2.5},
+    ]
+    assert type(records[0]["userref"]) is int
+
+
+def test_the_trade_queries_are_charged_as_ledger_queries():
+    assert query_trades("TXID").type_query == "ledger/trade"
+    assert trades_history().type_query == "ledger/trade"
+
+
+class TickerTransport:
+
+    def __init__(self):
+        self.queries = []
+
+    def query_public(self, method, data=None):
+        pairs = data["pair"].split(",")
+        self.queries.append(pairs)
+        return {"error": [], "result": {
+            pair: {"a": ["2", "1", "1"], "b": ["1", "1", "1"],
+                   "c": [str(index), "1"], "v": ["1", "1"],
+                   "p": ["1", "1"], "t": [1, 1], "l": ["1", "1"],
+                   "h": ["2", "2"], "o": "1"}
+            for index, pair in enumerate(pairs)}}
+
+    def close(self):
+        pass
+
+
+def test_the_ticker_of_many_pairs_is_split_and_merged():
+    pairs = [f"PAIR{index:03d}ZEUR" for index in range(150)]
+    assert len(",".join(pairs)) > TICKER_BATCH_LENGTH
+
+    batches = ticker_batches(pairs)
+    assert len(batches) == 2
+    assert all(len(batch) <= TICKER_BATCH_LENGTH for batch in batches)
+    assert ",".join(batches) == ",".join(pairs)
+
+    transport = TickerTransport()
+    kapi = Kapi(transport=transport, normalize_pairs=False)
+    data = kapi.ticker(pairs)
+
+    assert len(transport.queries) == 2
+    assert list(data.index) == pairs
+    assert data.loc["PAIR120ZEUR", "last_trade_closed_price"] == \
+        120 - len(transport.queries[0])
@@ -0,0 +1,45 @@
+import threading
+import time
+
+from kraken_api import Kapi, OrderBook
+from kraken_api import endpoints
+from kraken_api.flight import call_key
+
+
+class SlowTransport:
+
+    def __init__(self):
+        self.requests = 0
+
+    def query_public(self, method, data=None):
+        self.requests += 1
+        time.sleep(0.2)
+        return {"error": [], "result": {"XXBTZEUR": {
+            "asks": [["2", "1", 1]], "bids": [["1", "1", 1]]}}}
+
+    def close(self):
+        pass
+
+
+def test_the_key_depends_on_the_parser():
+    assert call_key(endpoints.depth("XXBTZEUR", 10)) == \
+        call_key(endpoints.depth("XXBTZEUR", 10))
+    assert call_key(endpoints.depth("XXBTZEUR", 10)) != \
+        call_key(endpoints.order_book("XXBTZEUR", 10))
+
+
+def test_order_book_is_not_served_a_depth_in_flight():
+    transport = SlowTransport()
+    kapi = Kapi(transport=transport, normalize_pairs=False, coalesce=True)
+
+    results = {}
+    thread = threading.Thread(
+        target=lambda: results.update(depth=kapi.depth("XXBTZEUR")))
+    thread.start()
+    time.sleep(0.05)
+    book = kapi.order_book("XXBTZEUR")
+    thread.join()
+
+    assert isinstance(book, OrderBook)
+    assert not isinstance(results["depth"], OrderBook)
+    assert transport.requests == 2
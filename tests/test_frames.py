@@ -0,0 +1,76 @@
+from kraken_api import Kapi
+from kraken_api.frames import FrameBuilder, convert_array, convert_list
+
+
+def build(kinds, rows):
+    builder = FrameBuilder([f"c{i}" for i in range(len(kinds))], kinds=kinds)
+    builder.extend(rows)
+    return builder.build()
+
+
+def test_times_are_nanoseconds_whatever_the_values():
+    data = build(["time", "time"], [[1650000000, 1650000000.25], [0, 1.5]])
+
+    assert [str(dtype) for dtype in data.dtypes] == \
+        ["datetime64[ns]", "datetime64[ns]"]
+
+
+def test_integers_are_never_truncated():
+    assert str(build(["int"], [["1"], ["2"]]).dtypes.iloc[0]) == "int64"
+    assert str(build(["int"], [["1"], [None]]).dtypes.iloc[0]) == "Int64"
+
+    data = build(["int"], [["1"], ["1.5"]])
+    assert data["c0"].tolist() == [1., 1.5]
+
+    assert convert_list(["1", "1.5", "2.0"], "int") == [1, 1.5, 2]
+    assert convert_array(["1", "1.5"], "int").tolist() == [1., 1.5]
+
+
+ORDER = {
+    "refid": None, "userref": 7, "status": "open",
+    "opentm": 1650000000.25, "starttm": 0, "expiretm": 0,
+    "descr": {"pair": "XBTEUR", "type": "buy", "ordertype": "limit",
+              "price": "30000.0", "price2": "0", "leverage": "none",
+              "order": "buy 0.01 XBTEUR @ limit 30000.0", "close": ""},
+    "vol": "0.01", "vol_exec": "0.0", "cost": "0.0", "fee": "0.0",
+    "price": "0.0", "stopprice": "0.0", "limitprice": "0.0",
+    "misc": "", "oflags": "fciq",
+}
+
+
+class OrdersTransport:
+
+    def query_private(self, method, data=None):
+        return {"error": [], "result": {"open": {"OTXID": ORDER}}}
+
+    def close(self):
+        pass
+
+
+def open_orders(output):
+    kapi = Kapi(key="key", secret="c2VjcmV0", transport=OrdersTransport())
+    with kapi.output(output):
+        return kapi.open_orders()
+
+
+def test_the_outputs_have_the_same_rows():
+    data = open_orders("pandas")
+    assert list(data.columns).count("price") == 2
+    assert str(data["opentm"].dtype) == "datetime64[ns]"
+
+    array = open_orders("numpy")
+    # the repeated price of the orders is renamed in the array and records
+    assert "price_1" in array.dtype.names
+    assert array["price"][0] == 30000. and array["price_1"][0] == 0.
+    assert array["opentm"][0] == data["opentm"][0].to_datetime64()
+    assert array["userref"][0] == 7
+
+    records = open_orders("records")
+    assert len(records) == 1
+    assert records[0].price == 30000. and records[0].price_1 == 0.
+    # the records keep the times in unix seconds
+    assert records[0].opentm == 1650000000.25
+    assert records[0].order_id == "OTXID"
+
+    raw = open_orders("raw")
+    assert raw == {"result": {"open": {"OTXID": ORDER}}}
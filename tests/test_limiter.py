@@ -0,0 +1,46 @@
+import pytest
+
+from kraken_api import Kapi, collect
+from kraken_api.limiter import RateLimiter
+
+from fakes import PagedTransport
+
+
+def test_a_reserve_must_leave_room_for_a_ledger_query():
+    RateLimiter("starter", {"backfill": 0.8})
+    with pytest.raises(Exception, match="Invalid reserve for backfill"):
+        RateLimiter("starter", {"backfill": 0.9})
+    RateLimiter("pro", {"backfill": 0.85})
+
+
+def test_the_priority_block_applies_to_the_prefetched_pages():
+    kapi = Kapi(key="key", secret="c2VjcmV0", transport=PagedTransport(count=6))
+    priorities = []
+    update_counters = kapi._update_counters
+
+    def spy(type_query, pair=None, count=1, priority=None):
+        priorities.append(priority)
+        update_counters(type_query, pair, count, priority)
+
+    kapi._update_counters = spy
+    with kapi.priority("account"):
+        pages = list(kapi.iter_trades_history(end=1700000000))
+
+    assert len(collect(pages)) == 6
+    assert priorities == ["account"] * 3
+
+
+def test_a_waiting_query_holds_back_the_less_urgent_ones():
+    limiter = RateLimiter("starter")
+    now = 1650000000.
+
+    with limiter.waiting("account"):
+        # the counter is empty but an account query waits for the budget
+        assert limiter.try_acquire("other", now=now, priority="backfill") > 0
+        assert limiter.try_acquire("other", now=now, priority="market") > 0
+        # the more urgent classes and the queries without priority go on
+        assert limiter.try_acquire("other", now=now, priority="trading") == 0
+        assert limiter.try_acquire("other", now=now) == 0
+
+    assert limiter.try_acquire("other", now=now, priority="backfill") == 0
+    assert limiter.api_counter == 3
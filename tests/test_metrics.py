@@ -0,0 +1,63 @@
+from kraken_api import Kapi, Metrics
+from kraken_api.metrics import Histogram
+
+
+class Transport:
+
+    def query_public(self, method, data=None):
+        if method == "Ticker":
+            return {"error": ["EQuery:Unknown asset pair"]}
+        return {"error": [], "result": {"XXBTZEUR": {
+            "asks": [["2", "1", 1], ["3", "1", 1]], "bids": [["1", "1", 1]]}}}
+
+    def response_size(self):
+        return 100
+
+    def close(self):
+        pass
+
+
+def test_the_histogram_buckets_are_cumulative():
+    histogram = Histogram([0.1, 1.])
+    for seconds in [0.05, 0.1, 0.5, 2.]:
+        histogram.observe(seconds)
+
+    assert histogram.cumulative() == [(0.1, 2), (1., 3), (float("inf"), 4)]
+    assert histogram.count == 4 and histogram.sum == 2.65
+
+
+def test_the_calls_are_measured_and_exported():
+    metrics = Metrics()
+    events = []
+    metrics.add_hook(events.append)
+    kapi = Kapi(transport=Transport(), normalize_pairs=False, metrics=metrics)
+
+    kapi.depth("XXBTZEUR")
+    kapi.depth("XXBTZEUR")
+    kapi.ticker("XXBTZEUR")
+
+    snapshot = metrics.snapshot()
+    assert snapshot["Depth"]["calls"] == 2
+    assert snapshot["Depth"]["wait_count"] == 2
+    assert snapshot["Depth"]["parse_count"] == 2
+    assert snapshot["Depth"]["bytes"] == 200
+    assert snapshot["Depth"]["rows"] == 4
+    assert snapshot["Ticker"]["errors"] == {"EQuery:Unknown asset pair": 1}
+
+    # wait, network and parse for each depth, no parse for the error
+    assert [(event["method"], event["stage"]) for event in events] == \
+        [("Depth", "wait"), ("Depth", "network"), ("Depth", "parse")] * 2 + \
+        [("Ticker", "wait"), ("Ticker", "network")]
+
+    lines = metrics.to_prometheus().splitlines()
+    assert "# TYPE kraken_api_network_seconds histogram" in lines
+    assert 'kraken_api_network_seconds_bucket{method="Depth",le="+Inf"} 2' \
+        in lines
+    assert 'kraken_api_network_seconds_count{method="Depth"} 2' in lines
+    assert 'kraken_api_calls_total{method="Ticker"} 1' in lines
+    assert 'kraken_api_response_bytes_total{method="Depth"} 200' in lines
+    assert 'kraken_api_rows_total{method="Depth"} 4' in lines
+    assert 'kraken_api_errors_total{method="Ticker",' \
+        'error="EQuery:Unknown asset pair"} 1' in lines
+    assert any(line.startswith('kraken_api_budget_headroom{budget="api"}')
+               for line in lines)
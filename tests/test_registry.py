@@ -0,0 +1,103 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from kraken_api import Kapi
+
+PAIRS = {
+    "XXBTZEUR": {"altname": "XBTEUR", "wsname": "XBT/EUR"},
+    "XETHZEUR": {"altname": "ETHEUR", "wsname": "ETH/EUR"},
+}
+
+
+class Transport:
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def query_public(self, method, data=None):
+        self.calls.append((method, dict(data or {})))
+        if method == "AssetPairs":
+            # slow enough for the depth queries to ask for the registry
+            # while it is loading
+            time.sleep(0.1)
+            if self.fail:
+                return {"error": ["EService:Unavailable"]}
+            return {"error": [], "result": PAIRS}
+        if method == "Assets":
+            return {"error": [], "result": {}}
+
+        pair = data["pair"]
+        return {"error": [], "result": {pair: {
+            "asks": [["2", "1", 1]], "bids": [["1", "1", 1]]}}}
+
+    def close(self):
+        pass
+
+
+def methods(transport, name):
+    return [data for method, data in transport.calls if method == name]
+
+
+def test_the_registry_is_loaded_once_by_concurrent_queries():
+    transport = Transport()
+    kapi = Kapi(transport=transport)
+
+    names = ["XBTEUR", "ETHEUR", "XBT/EUR", "ETH/EUR", "XXBTZEUR", "XETHZEUR"]
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        books = list(executor.map(kapi.depth, names))
+
+    assert all(len(book) == 1 for book in books)
+    assert {data["pair"] for data in methods(transport, "Depth")} == \
+        {"XXBTZEUR", "XETHZEUR"}
+    assert len(methods(transport, "AssetPairs")) == 1
+    assert len(methods(transport, "Assets")) == 1
+
+
+def test_the_names_are_kept_when_the_registry_cannot_load():
+    transport = Transport(fail=True)
+    kapi = Kapi(transport=transport)
+
+    book = kapi.depth("XBTEUR")
+    kapi.depth("XBTEUR")
+
+    assert len(book) == 1
+    assert [data["pair"] for data in methods(transport, "Depth")] == \
+        ["XBTEUR", "XBTEUR"]
+    # the failed load is not tried again at each query
+    assert len(methods(transport, "AssetPairs")) == 1
+
+
+def test_a_failed_refresh_is_not_tried_again_at_each_query():
+    transport = Transport()
+    kapi = Kapi(transport=transport, account_type="pro")
+    kapi.depth("XBTEUR")
+
+    # the data expires while kraken fails
+    kapi.pairs._loaded_at -= kapi.pairs.ttl + 1
+    transport.fail = True
+    kapi.depth("XBTEUR")
+    time.sleep(0.3)
+    for _ in range(10):
+        kapi.depth("XBTEUR")
+    time.sleep(0.3)
+
+    # the first load and the failed background refresh
+    assert len(methods(transport, "AssetPairs")) == 2
+    # the stale data is still used
+    assert {data["pair"] for data in methods(transport, "Depth")} == \
+        {"XXBTZEUR"}
+
+
+def test_depth_many_queries_each_pair_once_whatever_its_name():
+    transport = Transport()
+    kapi = Kapi(transport=transport)
+
+    names = ["XBTEUR", "XXBTZEUR", "XBT/EUR"]
+    books, errors = kapi.depth_many(names)
+
+    assert not errors
+    assert list(books) == names
+    assert books["XBTEUR"] is books["XBT/EUR"]
+    assert [data["pair"] for data in methods(transport, "Depth")] == \
+        ["XXBTZEUR"]
@@ -0,0 +1,22 @@
+from unittest import mock
+
+from kraken_api import Kapi, RecordingTransport, ReplayTransport, collect
+
+from fakes import PagedTransport
+
+
+def test_the_pagers_are_replayed_at_another_time(tmp_path):
+    path = str(tmp_path / "session.jsonl.gz")
+
+    with mock.patch("time.time", return_value=1700000000.):
+        kapi = Kapi(key="key", secret="c2VjcmV0", transport=RecordingTransport(
+            PagedTransport(), path))
+        recorded = collect(kapi.iter_trades_history(prefetch=False))
+        kapi.close()
+
+    replay = ReplayTransport(path)
+    kapi = Kapi(key="key", secret="c2VjcmV0", transport=replay)
+    replayed = collect(kapi.iter_trades_history(prefetch=False))
+
+    assert len(recorded) == len(replayed) == 3
+    assert replay.remaining() == 0
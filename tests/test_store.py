@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from kraken_api import MarketStore  # noqa: E402
+from kraken_api.frames import FrameBuilder  # noqa: E402
+
+
+def trades(output="pandas"):
+    builder = FrameBuilder(
+        ["time", "price", "volume"], kinds=["time", "float", "float"],
+        output=output)
+    builder.extend([
+        [1650067200.5, "30000.1", "0.1"],   # 2022-04-16
+        [1650000000.25, "29999.9", "0.2"],  # 2022-04-15
+        [1650067300, "30000.2", "0.3"],
+    ])
+    return builder.build()
+
+
+def test_the_frames_are_read_back_as_written(tmp_path):
+    store = MarketStore(str(tmp_path))
+    paths = store.write(trades(), "trades", "XXBTZEUR")
+
+    assert len(paths) == 2
+    assert store.partitions("trades", "XXBTZEUR") == \
+        ["2022-04-15", "2022-04-16"]
+
+    data = store.read("trades", "XXBTZEUR")
+    assert data["price"].tolist() == [29999.9, 30000.1, 30000.2]
+    assert str(data["time"].dtype) == "datetime64[ns]"
+
+    data = store.read("trades", "XXBTZEUR", start="2022-04-16")
+    assert data["price"].tolist() == [30000.1, 30000.2]
+
+
+def test_the_numpy_and_records_outputs_are_stored(tmp_path):
+    store = MarketStore(str(tmp_path))
+    store.write(trades(), "trades", "pandas")
+    store.write(trades("numpy"), "trades", "numpy")
+    store.write(trades("records"), "trades", "records")
+
+    expected = store.read("trades", "pandas")
+    assert store.read("trades", "numpy").equals(expected)
+    assert store.read("trades", "records").equals(expected)
+
+
+def test_a_write_killed_in_the_middle_is_ignored(tmp_path):
+    store = MarketStore(str(tmp_path))
+    store.write(trades(), "trades", "XXBTZEUR")
+
+    # the temporary file left by a write killed before its rename
+    directory = tmp_path / "trades" / "XXBTZEUR" / "2022-04-15"
+    (directory / "part-0-killed.tmp").write_bytes(b"ARROW1\x00\x00")
+
+    assert len(store.read("trades", "XXBTZEUR")) == 3
+    assert sorted(name.endswith(".tmp")
+                  for name in os.listdir(directory)) == [False, True]
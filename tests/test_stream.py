@@ -0,0 +1,132 @@
+import asyncio
+import json
+
+import pytest
+
+websockets = pytest.importorskip("websockets")
+
+from kraken_api import MarketStream  # noqa: E402
+
+SNAPSHOTS = [
+    {"as": [["30001.0", "1.0", "1650000000.1"],
+            ["30002.0", "2.0", "1650000000.2"]],
+     "bs": [["29999.0", "1.0", "1650000000.3"],
+            ["29998.0", "1.0", "1650000000.4"]]},
+    {"as": [["31000.0", "1.0", "1650000100.1"]],
+     "bs": [["30990.0", "1.0", "1650000100.2"]]},
+]
+
+DIFFS = [
+    # a level removed and a level added, in two payloads
+    [{"a": [["30001.0", "0.00000000", "1650000001.0"]]},
+     {"b": [["29999.5", "1.0", "1650000001.1"]]}],
+    [{"a": [["31000.0", "3.0", "1650000101.0"]]}],
+]
+
+
+def book_message(*payloads, pair="XBT/EUR"):
+    return json.dumps([42, *payloads, "book-10", pair])
+
+
+def serve(handler, stream_main):
+    async def main():
+        async with websockets.serve(handler, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            return await stream_main(f"ws://127.0.0.1:{port}")
+
+    return asyncio.run(main())
+
+
+def test_the_stream_resubscribes_and_rebuilds_the_book_after_a_reconnection():
+    subscriptions = []
+
+    async def handler(websocket):
+        connection = len(subscriptions)
+        subscriptions.append(json.loads(await websocket.recv()))
+        await websocket.send(json.dumps({"event": "heartbeat"}))
+        await websocket.send(json.dumps({
+            "event": "subscriptionStatus", "status": "subscribed",
+            "pair": "XBT/EUR", "channelName": "book-10"}))
+        await websocket.send(book_message(SNAPSHOTS[connection]))
+        await websocket.send(book_message(*DIFFS[connection]))
+
+        if connection == 0:
+            # the server drops the first connection
+            await websocket.close()
+        else:
+            await websocket.wait_closed()
+
+    async def main(uri):
+        stream = MarketStream(uri=uri, reconnect_delay=0.01)
+        updates = []
+
+        async def on_book(channel, pair, book):
+            asks, bids = book.asks, book.bids
+            updates.append((
+                channel, pair, asks[0].tolist(), asks[1].tolist(),
+                bids[0].tolist()))
+            if len(updates) == 4:
+                await stream.close()
+
+        stream.subscribe("book", "XBT/EUR", on_book)
+        await asyncio.wait_for(stream.run(), timeout=5)
+        return stream, updates
+
+    stream, updates = serve(handler, main)
+
+    assert stream.reconnections == 1
+    assert subscriptions == [{
+        "event": "subscribe",
+        "pair": ["XBT/EUR"],
+        "subscription": {"name": "book", "depth": 10},
+    }] * 2
+
+    assert updates == [
+        # snapshot and diff of the first connection
+        ("book", "XBT/EUR", [30001., 30002.], [1., 2.], [29999., 29998.]),
+        ("book", "XBT/EUR", [30002.], [2.], [29999.5, 29999., 29998.]),
+        # the snapshot of the second one replaces the whole book
+        ("book", "XBT/EUR", [31000.], [1.], [30990.]),
+        ("book", "XBT/EUR", [31000.], [3.], [30990.]),
+    ]
+    assert stream.book("XBT/EUR").time == 1650000101.
+
+
+def test_a_failing_callback_does_not_stop_the_other_subscriptions(caplog):
+    async def handler(websocket):
+        await websocket.recv()
+        for message in [
+                book_message(SNAPSHOTS[0]),
+                # a malformed update
+                book_message({"as": [["not a price", "1.0"]]},
+                             pair="ETH/EUR"),
+                book_message(SNAPSHOTS[1], pair="ETH/EUR"),
+                book_message(*DIFFS[0]),
+                book_message(*DIFFS[1], pair="ETH/EUR")]:
+            await websocket.send(message)
+        await websocket.wait_closed()
+
+    async def main(uri):
+        stream = MarketStream(uri=uri, reconnect_delay=0.01)
+        updates = []
+
+        def failing(channel, pair, book):
+            raise ValueError("a bug in the callback")
+
+        async def on_book(channel, pair, book):
+            updates.append((pair, book.best_ask))
+            if len(updates) == 2:
+                await stream.close()
+
+        stream.subscribe("book", "XBT/EUR", failing)
+        stream.subscribe("book", "ETH/EUR", on_book)
+        await asyncio.wait_for(stream.run(), timeout=5)
+        return stream, updates
+
+    with caplog.at_level("ERROR", logger="kraken_api.stream"):
+        stream, updates = serve(handler, main)
+
+    assert updates == [("ETH/EUR", 31000.), ("ETH/EUR", 31000.)]
+    assert stream.reconnections == 0
+    # the two updates of XBT/EUR and the malformed one
+    assert len(caplog.records) == 3
@@ -0,0 +1,69 @@
+from kraken_api import Kapi, MarketSync
+
+
+class CannedTransport:
+    """
+    answers each public method with its payloads in turn, and keeps the
+    cursors asked
+    """
+
+    def __init__(self, payloads):
+        self.payloads = payloads
+        self.since = []
+
+    def query_public(self, method, data=None):
+        self.since.append(data.get("since"))
+        return {"error": [], "result": self.payloads.pop(0)}
+
+    def close(self):
+        pass
+
+
+def trade(time, price="30000.0", volume="0.01"):
+    return [price, volume, time, "b", "l", ""]
+
+
+def test_trades_keep_the_same_fills_returned_again_and_new():
+    transport = CannedTransport([
+        {"XXBTZEUR": [trade(1650000000.1), trade(1650000001.5)],
+         "last": "1650000001500000000"},
+        # the last fill is returned again with a new identical one, at the
+        # same time, and a later fill
+        {"XXBTZEUR": [trade(1650000001.5), trade(1650000001.5),
+                      trade(1650000002.25)],
+         "last": "1650000002250000000"},
+    ])
+    kapi = Kapi(transport=transport, normalize_pairs=False)
+    sync = MarketSync(kapi, "trades", "XXBTZEUR")
+
+    first = sync.poll()
+    assert sync.cursor == "1650000001500000000"
+    new = sync.poll()
+
+    assert transport.since == [None, "1650000001500000000"]
+    assert sync.cursor == "1650000002250000000"
+    assert len(first) == 2 and len(new) == 2
+    assert [time.timestamp() for time in sync.frame["time"]] == \
+        [1650000000.1, 1650000001.5, 1650000001.5, 1650000002.25]
+
+
+def test_ohlc_replaces_the_candle_still_forming():
+    def candle(time, close):
+        return [time, "1.0", "3.0", "0.5", close, "2.0", "10.0", 5]
+
+    transport = CannedTransport([
+        {"XXBTZEUR": [candle(1650000000, "2.0"), candle(1650000060, "2.5")],
+         "last": 1650000000},
+        {"XXBTZEUR": [candle(1650000060, "2.8"), candle(1650000120, "2.9")],
+         "last": 1650000060},
+    ])
+    kapi = Kapi(transport=transport, normalize_pairs=False)
+    sync = MarketSync(kapi, "ohlc", "XXBTZEUR")
+
+    sync.poll()
+    sync.poll()
+
+    assert transport.since == [None, 1650000000]
+    assert sync.cursor == 1650000060
+    assert sync.frame["close"].tolist() == [2.0, 2.8, 2.9]
+    assert len(sync) == 3
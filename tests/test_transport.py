@@ -0,0 +1,21 @@
+import multiprocessing
+
+from kraken_api.transport import FileNonce
+
+
+def take_nonces(path, count=1000):
+    nonce = FileNonce(path)
+    return [nonce.next() for _ in range(count)]
+
+
+def test_the_nonces_of_several_processes_are_unique(tmp_path):
+    path = str(tmp_path / "nonce.lock")
+
+    with multiprocessing.Pool(2) as pool:
+        results = pool.map(take_nonces, [path, path])
+
+    nonces = [nonce for result in results for nonce in result]
+    assert len(set(nonces)) == 2000
+    # each process sees its nonces increase
+    assert all(result == sorted(result) for result in results)
+    assert FileNonce(path).next() > max(nonces)